@@ -2,6 +2,14 @@
 ASGI config for foodgram project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Read-heavy recipe endpoints are routed to the async views from
+``foodgram.asgi_urls``; everything else is served as in the WSGI setup.
+
+Django 3.2 iterates streaming responses inside the event loop, so
+streamed downloads go through the WSGI handler instead: each request
+gets its own thread, and every chunk is sent as soon as it is rendered.
+
+Run it with ``gunicorn -k uvicorn.workers.UvicornWorker foodgram.asgi``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +17,35 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
 from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ROOT_URLCONF', 'foodgram.asgi_urls')
+
+STREAMING_PATHS = ('/api/recipes/download_shopping_cart/',)
+
+django_application = get_asgi_application()
+wsgi_application = get_wsgi_application()
+
+
+def closing_wsgi_application(environ, start_response):
+    # WsgiToAsgi does not close the response, and Django sends
+    # request_finished (returning DB connections) only from close().
+    response = wsgi_application(environ, start_response)
+    try:
+        yield from response
+    finally:
+        response.close()
+
+
+streaming_application = WsgiToAsgi(closing_wsgi_application)
+
 
-application = get_asgi_application()
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in STREAMING_PATHS:
+        async with ThreadSensitiveContext():
+            return await streaming_application(scope, receive, send)
+    return await django_application(scope, receive, send)
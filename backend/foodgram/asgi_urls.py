@@ -0,0 +1,13 @@
+from django.urls import path
+from recipes import async_views
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/tags/', async_views.tag_list),
+    path('api/tags/<int:pk>/', async_views.tag_detail),
+    path('api/ingredients/', async_views.ingredient_list),
+    path('api/ingredients/<int:pk>/', async_views.ingredient_detail),
+    path('api/recipes/', async_views.recipe_list),
+    path('api/recipes/<int:pk>/', async_views.recipe_detail),
+] + wsgi_urlpatterns
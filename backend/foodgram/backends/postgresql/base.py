@@ -0,0 +1,6 @@
+from django.db.backends.postgresql import base
+from foodgram.db import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    pass
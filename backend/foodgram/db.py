@@ -0,0 +1,146 @@
+"""Маршрутизация чтения на реплики и проверка постоянных соединений.
+
+Чтение в безопасных запросах уходит на случайную реплику из
+DATABASE_REPLICAS, запись и всё остальное — на основную базу. После
+записи пользователь на REPLICA_STICKY_SECONDS закрепляется за основной
+базой, чтобы сразу видеть свои изменения. Пользователь определяется по
+заголовку Authorization или cookie сессии, метка хранится в общем кэше.
+"""
+import asyncio
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@contextmanager
+def pinned_to_primary():
+    token = pinned.set(True)
+    try:
+        yield
+    finally:
+        pinned.reset(token)
+
+
+class HealthCheckMixin:
+    """Ленивая проверка постоянного соединения, как в Django 4.1.
+
+    Переиспользуемое соединение проверяется один раз за запрос, при
+    первом курсоре. Запросы, которые не ходят в базу (ответы 304,
+    выгрузки из кэша), проверку не оплачивают.
+    """
+
+    health_check_done = False
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or self.health_check_done
+                or self.in_atomic_block
+                or not settings.DB_HEALTH_CHECKS):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+
+class PrimaryReplicaRouter:
+    # Справочники малы и закэшированы; читая их с основной базы, кэш
+    # не заполнится устаревшими данными с отстающей реплики.
+    primary_models = {'recipes.tag', 'recipes.ingredient'}
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or pinned.get()
+                or model._meta.label_lower in self.primary_models
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def sticky_key(request):
+    identity = (request.META.get('HTTP_AUTHORIZATION')
+                or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not identity:
+        return None
+    digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+    return f'db_pinned:{digest}'
+
+
+class PrimaryPinningMiddleware:
+    """Закрепляет за основной базой пишущие запросы и их авторов.
+
+    Работает и в синхронной, и в асинхронной цепочке: под ASGI не
+    переводит запросы в общий поток sync_to_async. Признак закрепления
+    живёт в contextvar и виден только своему запросу.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django распознаёт асинхронный экземпляр, как и у
+            # MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def pin(self, request):
+        key = sticky_key(request)
+        writing = request.method not in SAFE_METHODS
+        token = pinned.set(
+            writing or (key is not None and cache.get(key) is not None)
+        )
+        return token, key if writing else None
+
+    def release(self, token, key):
+        pinned.reset(token)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token, key = self.pin(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.release(token, key)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        token, key = self.pin(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release(token, key)
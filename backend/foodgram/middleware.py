@@ -0,0 +1,145 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger('foodgram.performance')
+
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class RequestTimer:
+    """Счётчики одного запроса; заодно обёртка для execute_wrapper."""
+
+    __slots__ = ('queries', 'db', 'view_started', 'view', 'render_started',
+                 'render')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.view_started = self.view = None
+        self.render_started = self.render = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def rendered(self, response):
+        self.render = time.perf_counter() - self.render_started
+
+
+class PerformanceMiddleware:
+    """Замеры запроса в заголовке Server-Timing и в логе.
+
+    Считает число и время SQL-запросов, время вьюхи без SQL (проверки
+    прав и сериализация DRF), время рендеринга ответа и его размер.
+    Выборочно снимает профиль cProfile: с заданной вероятностью или по
+    заголовку с секретным токеном. Выключенное middleware Django
+    убирает из цепочки при старте, так что накладных расходов нет.
+
+    SQL считается в потоке запроса; в режиме ASGI запросы вьюх,
+    вынесенных в пул потоков, в счётчик не попадают.
+    """
+
+    def __init__(self, get_response):
+        self.options = settings.PERFORMANCE
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        request.performance_timer = timer
+        profiler = cProfile.Profile() if self.profiled(request) else None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        finished = time.perf_counter()
+        if timer.view is None and timer.view_started is not None:
+            timer.view = finished - timer.view_started
+        metrics = self.metrics(timer, finished - started, response)
+        if self.options['SERVER_TIMING']:
+            response['Server-Timing'] = self.server_timing(metrics)
+        if profiler:
+            metrics['profile'] = self.dump(profiler, request)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **metrics,
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.performance_timer.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timer = request.performance_timer
+        now = time.perf_counter()
+        if timer.view_started is not None:
+            timer.view = now - timer.view_started
+        timer.render_started = now
+        response.add_post_render_callback(timer.rendered)
+        return response
+
+    def profiled(self, request):
+        token = self.options['PROFILE_TOKEN']
+        header = request.headers.get(self.options['PROFILE_HEADER'])
+        if token and header and constant_time_compare(header, token):
+            return True
+        rate = self.options['PROFILE_RATE']
+        return rate > 0 and random.random() < rate
+
+    def metrics(self, timer, total, response):
+        return {
+            'queries': timer.queries,
+            'db_ms': milliseconds(timer.db),
+            'app_ms': (None if timer.view is None
+                       else milliseconds(max(timer.view - timer.db, 0))),
+            'render_ms': milliseconds(timer.render),
+            'total_ms': milliseconds(total),
+            'size': (None if response.streaming
+                     else len(response.content)),
+        }
+
+    def server_timing(self, metrics):
+        entries = [f'db;dur={metrics["db_ms"]};'
+                   f'desc="{metrics["queries"]} queries"']
+        for name in ('app', 'render', 'total'):
+            if metrics[f'{name}_ms'] is not None:
+                entries.append(f'{name};dur={metrics[f"{name}_ms"]}')
+        return ', '.join(entries)
+
+    def dump(self, profiler, request):
+        directory = self.options['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^\w]+', '-', request.path).strip('-') or 'root'
+        path = os.path.join(
+            directory,
+            f'{time.time_ns()}-{request.method.lower()}-{slug[:80]}.prof',
+        )
+        profiler.dump_stats(path)
+        return path
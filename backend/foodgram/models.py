@@ -0,0 +1,22 @@
+class CounterFieldsMixin:
+    """Полное сохранение модели не перезаписывает счётчики.
+
+    Счётчики меняются атомарным UPDATE ... SET f = f + 1, а экземпляр в
+    памяти (форма админки, профиль пользователя) держит значение на
+    момент чтения. Поэтому save() без update_fields у существующей
+    записи пишет все поля, кроме counter_fields и отложенных.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')
+                and not self._state.adding):
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+                and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
@@ -27,12 +27,13 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
-    'urlshortner',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.PerformanceMiddleware',
+    'foodgram.db.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,7 +43,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+ROOT_URLCONF = os.getenv('ROOT_URLCONF', 'foodgram.urls')
 
 TEMPLATES = [
     {
@@ -63,16 +64,56 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+DB_ENGINE = os.getenv('DB_ENGINE', 'postgresql')
+
+if DB_ENGINE == 'sqlite3':
+    # Локальная проверка маршрутизации без PostgreSQL:
+    # DB_ENGINE=sqlite3 DB_REPLICAS=replica.sqlite3
+    DATABASES = {
+        'default': {
+            'ENGINE': 'foodgram.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'foodgram.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        }
+    }
+
+# Реплики для чтения: DB_REPLICAS=host1:5432,host2:5432,
+# для SQLite — пути к файлам реплик.
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1
+):
+    if DB_ENGINE == 'sqlite3':
+        replica = {'NAME': address}
+    else:
+        host, _, port = address.partition(':')
+        replica = {
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+        }
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        **replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['foodgram.db.PrimaryReplicaRouter']
+
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', 'True') == 'True'
+
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -141,3 +182,80 @@ DJOSER = {
         'user_list': ('rest_framework.permissions.AllowAny',)
     }
 }
+
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+INGREDIENT_SEARCH_WEIGHTED = os.getenv(
+    'INGREDIENT_SEARCH_WEIGHTED', 'True'
+) == 'True'
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60)
+)
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 60 * 10))
+
+MEMBERSHIP_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('MEMBERSHIP_CACHE_MAX_ENTRIES', 2000)),
+    'TTL': int(os.getenv('MEMBERSHIP_CACHE_TTL', 60 * 5)),
+    'STATS_EVERY': int(os.getenv('MEMBERSHIP_CACHE_STATS_EVERY', 1000)),
+}
+
+ASGI_SYNC_WORKERS = int(os.getenv('ASGI_SYNC_WORKERS', 8))
+
+RELATIONS_BULK_LIMIT = int(os.getenv('RELATIONS_BULK_LIMIT', 500))
+
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 60 * 60))
+
+IMAGE_UPLOAD = {
+    'MAX_BYTES': int(os.getenv('IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)),
+    'MAX_PIXELS': int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)),
+    'MAX_DIMENSION': int(os.getenv('IMAGE_UPLOAD_MAX_DIMENSION', 2048)),
+    'BODY_SLACK': 256 * 1024,
+    'SPOOL_BYTES': 512 * 1024,
+    'WORKERS': int(os.getenv('IMAGE_UPLOAD_WORKERS', 2)),
+    'QUEUE_SIZE': int(os.getenv('IMAGE_UPLOAD_QUEUE_SIZE', 32)),
+}
+
+PERFORMANCE = {
+    'ENABLED': os.getenv('PERFORMANCE_TIMING', 'False') == 'True',
+    'SERVER_TIMING': os.getenv('PERFORMANCE_SERVER_TIMING', 'True') == 'True',
+    'PROFILE_RATE': float(os.getenv('PERFORMANCE_PROFILE_RATE', 0)),
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILE_TOKEN': os.getenv('PERFORMANCE_PROFILE_TOKEN', ''),
+    'PROFILE_DIR': os.getenv(
+        'PERFORMANCE_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles')
+    ),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', 60))
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_path(instance, filename):
+    """Путь картинки по хешу содержимого: images/ab/abcdef….png."""
+    return f'images/{filename[:2]}/{filename}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла — хеш его содержимого.
+
+    Файл с тем же именем уже содержит те же байты, поэтому повторная
+    запись пропускается, а имя не меняется. Запись идёт через временный
+    файл и атомарную замену, так что параллельные загрузки одной
+    картинки не мешают друг другу.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return name
+
+
+image_storage = ContentAddressedStorage()
@@ -13,8 +13,9 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags', )
     search_fields = ('name__icontains', 'author__username__icontains')
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def count_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -0,0 +1,63 @@
+"""Асинхронные обёртки над представлениями для ASGI-режима.
+
+Django 3.2 не умеет асинхронно работать с ORM и отдаёт потоковые ответы,
+итерируя их прямо в цикле событий, а синхронные представления по
+умолчанию выполняет в одном общем потоке. Поэтому представления здесь
+выполняются в ограниченном пуле потоков, ответ полностью готовится в
+потоке пула, а медленным клиентам он отправляется уже асинхронно,
+не занимая ни процесс, ни поток. Потоковые выгрузки сюда не попадают:
+их отдаёт WSGI-обработчик из foodgram.asgi.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASGI_SYNC_WORKERS,
+    thread_name_prefix='sync-view',
+)
+
+
+def call_view(view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(view):
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            executor,
+            functools.partial(
+                context.run, call_view, view, request, *args, **kwargs
+            ),
+        )
+    return async_view
+
+
+tag_list = offload(TagViewSet.as_view({'get': 'list'}))
+tag_detail = offload(TagViewSet.as_view({'get': 'retrieve'}))
+ingredient_list = offload(IngredientViewSet.as_view({'get': 'list'}))
+ingredient_detail = offload(IngredientViewSet.as_view({'get': 'retrieve'}))
+recipe_list = offload(RecipeViewSet.as_view({
+    'get': 'list',
+    'post': 'create',
+}))
+recipe_detail = offload(RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}))
@@ -0,0 +1,64 @@
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Tag
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def new_version():
+    return uuid4().hex
+
+
+def get_version(key):
+    """Возвращает текущую версию ключа, создавая её при отсутствии."""
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, new_version(), None)
+
+
+def shopping_cart_version_key(user_id):
+    return f'shopping_cart_version:{user_id}'
+
+
+def new_catalog_version():
+    return {'etag': new_version(), 'modified': int(time.time())}
+
+
+def get_catalog_version():
+    """Версия справочников тегов и ингредиентов и время её изменения."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = new_catalog_version()
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version(**kwargs):
+    # Версия меняется после коммита, иначе параллельный запрос прочитает
+    # ещё старые строки и закэширует их под новой версией.
+    transaction.on_commit(
+        lambda: cache.set(CATALOG_VERSION_KEY, new_catalog_version(), None)
+    )
+
+
+def get_tag_ids_by_slug():
+    """Словарь slug -> id тегов из кэша текущей версии справочников."""
+    key = f'tag_ids_by_slug:{get_catalog_version()["etag"]}'
+    tags = cache.get(key)
+    if tags is None:
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tags, settings.CATALOG_CACHE_TIMEOUT)
+    return tags
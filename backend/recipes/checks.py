@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кэшей рецептов, членства и лент должны быть общими.
+
+    С кэшем в памяти процесса сброс версии в одном воркере gunicorn не
+    виден остальным, и они отдают устаревшие данные до истечения TTL.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кэш по умолчанию {backend} не общий для процессов.',
+        hint='Укажите CACHE_BACKEND и CACHE_LOCATION общего кэша, '
+             'например memcached из infra/docker-compose.yml.',
+        id='recipes.W001',
+    )]
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+def recount_counters():
+    """Пересчитывает денормализованные счётчики двумя UPDATE."""
+    recipes = Recipe.objects.update(
+        favorites_count=count_of(Favorite, 'recipe'),
+        in_carts_count=count_of(ShoppingCart, 'recipe'),
+    )
+    users = User.objects.update(recipes_count=count_of(Recipe, 'author'))
+    return recipes, users
+
+
+def change_recipe_counter(instance, field, delta):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        **{field: F(field) + delta}
+    )
+
+
+def change_recipes_counter(recipe_ids, field, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: F(field) + delta}
+    )
+
+
+def favorite_saved(instance, created, **kwargs):
+    if created:
+        change_recipe_counter(instance, 'favorites_count', 1)
+
+
+def favorite_deleted(instance, **kwargs):
+    change_recipe_counter(instance, 'favorites_count', -1)
+
+
+def cart_saved(instance, created, **kwargs):
+    if created:
+        change_recipe_counter(instance, 'in_carts_count', 1)
+
+
+def cart_deleted(instance, **kwargs):
+    change_recipe_counter(instance, 'in_carts_count', -1)
+
+
+def favorites_added(recipe_ids, **kwargs):
+    change_recipes_counter(recipe_ids, 'favorites_count', 1)
+
+
+def favorites_removed(recipe_ids, **kwargs):
+    change_recipes_counter(recipe_ids, 'favorites_count', -1)
+
+
+def carts_added(recipe_ids, **kwargs):
+    change_recipes_counter(recipe_ids, 'in_carts_count', 1)
+
+
+def carts_removed(recipe_ids, **kwargs):
+    change_recipes_counter(recipe_ids, 'in_carts_count', -1)
+
+
+def recipe_saved(instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+def recipe_deleted(instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') - 1
+    )
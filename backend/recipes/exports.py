@@ -0,0 +1,94 @@
+import csv
+import json
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .caching import get_version, shopping_cart_version_key
+from .models import IngredientAmount, ShoppingTotal
+
+HEADER = ('Ингредиент', 'Количество')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_list_rows(user):
+    """Готовые суммы ингредиентов из таблицы итогов корзины."""
+    return ShoppingTotal.objects.filter(user=user).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total_amount',
+    ).order_by(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).iterator()
+
+
+def shopping_list_rows_from_cart(user):
+    """Суммы ингредиентов из корзины одним сгруппированным запросом."""
+    return IngredientAmount.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).iterator()
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for name, unit, amount in rows:
+        yield writer.writerow((f'{name} ({unit})', amount))
+
+
+def render_txt(rows):
+    for name, unit, amount in rows:
+        yield f'{name} ({unit}) — {amount}\n'
+
+
+def render_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, amount in rows:
+        yield separator + json.dumps({
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+FORMATS = {
+    'csv': ('text/csv', render_csv),
+    'txt': ('text/plain', render_txt),
+    'json': ('application/json', render_json),
+}
+DEFAULT_FORMAT = 'csv'
+
+
+def shopping_list_cache_key(user, file_format):
+    version = get_version(shopping_cart_version_key(user.id))
+    return f'shopping_list:{user.id}:{file_format}:{version}'
+
+
+def cached_content(key):
+    return cache.get(key)
+
+
+def stream_and_cache(key, chunks, timeout):
+    """Отдаёт части файла по мере готовности и кладёт итог в кэш."""
+    rendered = []
+    for chunk in chunks:
+        data = chunk.encode()
+        rendered.append(data)
+        yield data
+    cache.set(key, b''.join(rendered), timeout)
@@ -0,0 +1,110 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Лента листается курсором по id, поэтому глубина страницы и число
+подписок не превращаются в OFFSET. Первая страница (id рецептов и
+ссылка next) кэшируется на FEED_CACHE_TIMEOUT секунд под версией ленты
+пользователя. Версия сбрасывается, когда кто-то из его авторов
+публикует или удаляет рецепт и когда меняются его подписки. Тела
+рецептов и пользовательские признаки рендерятся как в обычном списке.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from users.models import Subscribe
+
+from .caching import get_version
+from .models import Recipe
+from .paginations import IdCursorPagination
+
+FANOUT_BATCH = 1000
+
+
+def feed_version_key(user_id):
+    return f'feed_version:{user_id}'
+
+
+def feed_queryset(user):
+    return Recipe.objects.defer('search_vector').filter(
+        author__in=Subscribe.objects.filter(follower=user).values(
+            'following'
+        )
+    )
+
+
+class FeedPagination(IdCursorPagination):
+    """Курсорная пагинация ленты с кэшем первой страницы."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.from_cache = False
+        params = request.query_params
+        if (self.cursor_query_param in params
+                or self.count_query_param in params):
+            return super().paginate_queryset(queryset, request, view)
+        key = 'feed:{}:{}:{}'.format(
+            request.user.id,
+            self.get_page_size(request),
+            get_version(feed_version_key(request.user.id)),
+        )
+        cached = cache.get(key)
+        if cached is None:
+            page = super().paginate_queryset(queryset, request, view)
+            # Страница с реплики могла не увидеть только что
+            # опубликованный рецепт, поэтому живёт не дольше окна
+            # закрепления за основной базой.
+            cache.set(key, {
+                'ids': [recipe.id for recipe in page],
+                'next': self.get_next_link(),
+            }, settings.FEED_CACHE_TIMEOUT
+                if queryset.db == DEFAULT_DB_ALIAS
+                else min(settings.FEED_CACHE_TIMEOUT,
+                         settings.REPLICA_STICKY_SECONDS))
+            return page
+        self.from_cache = True
+        self.count = None
+        self.cached_next = cached['next']
+        # Сами рецепты читаются заново: удалённые пропадают, а тела
+        # берутся из кэша тел рецептов с актуальными версиями.
+        return list(queryset.filter(id__in=cached['ids']).order_by('-id'))
+
+    def get_next_link(self):
+        if self.from_cache:
+            return self.cached_next
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.from_cache:
+            return None
+        return super().get_previous_link()
+
+
+def reset_feeds(user_ids):
+    keys = [feed_version_key(user_id) for user_id in user_ids]
+    for start in range(0, len(keys), FANOUT_BATCH):
+        cache.delete_many(keys[start:start + FANOUT_BATCH])
+
+
+def reset_followers(author_id):
+    reset_feeds(list(Subscribe.objects.filter(
+        following_id=author_id
+    ).values_list('follower_id', flat=True)))
+
+
+def reset_followers_on_commit(author_id):
+    transaction.on_commit(lambda: reset_followers(author_id))
+
+
+def recipe_published(instance, created, **kwargs):
+    if created:
+        reset_followers_on_commit(instance.author_id)
+
+
+def recipe_deleted(instance, **kwargs):
+    reset_followers_on_commit(instance.author_id)
+
+
+def subscription_changed(instance, **kwargs):
+    subscriptions_changed(instance.follower_id)
+
+
+def subscriptions_changed(user_id, **kwargs):
+    transaction.on_commit(lambda: reset_feeds([user_id]))
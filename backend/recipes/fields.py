@@ -0,0 +1,62 @@
+import base64
+import mimetypes
+
+from django.db.models import QuerySet
+from drf_extra_fields.fields import Base64ImageField
+
+from .images import receive_image
+
+
+class RecipeImageField(Base64ImageField):
+    """Картинка рецепта.
+
+    По умолчанию отдаётся ссылкой на медиафайл, который кэшируется
+    браузером и nginx. Содержимое файла в base64 отдаётся только при
+    явном запросе `?image_format=base64`.
+
+    Принимается строка base64 или обычный файл из multipart-формы;
+    декодирование идёт частями, размер проверяется до чтения данных.
+    Ссылка на текущую картинку изменяемого объекта оставляет её как есть.
+    """
+
+    BASE64_FORMAT = 'base64'
+
+    def inline_requested(self):
+        request = self.context.get('request')
+        if request is None:
+            return False
+        return (request.query_params.get('image_format')
+                == self.BASE64_FORMAT)
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        current = self.current_file()
+        if current and data in self.current_references(current):
+            return current
+        return receive_image(data)
+
+    def current_references(self, current):
+        """Имя и ссылки текущей картинки, без чтения самого файла."""
+        references = {current.name, current.url}
+        request = self.context.get('request')
+        if request is not None:
+            references.add(request.build_absolute_uri(current.url))
+        return references
+
+    def current_file(self):
+        instance = getattr(self.parent, 'instance', None)
+        if instance is None or isinstance(instance, (list, QuerySet)):
+            return None
+        return getattr(instance, self.source, None)
+
+    def to_representation(self, file):
+        if not file:
+            return None
+        if self.inline_requested():
+            mime_type = (mimetypes.guess_type(file.name)[0]
+                         or 'application/octet-stream')
+            with file.open() as image:
+                data = base64.b64encode(image.read()).decode()
+            return f'data:{mime_type};base64,{data}'
+        return super().to_representation(file)
@@ -1,30 +1,77 @@
 import django_filters
-from django_filters import rest_framework as filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 
+from .caching import get_tag_ids_by_slug
+from .membership import FAVORITE, SHOPPING_CART, user_recipe_ids
 from .models import Recipe
 
 
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
+
+
 class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_is_in_shopping_cart',
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = django_filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
+    )
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'search')
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_membership(self, queryset, kind, value):
         if self.request.user.is_anonymous:
             return queryset
+        ids = user_recipe_ids(self.request, kind)
         if value == 0:
-            return queryset.exclude(favorites__user=self.request.user)
-        return queryset.filter(favorites__user=self.request.user)
+            return queryset.exclude(id__in=ids)
+        return queryset.filter(id__in=ids)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_membership(queryset, FAVORITE, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if self.request.user.is_anonymous:
+        return self.filter_membership(queryset, SHOPPING_CART, value)
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
             return queryset
-        if value == 0:
-            return queryset.exclude(shopping_cart__user=self.request.user)
-        return queryset.filter(shopping_cart__user=self.request.user)
+        ids = get_tag_ids_by_slug()
+        # Неизвестный или только что удалённый слаг просто не совпадает
+        # ни с одним рецептом.
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[ids[slug] for slug in value if slug in ids],
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию.
+
+        На PostgreSQL ищет по поисковому вектору с GIN-индексом и
+        сортирует по релевантности; на других базах — icontains, сначала
+        совпадения в названии. В курсорной пагинации порядок по id.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config='russian',
+                                search_type='websearch')
+            return queryset.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F('search_vector'), query),
+            ).order_by('-search_rank', '-id')
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+        ).annotate(search_rank=Case(
+            When(name__icontains=value, then=Value(1)),
+            default=Value(0),
+        )).order_by('-search_rank', '-id')
@@ -0,0 +1,213 @@
+"""Приём картинок с ограниченным расходом памяти.
+
+Base64 декодируется частями во временный файл, размер проверяется ещё
+до декодирования (по заголовку Content-Length и длине строки), а формат
+и размеры — по заголовку файла без полной распаковки. Пересжатие и
+уменьшение больших картинок выполняется после ответа в ограниченном
+пуле потоков.
+"""
+import binascii
+import hashlib
+import logging
+import os
+import threading
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import close_old_connections, transaction
+from django.db.models.fields.files import FieldFile
+from django.dispatch import Signal
+from foodgram.db import pinned_to_primary
+from PIL import Image
+from rest_framework import exceptions, status
+
+from . import media
+
+logger = logging.getLogger(__name__)
+
+BASE64_MARKER = ';base64,'
+DECODE_CHUNK = 64 * 1024 * 4
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# Картинка заменена в фоне через update(), post_save не отправляется.
+image_replaced = Signal()
+
+
+class ImageTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Картинка слишком большая'
+    default_code = 'image_too_large'
+
+
+def max_bytes():
+    return settings.IMAGE_UPLOAD['MAX_BYTES']
+
+
+def check_request_size(request):
+    """Отклоняет тело запроса по Content-Length, не читая его."""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return
+    # base64 раздувает данные на треть, плюс остальные поля JSON.
+    if length > max_bytes() * 4 // 3 + settings.IMAGE_UPLOAD['BODY_SLACK']:
+        raise ImageTooLarge
+
+
+def decode_base64(data):
+    """Декодирует data URI частями во временный файл.
+
+    Возвращает файл и sha256 его содержимого, посчитанный по ходу.
+    """
+    start = data.find(BASE64_MARKER)
+    start = 0 if start < 0 else start + len(BASE64_MARKER)
+    if (len(data) - start) * 3 // 4 > max_bytes():
+        raise ImageTooLarge
+    file = SpooledTemporaryFile(
+        max_size=settings.IMAGE_UPLOAD['SPOOL_BYTES']
+    )
+    digest = hashlib.sha256()
+    try:
+        for offset in range(start, len(data), DECODE_CHUNK):
+            chunk = b64decode(data[offset:offset + DECODE_CHUNK],
+                              validate=True)
+            digest.update(chunk)
+            file.write(chunk)
+    except (binascii.Error, ValueError):
+        file.close()
+        raise exceptions.ValidationError('Некорректные данные base64')
+    file.seek(0)
+    return file, digest.hexdigest()
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(DECODE_CHUNK), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def inspect_image(file):
+    """Формат и размеры по заголовку файла без декодирования пикселей."""
+    try:
+        with Image.open(file) as image:
+            image_format, size = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise exceptions.ValidationError('Загрузите корректную картинку')
+    finally:
+        file.seek(0)
+    if image_format not in FORMATS:
+        raise exceptions.ValidationError('Неподдерживаемый формат картинки')
+    if size[0] * size[1] > settings.IMAGE_UPLOAD['MAX_PIXELS']:
+        raise ImageTooLarge
+    return image_format, size
+
+
+def receive_image(data):
+    """Принимает строку base64 или загруженный файл, возвращает File.
+
+    Имя файла — sha256 содержимого, одинаковые картинки хранятся один раз.
+    """
+    if isinstance(data, UploadedFile):
+        if data.size > max_bytes():
+            raise ImageTooLarge
+        file = data.file
+        digest = file_digest(file)
+    elif isinstance(data, str):
+        file, digest = decode_base64(data)
+    else:
+        raise exceptions.ValidationError('Ожидается файл или строка base64')
+    image_format, _ = inspect_image(file)
+    return UploadedFile(
+        file=file,
+        name=f'{digest}.{FORMATS[image_format]}',
+        content_type=Image.MIME.get(image_format),
+    )
+
+
+def is_current_image(instance, field_name, file):
+    """Файл совпадает с уже сохранённым в поле (по пути из хеша)."""
+    current = getattr(instance, field_name)
+    if not current:
+        return False
+    if isinstance(file, FieldFile):
+        return file.name == current.name
+    field = instance._meta.get_field(field_name)
+    return field.generate_filename(instance, file.name) == current.name
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_UPLOAD['WORKERS'],
+    thread_name_prefix='image',
+)
+slots = threading.BoundedSemaphore(settings.IMAGE_UPLOAD['QUEUE_SIZE'])
+
+
+def normalize_image(model, pk, field_name):
+    """Уменьшает и пересжимает сохранённую картинку, если это нужно."""
+    field = model._meta.get_field(field_name)
+    name = model.objects.filter(pk=pk).values_list(
+        field_name, flat=True
+    ).first()
+    if not name:
+        return
+    limit = settings.IMAGE_UPLOAD['MAX_DIMENSION']
+    with field.storage.open(name) as file, Image.open(file) as image:
+        if max(image.size) <= limit:
+            return
+        image.thumbnail((limit, limit))
+        buffer = BytesIO()
+        image.save(buffer, image.format)
+    content = buffer.getvalue()
+    new_name = field.generate_filename(None, (
+        f'{hashlib.sha256(content).hexdigest()}'
+        f'{os.path.splitext(name)[1]}'
+    ))
+    changes = {field_name: new_name}
+    if getattr(field, 'width_field', None):
+        changes[field.width_field] = image.width
+    if getattr(field, 'height_field', None):
+        changes[field.height_field] = image.height
+    with transaction.atomic():
+        media.acquire(new_name)
+        field.storage.save(new_name, ContentFile(content))
+        if model.objects.filter(
+            pk=pk, **{field_name: name}
+        ).update(**changes):
+            media.release(name)
+            image_replaced.send(sender=model, pk=pk)
+        else:
+            media.release(new_name)
+
+
+def run_normalize(model, pk, field_name):
+    try:
+        with pinned_to_primary():
+            normalize_image(model, pk, field_name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s %s',
+                         model.__name__, pk)
+    finally:
+        slots.release()
+        close_old_connections()
+
+
+def schedule_normalize(instance, field_name):
+    """Ставит обработку картинки в очередь после фиксации транзакции."""
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        if not slots.acquire(blocking=False):
+            logger.warning('Очередь обработки картинок заполнена, '
+                           '%s %s сохранён без обработки',
+                           model.__name__, pk)
+            return
+        executor.submit(run_normalize, model, pk, field_name)
+
+    transaction.on_commit(submit)
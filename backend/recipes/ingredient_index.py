@@ -0,0 +1,101 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db.models import Count
+
+from .caching import get_catalog_version
+from .models import Ingredient, IngredientAmount
+
+EXACT, PREFIX, INFIX = range(3)
+MAX_CHAR = chr(0x10FFFF)
+
+
+class IngredientIndex:
+    """Неизменяемый индекс каталога ингредиентов в памяти процесса.
+
+    Ключи хранятся в отсортированном списке в casefold-виде, поиск по
+    префиксу идёт через bisect, при нехватке результатов просматриваются
+    вхождения подстроки. Результаты ранжируются: точное совпадение,
+    затем префикс, затем вхождение; внутри группы — по частоте
+    использования ингредиента в рецептах.
+    """
+
+    def __init__(self, rows, weights=None):
+        weights = weights or {}
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[0]))
+        self.keys = [name.casefold() for _, name, _ in rows]
+        self.ids = array('q', (pk for pk, _, _ in rows))
+        self.names = tuple(name for _, name, _ in rows)
+        self.units = tuple(unit for _, _, unit in rows)
+        self.weights = array('q', (weights.get(pk, 0) for pk, _, _ in rows))
+        self.version = None
+
+    @classmethod
+    def build(cls, weighted=True):
+        rows = Ingredient.objects.order_by().values_list(
+            'id', 'name', 'measurement_unit'
+        )
+        weights = None
+        if weighted:
+            weights = dict(
+                IngredientAmount.objects.order_by().values_list(
+                    'ingredient'
+                ).annotate(uses=Count('id'))
+            )
+        return cls(list(rows), weights)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, key):
+        return (bisect_left(self.keys, key),
+                bisect_right(self.keys, key + MAX_CHAR))
+
+    def search(self, query, limit=None):
+        key = query.strip().casefold()
+        if not key:
+            return []
+        start, end = self.prefix_range(key)
+        matches = [
+            (EXACT if self.keys[position] == key else PREFIX, position)
+            for position in range(start, end)
+        ]
+        if limit is None or len(matches) < limit:
+            matches.extend(
+                (INFIX, position)
+                for position, name in enumerate(self.keys)
+                if key in name and not start <= position < end
+            )
+        matches.sort(key=lambda match: (
+            match[0], -self.weights[match[1]], match[1]
+        ))
+        return [self.item(position) for _, position in matches[:limit]]
+
+    def item(self, position):
+        return {
+            'id': self.ids[position],
+            'name': self.names[position],
+            'measurement_unit': self.units[position],
+        }
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """Индекс текущей версии каталога, перестраиваемый после её смены."""
+    global _index
+    version = get_catalog_version()['etag']
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = IngredientIndex.build(
+                    weighted=settings.INGREDIENT_SEARCH_WEIGHTED
+                )
+                _index.version = version
+            index = _index
+    return index
@@ -0,0 +1,116 @@
+import base64
+import io
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from PIL import Image
+from recipes.counters import recount_counters
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from recipes.shopping_totals import rebuild
+from users.models import Subscribe
+
+User = get_user_model()
+
+SCALES = {
+    'small': {
+        'users': 20, 'recipes': 100, 'ingredients': 100,
+        'ingredients_per_recipe': 5, 'favorites': 10, 'carts': 5,
+        'follows': 5,
+    },
+    'medium': {
+        'users': 200, 'recipes': 2000, 'ingredients': 1000,
+        'ingredients_per_recipe': 10, 'favorites': 30, 'carts': 10,
+        'follows': 20,
+    },
+    'large': {
+        'users': 1000, 'recipes': 20000, 'ingredients': 2000,
+        'ingredients_per_recipe': 15, 'favorites': 100, 'carts': 20,
+        'follows': 50,
+    },
+}
+TAGS = 10
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 2000
+
+
+def tiny_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def ids(model):
+    return list(model.objects.order_by('id').values_list('id', flat=True))
+
+
+def seed(scale, rng=None):
+    """Наполняет пустую базу данными заданного масштаба.
+
+    Сигналы на bulk_create не срабатывают, поэтому счётчики и итоги
+    списков покупок пересчитываются в конце, а кэш очищается.
+    """
+    rng = rng or random.Random(0)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        (User(username=f'user{number}', email=f'user{number}@example.com',
+              password=password)
+         for number in range(scale['users'])),
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = ids(User)
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {number}', slug=f'tag{number}')
+        for number in range(TAGS)
+    )
+    tag_ids = ids(Tag)
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+         for number in range(scale['ingredients'])),
+        batch_size=BATCH_SIZE,
+    )
+    ingredient_ids = ids(Ingredient)
+    Recipe.objects.bulk_create(
+        (Recipe(name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/benchmark.png', image_width=1,
+                image_height=1, cooking_time=10,
+                author_id=rng.choice(user_ids))
+         for number in range(scale['recipes'])),
+        batch_size=BATCH_SIZE,
+    )
+    recipe_ids = ids(Recipe)
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        (RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in rng.sample(tag_ids, 2)),
+        batch_size=BATCH_SIZE,
+    )
+    per_recipe = scale['ingredients_per_recipe']
+    IngredientAmount.objects.bulk_create(
+        (IngredientAmount(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                          amount=rng.randint(1, 500))
+         for recipe_id in recipe_ids
+         for ingredient_id in rng.sample(ingredient_ids, per_recipe)),
+        batch_size=BATCH_SIZE,
+    )
+    for model, key in ((Favorite, 'favorites'), (ShoppingCart, 'carts')):
+        model.objects.bulk_create(
+            (model(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids
+             for recipe_id in rng.sample(recipe_ids, scale[key])),
+            batch_size=BATCH_SIZE,
+        )
+    Subscribe.objects.bulk_create(
+        (Subscribe(follower_id=user_id, following_id=following_id)
+         for user_id in user_ids
+         for following_id in rng.sample(user_ids, scale['follows'] + 1)
+         if following_id != user_id),
+        batch_size=BATCH_SIZE,
+    )
+    recount_counters()
+    rebuild()
+    cache.clear()
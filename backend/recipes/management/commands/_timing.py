@@ -0,0 +1,29 @@
+import statistics
+import time
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    last = len(ordered) - 1
+    position = min(last, int(round(percent / 100 * last)))
+    return ordered[position]
+
+
+def measure(func, repeat):
+    """Запускает func repeat раз и возвращает время вызовов в мс."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summary(samples):
+    return {
+        'p50': statistics.median(samples) if samples else 0.0,
+        'p95': percentile(samples, 95),
+        'max': max(samples, default=0.0),
+    }
@@ -0,0 +1,309 @@
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+from base64 import b64encode
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ._seed import SCALES, seed, tiny_image
+from ._timing import summary
+
+User = get_user_model()
+
+# Число запросов к базе на один вызов эндпоинта в установившемся
+# режиме (кэши прогреты). Не должно зависеть от объёма данных.
+# Бюджеты корзины включают блокировку рецептов FOR SHARE, которую
+# выполняет только PostgreSQL.
+QUERY_BUDGETS = {
+    'tags-list': 0,
+    'tags-detail': 0,
+    'ingredients-list': 0,
+    'ingredients-search': 0,
+    'recipes-list': 4,
+    'recipes-list-favorited': 4,
+    'recipes-list-tags': 4,
+    'recipes-search': 4,
+    'recipes-feed': 3,
+    'recipes-feed-next': 2,
+    'recipes-detail': 4,
+    'recipes-get-link': 1,
+    'recipes-create': 16,
+    'recipes-update': 10,
+    'recipes-update-text': 14,
+    'recipes-update-ingredients': 18,
+    'favorite-add': 5,
+    'favorite-remove': 4,
+    'shopping-cart-add': 7,
+    'shopping-cart-remove': 7,
+    'shopping-cart-bulk-add': 6,
+    'shopping-cart-bulk-remove': 7,
+    'shopping-cart-download': 1,
+    'users-list': 9,
+    'users-detail': 3,
+    'users-me': 2,
+    'subscriptions': 4,
+    'subscribe': 4,
+    'unsubscribe': 2,
+}
+
+
+class Endpoint:
+    """Один вызов API и, при необходимости, откат его эффекта.
+
+    Откат выполняется после каждого замера и в статистику не входит,
+    так что пишущие эндпоинты замеряются на неизменном состоянии.
+    """
+
+    def __init__(self, name, method, url, data=None, undo=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.undo = undo
+
+    def call(self, client):
+        return getattr(client, self.method)(self.url, self.data,
+                                            format='json')
+
+
+def endpoints(user):
+    recipe = Recipe.objects.exclude(favorites__user=user).exclude(
+        shopping_cart__user=user
+    ).order_by('id').first()
+    other = User.objects.exclude(following__follower=user).exclude(
+        id=user.id
+    ).order_by('id').first()
+    tag = Tag.objects.order_by('id').first()
+    *ingredient_ids, extra_ingredient_id = Ingredient.objects.order_by(
+        'id'
+    ).values_list('id', flat=True)[:11]
+    recipe_data = {
+        'name': 'Бенчмарк',
+        'text': 'Бенчмарк',
+        'cooking_time': 5,
+        'image': tiny_image(),
+        'tags': [tag.id],
+        'ingredients': [{'id': id, 'amount': 10} for id in ingredient_ids],
+    }
+    recipe_url = f'/api/recipes/{recipe.id}/'
+    feed_cursor = b64encode(f'p={recipe.id}'.encode()).decode()
+    batch = {'recipes': list(Recipe.objects.exclude(
+        shopping_cart__user=user
+    ).order_by('id').values_list('id', flat=True)[:20])}
+    own_recipe = user.recipes.order_by('id').first()
+    own_recipe_url = f'/api/recipes/{own_recipe.id}/'
+
+    def delete_created(client, response):
+        client.delete(f'/api/recipes/{response.data["id"]}/')
+
+    def call(method, url, data=None):
+        return lambda client, response: getattr(client, method)(
+            url, data, format='json'
+        )
+
+    return [
+        Endpoint('tags-list', 'get', '/api/tags/'),
+        Endpoint('tags-detail', 'get', f'/api/tags/{tag.id}/'),
+        Endpoint('ingredients-list', 'get', '/api/ingredients/'),
+        Endpoint('ingredients-search', 'get',
+                 '/api/ingredients/?name=Ингредиент 1'),
+        Endpoint('recipes-list', 'get', '/api/recipes/?limit=6'),
+        Endpoint('recipes-list-favorited', 'get',
+                 '/api/recipes/?limit=6&is_favorited=1'),
+        Endpoint('recipes-list-tags', 'get',
+                 f'/api/recipes/?limit=6&tags={tag.slug}'),
+        Endpoint('recipes-search', 'get',
+                 '/api/recipes/?limit=6&search=Рецепт'),
+        Endpoint('recipes-feed', 'get', '/api/recipes/feed/?limit=6'),
+        Endpoint('recipes-feed-next', 'get',
+                 f'/api/recipes/feed/?limit=6&cursor={feed_cursor}'),
+        Endpoint('recipes-detail', 'get', recipe_url),
+        Endpoint('recipes-get-link', 'get', f'{recipe_url}get-link/'),
+        Endpoint('recipes-create', 'post', '/api/recipes/', recipe_data,
+                 undo=delete_created),
+        Endpoint('recipes-update', 'put', own_recipe_url, recipe_data),
+        Endpoint('recipes-update-text', 'put', own_recipe_url,
+                 dict(recipe_data, text='Бенчмарк, правка'),
+                 undo=call('put', own_recipe_url, recipe_data)),
+        Endpoint('recipes-update-ingredients', 'put', own_recipe_url,
+                 dict(recipe_data, ingredients=[
+                     {'id': id, 'amount': 20} for id in ingredient_ids[1:]
+                 ] + [{'id': extra_ingredient_id, 'amount': 1}]),
+                 undo=call('put', own_recipe_url, recipe_data)),
+        Endpoint('favorite-add', 'post', f'{recipe_url}favorite/',
+                 undo=call('delete', f'{recipe_url}favorite/')),
+        Endpoint('favorite-remove', 'delete', f'{recipe_url}favorite/',
+                 undo=call('post', f'{recipe_url}favorite/')),
+        Endpoint('shopping-cart-add', 'post', f'{recipe_url}shopping_cart/',
+                 undo=call('delete', f'{recipe_url}shopping_cart/')),
+        Endpoint('shopping-cart-remove', 'delete',
+                 f'{recipe_url}shopping_cart/',
+                 undo=call('post', f'{recipe_url}shopping_cart/')),
+        Endpoint('shopping-cart-bulk-add', 'post',
+                 '/api/recipes/shopping_cart/', batch,
+                 undo=call('delete', '/api/recipes/shopping_cart/', batch)),
+        Endpoint('shopping-cart-bulk-remove', 'delete',
+                 '/api/recipes/shopping_cart/', batch,
+                 undo=call('post', '/api/recipes/shopping_cart/', batch)),
+        Endpoint('shopping-cart-download', 'get',
+                 '/api/recipes/download_shopping_cart/'),
+        Endpoint('users-list', 'get', '/api/users/?limit=6'),
+        Endpoint('users-detail', 'get', f'/api/users/{other.id}/'),
+        Endpoint('users-me', 'get', '/api/users/me/'),
+        Endpoint('subscriptions', 'get',
+                 '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+        Endpoint('subscribe', 'post', f'/api/users/{other.id}/subscribe/',
+                 undo=call('delete', f'/api/users/{other.id}/subscribe/')),
+        Endpoint('unsubscribe', 'delete',
+                 f'/api/users/{other.id}/subscribe/',
+                 undo=call('post', f'/api/users/{other.id}/subscribe/')),
+    ]
+
+
+def prepare(endpoint, client):
+    """Приводит состояние к тому, что ожидает удаляющий эндпоинт."""
+    if endpoint.method == 'delete' and endpoint.undo:
+        endpoint.undo(client, None)
+
+
+def run(endpoint, client, repeat):
+    prepare(endpoint, client)
+    # Первый вызов прогревает кэши и в замер не входит.
+    response = endpoint.call(client)
+    if endpoint.undo:
+        endpoint.undo(client, response)
+    samples, queries, statuses = [], 0, set()
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            # Запросы считаются по всем базам, включая реплики.
+            contexts = [stack.enter_context(CaptureQueriesContext(db))
+                        for db in connections.all()]
+            started = time.perf_counter()
+            response = endpoint.call(client)
+            samples.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, sum(map(len, contexts)))
+        statuses.add(response.status_code)
+        if endpoint.undo:
+            endpoint.undo(client, response)
+    tracemalloc.start()
+    try:
+        response = endpoint.call(client)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if endpoint.undo:
+        endpoint.undo(client, response)
+    if endpoint.method == 'delete' and endpoint.undo:
+        endpoint.call(client)
+    return {
+        'statuses': sorted(statuses),
+        'queries': queries,
+        'peak_memory_kb': peak // 1024,
+        **{f'{key}_ms': value for key, value in summary(samples).items()},
+    }
+
+
+class Command(BaseCommand):
+    help = ('Наполняет тестовую базу данными нескольких масштабов, '
+            'вызывает все эндпоинты API и замеряет число запросов, '
+            'p50/p95 и пиковую память. Завершается с ошибкой, если '
+            'эндпоинт превысил бюджет запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', nargs='+', default=['small'],
+                            choices=list(SCALES))
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', nargs='+', metavar='ENDPOINT',
+                            help='Замерить только указанные эндпоинты')
+        parser.add_argument('--report', help='Путь для JSON-отчёта')
+        parser.add_argument('--noinput', '--no-input',
+                            action='store_false', dest='interactive')
+
+    def handle(self, *args, scales, repeat, only, report, interactive,
+               **options):
+        setup_test_environment()
+        media_root = tempfile.mkdtemp()
+        old_name = connection.settings_dict['NAME']
+        results = {}
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=not interactive
+                )
+                for alias in settings.DATABASE_REPLICAS:
+                    connections[alias].creation.set_as_test_mirror(
+                        connection.settings_dict
+                    )
+                try:
+                    for scale in scales:
+                        call_command('flush', interactive=False,
+                                     verbosity=0)
+                        results[scale] = self.run_scale(scale, repeat, only)
+                finally:
+                    connection.creation.destroy_test_db(
+                        old_name, verbosity=0
+                    )
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            teardown_test_environment()
+        failures = self.find_regressions(results)
+        if report:
+            with open(report, 'w') as file:
+                json.dump({'budgets': QUERY_BUDGETS, 'results': results,
+                           'failures': failures},
+                          file, indent=2, ensure_ascii=False)
+        if failures:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Бюджеты запросов соблюдены'))
+
+    def run_scale(self, scale, repeat, only):
+        started = time.perf_counter()
+        seed(SCALES[scale])
+        self.stdout.write(f'\n{scale}: данные созданы за '
+                          f'{time.perf_counter() - started:.1f} с')
+        user = User.objects.order_by('id').first()
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        self.stdout.write(f'{"эндпоинт":<26}{"статус":>8}{"запросов":>10}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"пик, КБ":>10}')
+        results = {}
+        for endpoint in endpoints(user):
+            if only and endpoint.name not in only:
+                continue
+            result = run(endpoint, client, repeat)
+            results[endpoint.name] = result
+            self.stdout.write(
+                f'{endpoint.name:<26}'
+                f'{",".join(map(str, result["statuses"])):>8}'
+                f'{result["queries"]:>10}{result["p50_ms"]:>10.1f}'
+                f'{result["p95_ms"]:>10.1f}{result["peak_memory_kb"]:>10}'
+            )
+        return results
+
+    def find_regressions(self, results):
+        failures = []
+        for scale, endpoints_results in results.items():
+            for name, result in endpoints_results.items():
+                if any(code >= 400 for code in result['statuses']):
+                    failures.append(f'{scale} {name}: ответы '
+                                    f'{result["statuses"]}')
+                budget = QUERY_BUDGETS.get(name)
+                if budget is not None and result['queries'] > budget:
+                    failures.append(f'{scale} {name}: {result["queries"]} '
+                                    f'запросов при бюджете {budget}')
+        return failures
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from recipes.ingredient_index import IngredientIndex
+from recipes.models import Ingredient
+
+from ._timing import measure, summary
+
+DEFAULT_QUERIES = ('мол', 'Мол', 'сах', 'соль', 'масло', 'пер', 'ко', 'а')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку поиска ингредиентов через ORM '
+            'и через индекс в памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, queries, repeat, limit, **options):
+        index = IngredientIndex.build()
+        self.stdout.write(f'Ингредиентов в индексе: {len(index)}')
+        self.stdout.write(
+            f'{"запрос":<10}{"ORM p50":>10}{"ORM p95":>10}'
+            f'{"индекс p50":>12}{"индекс p95":>12}{"ORM":>6}{"индекс":>8}'
+        )
+        for query in queries:
+            orm_rows = []
+
+            def orm_search():
+                orm_rows[:] = Ingredient.objects.filter(
+                    name__startswith=query
+                ).values('id', 'name', 'measurement_unit')
+
+            index_rows = []
+
+            def index_search():
+                index_rows[:] = index.search(query, limit=limit)
+
+            orm = summary(measure(orm_search, repeat))
+            indexed = summary(measure(index_search, repeat))
+            self.stdout.write(
+                f'{query:<10}{orm["p50"]:>10.3f}{orm["p95"]:>10.3f}'
+                f'{indexed["p50"]:>12.3f}{indexed["p95"]:>12.3f}'
+                f'{len(orm_rows):>6}{len(index_rows):>8}'
+            )
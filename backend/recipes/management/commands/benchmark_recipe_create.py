@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Tag
+from recipes.serializers import RecipeSerializer
+from rest_framework.request import Request
+
+from ._seed import tiny_image
+from ._timing import measure, summary
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число запросов и время создания рецепта '
+            'с разным количеством ингредиентов. Все изменения '
+            'откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int,
+                            default=(1, 10, 50))
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, sizes, repeat, **options):
+        ingredient_ids = list(Ingredient.objects.values_list(
+            'id', flat=True
+        )[:max(sizes)])
+        tag_ids = list(Tag.objects.values_list('id', flat=True)[:3])
+        if len(ingredient_ids) < max(sizes) or not tag_ids:
+            raise CommandError(
+                f'Нужно не меньше {max(sizes)} ингредиентов и один тег'
+            )
+        author = User.objects.order_by('id').first()
+        if author is None:
+            raise CommandError('Нужен хотя бы один пользователь')
+        request = Request(RequestFactory().post('/api/recipes/'))
+        request.user = author
+        image = tiny_image()
+
+        self.stdout.write(f'{"ингредиентов":>13}{"запросов":>10}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}')
+        for size in sizes:
+            data = {
+                'name': 'Бенчмарк',
+                'text': 'Бенчмарк',
+                'cooking_time': 1,
+                'image': image,
+                'tags': tag_ids,
+                'ingredients': [{'id': id, 'amount': 1}
+                                for id in ingredient_ids[:size]],
+            }
+            queries = []
+
+            def create():
+                try:
+                    with transaction.atomic():
+                        with CaptureQueriesContext(connection) as context:
+                            serializer = RecipeSerializer(
+                                data=data, context={'request': request}
+                            )
+                            serializer.is_valid(raise_exception=True)
+                            serializer.save(author=author)
+                        queries.append(len(context))
+                        raise Rollback
+                except Rollback:
+                    pass
+
+            timing = summary(measure(create, repeat))
+            self.stdout.write(f'{size:>13}{queries[-1]:>10}'
+                              f'{timing["p50"]:>10.2f}{timing["p95"]:>10.2f}')
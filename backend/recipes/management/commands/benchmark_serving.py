@@ -0,0 +1,189 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ._timing import summary
+
+SERVERS = {
+    'wsgi': ['foodgram.wsgi'],
+    'asgi': ['-k', 'uvicorn.workers.UvicornWorker', 'foodgram.asgi'],
+}
+
+
+def process_tree_rss(pid):
+    """Суммарный RSS процесса и его потомков в КБ (Linux /proc)."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, ()))
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Сервер на порту {port} не запустился')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочное сравнение WSGI и ASGI: медленные клиенты '
+            'качают ответ, параллельно замеряется задержка быстрых '
+            'запросов и память сервера на один запрос в обработке.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=list(SERVERS),
+                            choices=list(SERVERS))
+        parser.add_argument('--path', default='/api/recipes/?limit=50')
+        parser.add_argument('--probe-path', default='/api/tags/')
+        parser.add_argument('--token', help='Токен для заголовка '
+                            'Authorization (нужен для списка покупок)')
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--read-size', type=int, default=4096)
+        parser.add_argument('--read-delay', type=float, default=0.05)
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--report', help='Путь для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        results = {}
+        for offset, mode in enumerate(options['modes']):
+            results[mode] = self.run_mode(
+                mode, options['port'] + offset, options
+            )
+        self.stdout.write(
+            f'{"режим":<6}{"готово":>8}{"ошибок":>8}{"время, с":>10}'
+            f'{"probe p50":>11}{"probe p95":>11}{"RSS пик, МБ":>13}'
+            f'{"КБ/запрос":>11}'
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<6}{result["completed"]:>8}{result["errors"]:>8}'
+                f'{result["elapsed"]:>10.2f}{result["probe"]["p50"]:>11.1f}'
+                f'{result["probe"]["p95"]:>11.1f}'
+                f'{result["peak_rss_kb"] / 1024:>13.1f}'
+                f'{result["rss_per_request_kb"]:>11.1f}'
+            )
+        if options['report']:
+            with open(options['report'], 'w') as report:
+                json.dump(results, report, indent=2)
+
+    def run_mode(self, mode, port, options):
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(options['workers']),
+            *SERVERS[mode],
+        ]
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(port)
+            time.sleep(1)
+            return self.load(server.pid, port, options)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def load(self, pid, port, options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        idle_rss = process_tree_rss(pid)
+        state = {'completed': 0, 'errors': 0, 'peak': idle_rss}
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def slow_client():
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', options['path'], headers=headers)
+                response = connection.getresponse()
+                while response.read(options['read_size']):
+                    time.sleep(options['read_delay'])
+                connection.close()
+                key = 'completed' if response.status == 200 else 'errors'
+            except OSError:
+                key = 'errors'
+            with lock:
+                state[key] += 1
+
+        def sample_memory():
+            while not done.is_set():
+                rss = process_tree_rss(pid)
+                with lock:
+                    state['peak'] = max(state['peak'], rss)
+                time.sleep(0.1)
+
+        probe_samples = []
+
+        def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    connection = http.client.HTTPConnection(
+                        '127.0.0.1', port, timeout=30
+                    )
+                    connection.request('GET', options['probe_path'])
+                    connection.getresponse().read()
+                    connection.close()
+                except OSError:
+                    continue
+                probe_samples.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.05)
+
+        helpers = [threading.Thread(target=sample_memory),
+                   threading.Thread(target=probe)]
+        clients = [threading.Thread(target=slow_client)
+                   for _ in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in helpers + clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in helpers:
+            thread.join()
+        return {
+            'completed': state['completed'],
+            'errors': state['errors'],
+            'elapsed': elapsed,
+            'probe': summary(probe_samples),
+            'idle_rss_kb': idle_rss,
+            'peak_rss_kb': state['peak'],
+            'rss_per_request_kb': (
+                (state['peak'] - idle_rss) / max(options['clients'], 1)
+            ),
+        }
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from recipes.exports import shopping_list_rows, shopping_list_rows_from_cart
+
+from ._timing import measure, summary
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку выгрузки списка покупок по корзине '
+            'и по таблице итогов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--users', type=int, default=5,
+                            help='Сколько пользователей с самыми большими '
+                                 'корзинами проверить')
+
+    def handle(self, *args, repeat, users, **options):
+        owners = User.objects.annotate(
+            cart_size=Count('shoppingcart')
+        ).filter(cart_size__gt=0).order_by('-cart_size')[:users]
+        if not owners:
+            raise CommandError('Нет пользователей с рецептами в корзине')
+        self.stdout.write(
+            f'{"пользователь":<20}{"рецептов":>9}{"строк":>7}'
+            f'{"корзина p50":>13}{"корзина p95":>13}'
+            f'{"итоги p50":>11}{"итоги p95":>11}'
+        )
+        for user in owners:
+            from_cart = list(shopping_list_rows_from_cart(user))
+            from_totals = list(shopping_list_rows(user))
+            if from_cart != from_totals:
+                raise CommandError(
+                    f'Итоги {user.username} расходятся с корзиной, '
+                    f'запустите check_shopping_totals --fix'
+                )
+            cart = summary(measure(
+                lambda: list(shopping_list_rows_from_cart(user)), repeat
+            ))
+            totals = summary(measure(
+                lambda: list(shopping_list_rows(user)), repeat
+            ))
+            self.stdout.write(
+                f'{user.username[:19]:<20}{user.cart_size:>9}'
+                f'{len(from_totals):>7}'
+                f'{cart["p50"]:>13.3f}{cart["p95"]:>13.3f}'
+                f'{totals["p50"]:>11.3f}{totals["p95"]:>11.3f}'
+            )
@@ -0,0 +1,65 @@
+import base64
+import io
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from recipes.images import receive_image
+
+from ._timing import measure, summary
+
+
+def make_image(side):
+    buffer = io.BytesIO()
+    Image.effect_noise((side, side), 64).convert('RGB').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def decode_whole(data):
+    """Прежний путь: вся строка декодируется в память целиком."""
+    content = base64.b64decode(data.split(',')[1])
+    return ContentFile(content, name='image.png')
+
+
+def decode_extra_fields(data):
+    return Base64ImageField().to_internal_value(data)
+
+
+def peak_memory(func, data):
+    tracemalloc.start()
+    try:
+        func(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковую память и время приёма картинки '
+            'в base64: целиком в памяти и потоковым декодированием.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int,
+                            default=(256, 1024, 1536))
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, sizes, repeat, **options):
+        paths = (
+            ('целиком', decode_whole),
+            ('drf-extra-fields', decode_extra_fields),
+            ('потоково', receive_image),
+        )
+        self.stdout.write(f'{"сторона":>8}{"base64, КБ":>12}{"путь":>18}'
+                          f'{"пик, КБ":>10}{"p50, мс":>10}')
+        for side in sizes:
+            data = make_image(side)
+            for name, func in paths:
+                peak = peak_memory(func, data)
+                samples = measure(lambda: func(data), repeat)
+                self.stdout.write(
+                    f'{side:>8}{len(data) // 1024:>12}{name:>18}'
+                    f'{peak // 1024:>10}{summary(samples)["p50"]:>10.2f}'
+                )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import ShoppingTotal
+from recipes.shopping_totals import expected_totals, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Сверяет таблицу итогов списков покупок с подсчётом '
+            'по корзинам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Пересобрать итоги расходящихся '
+                                 'пользователей')
+
+    def handle(self, *args, fix, **options):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in expected_totals().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in ShoppingTotal.objects
+            .values_list('user', 'ingredient', 'total_amount').iterator()
+        }
+        broken = sorted({
+            key[0] for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        })
+        if not broken:
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги сходятся, строк: {len(stored)}'
+            ))
+            return
+        if not fix:
+            raise CommandError(
+                f'Итоги расходятся у пользователей: '
+                f'{", ".join(map(str, broken))}'
+            )
+        rebuild(broken)
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги пересобраны для пользователей: {len(broken)}'
+        ))
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.caching import bump_catalog_version
+from recipes.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.csv'
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0].strip(), row[1].strip()
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+class CSVStream(io.RawIOBase):
+    """Файлоподобная обёртка, отдающая строки в CSV для COPY."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = b''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.count += 1
+            line = io.StringIO()
+            csv.writer(line).writerow(row)
+            self.buffer += line.getvalue().encode()
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+class Command(BaseCommand):
+    help = ('Загружает каталог ингредиентов из CSV или JSON. '
+            'Повторный запуск пропускает уже существующие записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, path, chunk_size, **options):
+        path = Path(path)
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        started = time.perf_counter()
+        rows = reader(path)
+        if connection.vendor == 'postgresql':
+            total, inserted = self.copy_upsert(rows)
+        else:
+            total, inserted = self.bulk_insert(rows, chunk_size)
+        if inserted:
+            bump_catalog_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {inserted}, пропущено: {total - inserted}, '
+            f'всего в файле: {total}, время: {elapsed:.2f} с'
+        ))
+
+    @transaction.atomic
+    def copy_upsert(self, rows):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        stream = CSVStream(rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_staging '
+                '(name varchar(128), measurement_unit varchar(64)) '
+                'ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                io.BufferedReader(stream),
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_staging '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            inserted = cursor.rowcount
+        return stream.count, inserted
+
+    @transaction.atomic
+    def bulk_insert(self, rows, chunk_size):
+        total = 0
+        before = Ingredient.objects.count()
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            total += len(chunk)
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in chunk),
+                ignore_conflicts=True,
+            )
+        return total, Ingredient.objects.count() - before
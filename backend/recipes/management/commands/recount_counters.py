@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, списков покупок '
+            'и рецептов пользователей')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            recipes, users = recount_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}, '
+            f'время: {time.perf_counter() - started:.2f} с'
+        ))
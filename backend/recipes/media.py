@@ -0,0 +1,112 @@
+"""Счётчики ссылок на картинки в хранилище по хешу содержимого.
+
+Одна и та же картинка хранится один раз, на неё могут ссылаться
+несколько рецептов и аватаров. Ссылка заводится до записи файла, а файл
+удаляется после фиксации транзакции и только если под блокировкой
+строки счётчик всё ещё нулевой, так что параллельная загрузка тех же
+байтов не останется без файла.
+"""
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from foodgram.storage import image_storage
+
+from .models import MediaFile
+
+
+def acquire(name):
+    if not name:
+        return
+    connection = connections[router.db_for_write(MediaFile)]
+    table = connection.ops.quote_name(MediaFile._meta.db_table)
+    # Один атомарный upsert: PostgreSQL и SQLite понимают ON CONFLICT.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, usage_count) VALUES (%s, 1) '
+            f'ON CONFLICT (name) DO UPDATE '
+            f'SET usage_count = {table}.usage_count + 1',
+            [name],
+        )
+
+
+def release(name):
+    if not name:
+        return
+    MediaFile.objects.filter(name=name).update(
+        usage_count=F('usage_count') - 1
+    )
+    transaction.on_commit(lambda: delete_unused(name))
+
+
+def delete_unused(name):
+    with transaction.atomic():
+        unused = MediaFile.objects.select_for_update().filter(
+            name=name, usage_count__lte=0,
+        ).first()
+        if unused is None:
+            return
+        unused.delete()
+        image_storage.delete(name)
+
+
+class ImageReferences:
+    """Ведёт счётчик ссылок для одного поля-картинки модели.
+
+    Имя файла из базы запоминается при создании объекта; при сохранении
+    новое имя получает ссылку до записи файла, а старое её теряет.
+    Поле, не загруженное из базы (defer), не трогается.
+    """
+
+    def __init__(self, model, field_name):
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+
+    def connect(self):
+        post_init.connect(self.remember, sender=self.model, weak=False)
+        pre_save.connect(self.before_save, sender=self.model, weak=False)
+        post_save.connect(self.after_save, sender=self.model, weak=False)
+        post_delete.connect(self.deleted, sender=self.model, weak=False)
+
+    def loaded(self, instance):
+        return self.field.attname in instance.__dict__
+
+    def remember(self, instance, **kwargs):
+        if not self.loaded(instance):
+            return
+        file = getattr(instance, self.field.attname)
+        if file._committed:
+            instance._stored_image = file.name
+
+    def before_save(self, instance, update_fields=None, **kwargs):
+        if not self.loaded(instance) or (
+            update_fields is not None
+            and self.field.name not in update_fields
+        ):
+            return
+        file = getattr(instance, self.field.attname)
+        name = None
+        if file:
+            name = (file.name if file._committed
+                    else self.field.generate_filename(instance, file.name))
+        stored = None
+        if not instance._state.adding:
+            stored = getattr(instance, '_stored_image', None) or None
+        if name != stored:
+            acquire(name)
+            instance._released_image = stored
+
+    def after_save(self, instance, **kwargs):
+        if hasattr(instance, '_released_image'):
+            release(instance._released_image)
+            del instance._released_image
+        if self.loaded(instance):
+            instance._stored_image = getattr(
+                instance, self.field.attname
+            ).name or None
+
+    def deleted(self, instance, **kwargs):
+        if self.loaded(instance):
+            release(getattr(instance, self.field.attname).name)
+        else:
+            release(getattr(instance, '_stored_image', None))
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import bump_version, get_version
+from .models import Favorite, ShoppingCart
+
+logger = logging.getLogger(__name__)
+
+FAVORITE = 'favorite'
+SHOPPING_CART = 'shopping_cart'
+MODELS = {FAVORITE: Favorite, SHOPPING_CART: ShoppingCart}
+
+
+def membership_version_key(user_id, kind):
+    return f'membership_version:{kind}:{user_id}'
+
+
+class MembershipCache:
+    """LRU-кэш множеств id рецептов из избранного и корзины пользователей.
+
+    Множества хранятся отсортированными массивами int64, проверка
+    принадлежности идёт через bisect. Запись устаревает по TTL или при
+    смене версии в общем кэше, которую меняют сигналы при записи.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_ids(self, user_id, kind):
+        key = (user_id, kind)
+        version = get_version(membership_version_key(user_id, kind))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now and entry[1] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        ids = array('q', sorted(
+            MODELS[kind].objects.filter(user_id=user_id).values_list(
+                'recipe_id', flat=True
+            )
+        ))
+        with self.lock:
+            self.entries[key] = (now + self.ttl, version, ids)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.report()
+        return ids
+
+    def invalidate(self, user_id, kind):
+        """Сбрасывает множество после коммита транзакции.
+
+        Сброс внутри транзакции позволил бы другому запросу перечитать
+        старое состояние и сохранить его под уже новой версией.
+        """
+        transaction.on_commit(lambda: self.drop(user_id, kind))
+
+    def drop(self, user_id, kind):
+        bump_version(membership_version_key(user_id, kind))
+        with self.lock:
+            self.entries.pop((user_id, kind), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
+
+    def report(self):
+        every = settings.MEMBERSHIP_CACHE['STATS_EVERY']
+        if every and (self.hits + self.misses) % every == 0:
+            logger.info('membership cache stats %s', self.stats())
+
+
+membership_cache = MembershipCache(
+    max_entries=settings.MEMBERSHIP_CACHE['MAX_ENTRIES'],
+    ttl=settings.MEMBERSHIP_CACHE['TTL'],
+)
+
+
+def user_recipe_ids(request, kind):
+    """Отсортированные id рецептов пользователя, один раз на запрос."""
+    user = request.user
+    if user.is_anonymous:
+        return array('q')
+    loaded = getattr(request, '_recipe_memberships', None)
+    if loaded is None:
+        loaded = request._recipe_memberships = {}
+    if kind not in loaded:
+        loaded[kind] = membership_cache.get_ids(user.id, kind)
+    return loaded[kind]
+
+
+def contains(ids, recipe_id):
+    position = bisect_left(ids, recipe_id)
+    return position < len(ids) and ids[position] == recipe_id
+
+
+def invalidate_membership(sender, instance, **kwargs):
+    relations_changed(sender, instance.user_id)
+
+
+def relations_changed(sender, user_id, **kwargs):
+    kind = FAVORITE if sender is Favorite else SHOPPING_CART
+    membership_cache.invalidate(user_id, kind)
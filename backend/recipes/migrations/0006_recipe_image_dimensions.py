@@ -0,0 +1,47 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:22
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def fill_image_dimensions(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for recipe_id, image in Recipe.objects.values_list('id', 'image'):
+        if not image:
+            continue
+        try:
+            with default_storage.open(image) as file:
+                width, height = get_image_dimensions(file)
+        except OSError:
+            continue
+        Recipe.objects.filter(id=recipe_id).update(
+            image_width=width,
+            image_height=height,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_auto_20240527_1800'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(height_field='image_height', upload_to='recipes/images/', verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(fill_image_dimensions, migrations.RunPython.noop),
+    ]
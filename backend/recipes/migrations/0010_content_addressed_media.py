@@ -0,0 +1,52 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:44
+
+from django.db import migrations, models
+import foodgram.storage
+from collections import Counter
+
+
+def count_references(apps, schema_editor):
+    """Заводит счётчики для уже загруженных картинок."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'CustomUser')
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    names = Counter(Recipe.objects.exclude(image='').values_list(
+        'image', flat=True
+    ))
+    names.update(User.objects.exclude(avatar='').exclude(
+        avatar__isnull=True
+    ).values_list('avatar', flat=True))
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=name, usage_count=count)
+         for name, count in names.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_vector'),
+        ('users', '0007_customuser_content_addressed_avatar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь к файлу')),
+                ('usage_count', models.IntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(height_field='image_height', storage=foodgram.storage.ContentAddressedStorage(), upload_to=foodgram.storage.content_path, verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    """Считает итоги для корзин, собранных до появления таблицы."""
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingTotal = apps.get_model('recipes', 'ShoppingTotal')
+    totals = IngredientAmount.objects.exclude(
+        recipe__shopping_cart__user=None
+    ).values_list(
+        'recipe__shopping_cart__user', 'ingredient',
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingTotal.objects.bulk_create(
+        (ShoppingTotal(user_id=user_id, ingredient_id=ingredient_id,
+                       total_amount=total)
+         for user_id, ingredient_id, total in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingtotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique user ingredient total'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
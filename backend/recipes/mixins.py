@@ -1,7 +1,68 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins, viewsets
+from rest_framework.renderers import JSONRenderer
+
+from .caching import get_catalog_version
 
 
 class ListRetrieveModelMixin(viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.RetrieveModelMixin):
     pass
+
+
+class CatalogCacheMixin:
+    """Кэширование справочников с условными GET-запросами.
+
+    ETag и Last-Modified строятся из версии справочников, которая
+    меняется при любой записи тегов и ингредиентов. Совпавший
+    If-None-Match получает 304 без обращения к базе, готовые ответы
+    хранятся в кэше Django до смены версии.
+    """
+
+    def perform_authentication(self, request):
+        # Справочники одинаковы для всех: пользователь определяется
+        # лениво, только если к нему обратятся разрешения.
+        pass
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def cached_response(self, request, get_response):
+        version = get_catalog_version()
+        # Путь с query string может быть длинным и с пробелами, а
+        # memcached принимает только короткие ключи без них.
+        path = md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f'{version["etag"]}-{path}')
+        response = get_conditional_response(
+            request, etag=etag, last_modified=version['modified']
+        )
+        if response is None:
+            key = f'catalog:{version["etag"]}:{path}'
+            content = cache.get(key)
+            if content is None:
+                content = JSONRenderer().render(get_response().data)
+                cache.set(key, content, settings.CATALOG_CACHE_TIMEOUT)
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version['modified'])
+        patch_cache_control(response, public=True,
+                            max_age=settings.CATALOG_MAX_AGE)
+        return response
@@ -1,6 +1,13 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from foodgram.models import CounterFieldsMixin
+from foodgram.storage import content_path, image_storage
 
 User = get_user_model()
 
@@ -30,12 +37,41 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = "Ингридиент"
         verbose_name_plural = "Ингридиенты"
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique ingredient unit'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def previews_by_author(self, author_ids, limit=None):
+        """Первые limit рецептов каждого автора одним запросом."""
+        previews = defaultdict(list)
+        if not author_ids:
+            return previews
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is not None:
+            ranked = queryset.annotate(preview_position=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=F('id').desc(),
+            ))
+            sql, params = ranked.query.sql_with_params()
+            queryset = self.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE preview_position <= %s '
+                'ORDER BY author_id, preview_position',
+                (*params, limit),
+            )
+        for recipe in queryset:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     name = models.CharField(
         max_length=256,
         verbose_name="Название",
@@ -49,9 +85,24 @@ class Recipe(models.Model):
     )
 
     image = models.ImageField(
-        upload_to='recipes/images/',
+        upload_to=content_path,
+        storage=image_storage,
+        width_field='image_width',
+        height_field='image_height',
         verbose_name="Картинка",
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Ширина картинки",
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Высота картинки",
+    )
     author = models.ForeignKey(
         User,
         related_name='recipes',
@@ -71,10 +122,35 @@ class Recipe(models.Model):
         verbose_name='Теги',
     )
 
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     class Meta:
         ordering = ['-id']
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            # Свежие рецепты автора: лента подписок и превью в подписках.
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_newest_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -152,3 +228,52 @@ class ShoppingCart(RecipeUserRelation):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name="unique user recipe in shopping_cart")
         ]
+
+
+class ShoppingTotal(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Обновляется приращениями в транзакции изменения корзины или
+    ингредиентов рецепта, см. recipes.shopping_totals.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique user ingredient total')
+        ]
+
+
+class MediaFile(models.Model):
+    """Счётчик ссылок на файл в хранилище по хешу содержимого."""
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Путь к файлу',
+    )
+    usage_count = models.IntegerField(
+        default=0,
+        verbose_name='Число ссылок',
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
@@ -1,6 +1,91 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'limit'
+
+
+def approximate_count(queryset):
+    """Оценка числа строк по статистике планировщика PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    # QuerySet.explain() склеивает строки через str(), а psycopg2 уже
+    # разбирает json-колонку в список, поэтому план читается напрямую.
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class IdCursorPagination(CursorPagination):
+    """Пагинация по ключу: WHERE id < курсор LIMIT n без COUNT и OFFSET."""
+
+    ordering = '-id'
+    page_size = 10
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    approximate_count = 'approximate'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(
+            self.count_query_param
+        ) == self.approximate_count:
+            self.count = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        page = OrderedDict()
+        if self.count is not None:
+            page['count'] = self.count
+        page['next'] = self.get_next_link()
+        page['previous'] = self.get_previous_link()
+        page['results'] = data
+        return Response(page)
+
+
+class PageOrCursorPagination(PageLimitPagination):
+    """Постраничная пагинация с включаемым курсорным режимом.
+
+    Курсорный режим включается параметром `?pagination=cursor` и
+    сохраняется в ссылках next/previous. Без него работает прежний
+    контракт page/limit.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    cursor_pagination_class = IdCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (request.query_params.get(self.mode_query_param)
+                == self.cursor_mode):
+            self.cursor_paginator = self.cursor_pagination_class()
+            page = self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+            self.display_page_controls = (
+                self.cursor_paginator.display_page_controls
+            )
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
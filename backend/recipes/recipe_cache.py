@@ -0,0 +1,168 @@
+"""Кэш общей части сериализованных рецептов.
+
+Тело рецепта (ингредиенты, теги, карточка автора, текст, картинка)
+одинаково для всех, поэтому хранится в общем кэше под ключом из id
+рецепта, версии рецепта, версии профиля автора и версии справочников.
+Версии меняются сигналами после фиксации транзакции, так что старые
+тела просто перестают запрашиваться. Признаки избранного, корзины и
+подписки на автора накладываются поверх при каждом ответе.
+"""
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch, Value, prefetch_related_objects
+from users.models import Subscribe
+
+from .caching import get_catalog_version
+from .membership import FAVORITE, SHOPPING_CART, contains, user_recipe_ids
+from .models import IngredientAmount
+
+User = get_user_model()
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe_version:{recipe_id}'
+
+
+def author_version_key(user_id):
+    return f'recipe_author_version:{user_id}'
+
+
+def get_versions(keys):
+    """Версии сразу для многих ключей: один get_many на все."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return versions
+
+
+def bump_on_commit(key):
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+
+def recipe_changed(instance, **kwargs):
+    bump_on_commit(recipe_version_key(instance.pk))
+
+
+def ingredients_changed(instance, **kwargs):
+    bump_on_commit(recipe_version_key(instance.recipe_id))
+
+
+def recipe_tags_changed(instance, reverse, pk_set, **kwargs):
+    if not reverse:
+        bump_on_commit(recipe_version_key(instance.pk))
+        return
+    for recipe_id in pk_set or ():
+        bump_on_commit(recipe_version_key(recipe_id))
+
+
+def author_changed(instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_on_commit(author_version_key(instance.pk))
+
+
+def image_replaced(sender, pk, **kwargs):
+    if sender is User:
+        bump_on_commit(author_version_key(pk))
+    else:
+        bump_on_commit(recipe_version_key(pk))
+
+
+def prefetch_shared(recipes):
+    """Связанные данные для общей части; подписка заполняется оверлеем."""
+    prefetch_related_objects(
+        recipes,
+        'tags',
+        Prefetch(
+            'ingredientamount_set',
+            queryset=IngredientAmount.objects.select_related('ingredient'),
+        ),
+        Prefetch(
+            'author',
+            queryset=User.objects.annotate(is_subscribed=Value(False)),
+        ),
+    )
+
+
+def body_keys(recipes, request):
+    version_keys = {recipe_version_key(recipe.id) for recipe in recipes}
+    version_keys.update(author_version_key(recipe.author_id)
+                        for recipe in recipes)
+    versions = get_versions(list(version_keys))
+    # Ссылки на картинки абсолютные, поэтому в ключе и адрес сайта.
+    site = hashlib.md5(
+        request.build_absolute_uri('/').encode()
+    ).hexdigest()[:8]
+    catalog = get_catalog_version()['etag']
+    return {
+        recipe.id: (
+            f'recipe_body:{recipe.id}:{site}:{catalog}:'
+            f'{versions[recipe_version_key(recipe.id)]}:'
+            f'{versions[author_version_key(recipe.author_id)]}'
+        )
+        for recipe in recipes
+    }
+
+
+def shared_bodies(serializer, recipes, request):
+    if request is None or serializer.fields['image'].inline_requested():
+        prefetch_shared(recipes)
+        return {recipe.id: serializer.shared_representation(recipe)
+                for recipe in recipes}
+    keys = body_keys(recipes, request)
+    cached = cache.get_many(list(keys.values()))
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    prefetch_shared(missing)
+    # Тело, прочитанное с реплики, могло отстать от новой версии,
+    # поэтому живёт не дольше окна закрепления за основной базой.
+    fresh = {True: {}, False: {}}
+    for recipe in missing:
+        fresh[recipe._state.db == DEFAULT_DB_ALIAS][keys[recipe.id]] = (
+            serializer.shared_representation(recipe)
+        )
+    for from_primary, bodies in fresh.items():
+        if bodies:
+            cache.set_many(bodies, settings.RECIPE_CACHE_TIMEOUT
+                           if from_primary
+                           else settings.REPLICA_STICKY_SECONDS)
+            cached.update(bodies)
+    return {recipe.id: cached[keys[recipe.id]] for recipe in recipes}
+
+
+def subscribed_author_ids(request, author_ids):
+    if request is None or request.user.is_anonymous:
+        return set()
+    return set(Subscribe.objects.filter(
+        follower=request.user, following_id__in=author_ids,
+    ).values_list('following_id', flat=True))
+
+
+def render_recipes(serializer, recipes):
+    """Тела рецептов из кэша с наложенными признаками пользователя."""
+    request = serializer.context.get('request')
+    bodies = shared_bodies(serializer, recipes, request)
+    subscribed = subscribed_author_ids(
+        request, {recipe.author_id for recipe in recipes}
+    )
+    favorites = shopping_cart = ()
+    if request is not None:
+        favorites = user_recipe_ids(request, FAVORITE)
+        shopping_cart = user_recipe_ids(request, SHOPPING_CART)
+    rendered = []
+    for recipe in recipes:
+        body = dict(bodies[recipe.id])
+        body['author'] = dict(body['author'],
+                              is_subscribed=recipe.author_id in subscribed)
+        body['is_favorited'] = contains(favorites, recipe.id)
+        body['is_in_shopping_cart'] = contains(shopping_cart, recipe.id)
+        rendered.append(body)
+    return rendered
@@ -0,0 +1,117 @@
+"""Запись связей пользователя одним запросом.
+
+Избранное, корзина и подписки добавляются через
+INSERT ... ON CONFLICT DO NOTHING и удаляются через DELETE ... RETURNING.
+Ответ строится по вернувшимся id, поэтому повторный клик или
+одновременные запросы не доходят до IntegrityError. Запись идёт в обход
+модельных сигналов, так что зависимые счётчики и кэши обновляют
+обработчики relations_added и relations_removed, по одному запросу на
+всю пачку id. Сигнал relations_changing приходит до записи и нужен тем,
+кто должен заранее взять блокировки.
+"""
+from django.db import connections, router
+from django.dispatch import Signal
+from users.models import Subscribe
+
+# sender — модель связи, аргументы user_id и recipe_ids
+# (author_ids для подписок).
+relations_changing = Signal()
+relations_added = Signal()
+relations_removed = Signal()
+
+
+def columns(model, owner_field, target_field):
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field)
+    return (
+        connection,
+        quote(model._meta.db_table),
+        quote(model._meta.get_field(owner_field).column),
+        quote(target.column),
+        quote(target.related_model._meta.db_table),
+        quote(target.target_field.column),
+    )
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def link(model, owner_field, owner_id, target_field, target_ids):
+    """Добавляет связи с существующими объектами, возвращает новые id."""
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return []
+    connection, table, owner, target, targets, key = columns(
+        model, owner_field, target_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({owner}, {target}) '
+            f'SELECT %s, {key} FROM {targets} '
+            f'WHERE {key} IN ({placeholders(target_ids)}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target}',
+            [owner_id, *target_ids],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def unlink(model, owner_field, owner_id, target_field, target_ids):
+    """Удаляет связи, возвращает id, которые действительно были связаны."""
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return []
+    connection, table, owner, target, *_ = columns(
+        model, owner_field, target_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {owner} = %s '
+            f'AND {target} IN ({placeholders(target_ids)}) '
+            f'RETURNING {target}',
+            [owner_id, *target_ids],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def add_recipes(model, user_id, recipe_ids):
+    """Кладёт рецепты в избранное или корзину (model)."""
+    relations_changing.send(sender=model, user_id=user_id,
+                            recipe_ids=recipe_ids)
+    added = link(model, 'user', user_id, 'recipe', recipe_ids)
+    if added:
+        relations_added.send(sender=model, user_id=user_id,
+                             recipe_ids=added)
+    return added
+
+
+def remove_recipes(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или корзины (model)."""
+    relations_changing.send(sender=model, user_id=user_id,
+                            recipe_ids=recipe_ids)
+    removed = unlink(model, 'user', user_id, 'recipe', recipe_ids)
+    if removed:
+        relations_removed.send(sender=model, user_id=user_id,
+                               recipe_ids=removed)
+    return removed
+
+
+def add_authors(follower_id, author_ids):
+    """Подписывает на авторов, подписка на себя пропускается."""
+    added = link(Subscribe, 'follower', follower_id, 'following', [
+        author_id for author_id in author_ids if author_id != follower_id
+    ])
+    if added:
+        relations_added.send(sender=Subscribe, user_id=follower_id,
+                             author_ids=added)
+    return added
+
+
+def remove_authors(follower_id, author_ids):
+    removed = unlink(Subscribe, 'follower', follower_id, 'following',
+                     author_ids)
+    if removed:
+        relations_removed.send(sender=Subscribe, user_id=follower_id,
+                               author_ids=removed)
+    return removed
@@ -1,11 +1,18 @@
-from drf_extra_fields.fields import Base64ImageField
+from collections import Counter
+
+from django.conf import settings
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from users.models import Subscribe
 from users.serializers import CustomUserSerializer
 
-from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                     ShoppingCart, Tag)
+from . import shopping_totals
+from .fields import RecipeImageField
+from .images import is_current_image
+from .membership import FAVORITE, SHOPPING_CART, contains, user_recipe_ids
+from .models import Ingredient, IngredientAmount, Recipe, ShoppingCart, Tag
+from .recipe_cache import recipe_changed, render_recipes
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -38,6 +45,13 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         ]
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        return render_recipes(self.child, list(data))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -47,7 +61,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         read_only=True,
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
     tags = TagSerializer(
         read_only=True,
         many=True
@@ -60,6 +74,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_width',
+            'image_height',
             'text',
             'cooking_time',
             'author',
@@ -76,31 +92,39 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart'
         )
         model = Recipe
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return render_recipes(self, [instance])[0]
+
+    def shared_representation(self, instance):
+        """Общая для всех пользователей часть, кэшируется."""
+        return super().to_representation(instance)
 
     def get_id(self, obj):
         return f'{obj.id}'
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return Favorite.objects.filter(
-            user=request.user.id,
-            recipe=obj,
-        ).exists()
+        return self.is_member(obj, FAVORITE)
 
     def get_is_in_shopping_cart(self, obj):
+        return self.is_member(obj, SHOPPING_CART)
+
+    def is_member(self, obj, kind):
         request = self.context.get('request')
-        return ShoppingCart.objects.filter(
-            user=request.user.id,
-            recipe=obj,
-        ).exists()
+        if request is None:
+            return False
+        return contains(user_recipe_ids(request, kind), obj.id)
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientAmount.objects.create(
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
                 recipe=recipe,
                 ingredient_id=ingredient.get('id'),
                 amount=ingredient.get('amount'),
             )
+            for ingredient in ingredients
+        )
 
     def validate_field(self, field, model):
         data = self.initial_data.get(field)
@@ -108,27 +132,41 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 f'{field}': f'Для рецепта нужен хотя бы один {field}'})
 
-        item_set = set()
+        errors = []
+        ids = []
         for field_item in data:
             id = field_item if field == 'tags' else field_item.get('id')
             try:
-                item = model.objects.get(id=id)
-            except model.DoesNotExist:
-                raise serializers.ValidationError({
-                    f'{field}': f'Несуществующий {field} с ID {id}'
-                })
-
-            if item in item_set:
-                raise serializers.ValidationError(f'{field} должны '
-                                                  'быть уникальными')
-            item_set.add(item)
-
-            if field == 'ingredients' and int(field_item['amount']) <= 0:
-                raise serializers.ValidationError({
-                    'ingredients': ('Убедитесь, что значение количества '
-                                    'ингредиента больше 0')
-                })
-
+                ids.append(int(id))
+            except (TypeError, ValueError):
+                errors.append(f'Некорректный ID {field}: {id}')
+                continue
+
+            if field == 'ingredients':
+                try:
+                    amount = int(field_item.get('amount'))
+                except (TypeError, ValueError):
+                    amount = 0
+                if amount <= 0:
+                    errors.append('Убедитесь, что значение количества '
+                                  f'ингредиента с ID {id} больше 0')
+
+        duplicates = sorted(
+            id for id, count in Counter(ids).items() if count > 1
+        )
+        if duplicates:
+            errors.append(f'{field} должны быть уникальными, '
+                          f'повторяются ID: {duplicates}')
+
+        existing = set(model.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        missing = sorted(set(ids) - existing)
+        if missing:
+            errors.append(f'Несуществующие {field} с ID: {missing}')
+
+        if errors:
+            raise serializers.ValidationError({f'{field}': errors})
         return data
 
     def validate(self, data):
@@ -137,10 +175,17 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'image': 'У рецепта должна быть картинка'}
             )
-        data['ingredients'] = self.validate_field('ingredients', Ingredient)
-        data['tags'] = self.validate_field('tags', Tag)
+        errors = {}
+        for field, model in (('ingredients', Ingredient), ('tags', Tag)):
+            try:
+                data[field] = self.validate_field(field, model)
+            except serializers.ValidationError as error:
+                errors.update(error.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
@@ -149,19 +194,80 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients_data, recipe)
         return recipe
 
+    def update_tags(self, recipe, tags):
+        old = set(recipe.tags.values_list('id', flat=True))
+        new = set(map(int, tags))
+        if old == new:
+            return False
+        if old - new:
+            recipe.tags.remove(*(old - new))
+        if new - old:
+            recipe.tags.add(*(new - old))
+        return True
+
+    def update_ingredients(self, recipe, ingredients):
+        """Меняет только разошедшиеся строки состава рецепта."""
+        rows = {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in recipe.ingredientamount_set
+            .values_list('id', 'ingredient_id', 'amount')
+        }
+        new_amounts = {
+            int(ingredient['id']): int(ingredient['amount'])
+            for ingredient in ingredients
+        }
+        removed = [pk for ingredient_id, (pk, _) in rows.items()
+                   if ingredient_id not in new_amounts]
+        changed = [
+            IngredientAmount(id=rows[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id in rows and rows[ingredient_id][1] != amount
+        ]
+        added = [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in rows
+        ]
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        if added:
+            self.create_ingredients(added, recipe)
+        shopping_totals.change_recipe(recipe.id, {
+            ingredient_id: amount
+            for ingredient_id, (_, amount) in rows.items()
+        }, new_amounts)
+        return bool(removed or changed or added)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time',
-            instance.cooking_time
+        """Пишет только то, что отличается от сохранённого рецепта."""
+        # Строка рецепта заблокирована до коммита: параллельные правки
+        # и изменения корзин с этим рецептом ждут, а итоги списков
+        # покупок считаются от актуального состава.
+        Recipe.objects.select_for_update().filter(pk=instance.pk).exists()
+        update_fields = [
+            field for field in ('name', 'text', 'cooking_time')
+            if field in validated_data
+            and validated_data[field] != getattr(instance, field)
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        image = validated_data.get('image')
+        if image and not is_current_image(instance, 'image', image):
+            instance.image = image
+            update_fields += ['image', 'image_width', 'image_height']
+        self.update_tags(instance, validated_data['tags'])
+        ingredients_changed = self.update_ingredients(
+            instance, validated_data['ingredients']
         )
-        instance.image = validated_data.get('image', instance.image) or ""
-        tags_data = self.validated_data.get('tags')
-        instance.tags.set(tags_data)
-        IngredientAmount.objects.filter(recipe=instance).all().delete()
-        self.create_ingredients(validated_data.get('ingredients'), instance)
-        instance.save()
+        if update_fields:
+            instance.save(update_fields=update_fields)
+        elif ingredients_changed:
+            # Массовые операции с составом не шлют сигналов, версию
+            # тела рецепта в кэше меняем сами.
+            recipe_changed(instance)
         return instance
 
 
@@ -182,21 +288,24 @@ class FavoriteSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count', 'avatar')
 
     def get_is_subscribed(self, obj):
-        return Subscribe.objects.filter(
-            follower=obj.follower,
-            following=obj.following,
-        ).exists()
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.following)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return CropRecipeSerializer(queryset, many=True).data
+        previews = self.context.get('recipes')
+        if previews is not None:
+            queryset = previews.get(obj.following_id, [])
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            queryset = Recipe.objects.filter(author=obj.following)
+            if limit:
+                queryset = queryset[:int(limit)]
+        return CropRecipeSerializer(
+            queryset, many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.following).count()
+        return obj.following.recipes_count
 
     def get_avatar(self, obj):
         if obj.following.avatar:
@@ -207,24 +316,30 @@ class FavoriteSerializer(serializers.ModelSerializer):
 class ShoppingCartSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
-    image = serializers.SerializerMethodField()
+    image = RecipeImageField(source='recipe.image', read_only=True)
+    image_width = serializers.ReadOnlyField(source='recipe.image_width')
+    image_height = serializers.ReadOnlyField(source='recipe.image_height')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
 
     class Meta:
         model = ShoppingCart
-        fields = ('id', 'name', 'image', 'cooking_time')
-
-    def get_image(self, obj):
-        image = obj.recipe.image
-        if image:
-            return image.url
-        return None
+        fields = ('id', 'name', 'image', 'image_width', 'image_height',
+                  'cooking_time')
 
 
 class CropRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField(read_only=True)
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-        read_only_fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_width', 'image_height',
+                  'cooking_time')
+        read_only_fields = fields
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATIONS_BULK_LIMIT,
+    )
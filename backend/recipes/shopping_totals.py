@@ -0,0 +1,170 @@
+"""Инкрементальные итоги списка покупок.
+
+Таблица ShoppingTotal хранит сумму каждого ингредиента по корзине
+пользователя. Добавление и удаление рецепта из корзины, а также правка
+ингредиентов рецепта, который лежит в чьих-то корзинах, меняют её одним
+upsert в той же транзакции. Чтение списка — один индексный проход по
+строкам пользователя.
+
+Правка состава держит строку рецепта FOR UPDATE, а изменение корзины
+до записи берёт её FOR SHARE. Иначе две правки посчитали бы разницу от
+одного старого состава, а корзина, добавленная во время правки,
+получила бы старые количества и не попала бы в upsert правки.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Sum
+
+from .caching import bump_version, shopping_cart_version_key
+from .models import IngredientAmount, Recipe, ShoppingCart, ShoppingTotal
+
+
+def upsert(select_sql, params):
+    """Прибавляет к итогам строки (user_id, ingredient_id, amount).
+
+    Возвращает id пользователей, чьи итоги изменились.
+    """
+    connection = connections[router.db_for_write(ShoppingTotal)]
+    table = connection.ops.quote_name(ShoppingTotal._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, ingredient_id, total_amount) '
+            f'{select_sql} '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET total_amount = {table}.total_amount '
+            f'+ excluded.total_amount RETURNING user_id',
+            params,
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def lock_recipes(recipe_ids):
+    """Берёт строки рецептов FOR SHARE до конца транзакции."""
+    connection = connections[router.db_for_write(Recipe)]
+    if not recipe_ids or not connection.features.has_select_for_update:
+        return
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM {table} '
+            f'WHERE id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+            f'ORDER BY id FOR SHARE',
+            sorted(recipe_ids),
+        )
+
+
+def drop_empty(**filters):
+    ShoppingTotal.objects.filter(total_amount__lte=0, **filters).delete()
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """Прибавляет (sign=1) или вычитает (sign=-1) рецепты из итогов."""
+    amounts = IngredientAmount._meta.db_table
+    upsert(
+        f'SELECT %s, ingredient_id, %s * SUM(amount) FROM {amounts} '
+        f'WHERE recipe_id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+        f'GROUP BY ingredient_id',
+        [user_id, sign, *recipe_ids],
+    )
+    if sign < 0:
+        drop_empty(user_id=user_id)
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Переносит правку ингредиентов рецепта в корзины с этим рецептом.
+
+    old_amounts и new_amounts — словари ingredient_id -> amount.
+    """
+    deltas = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    carts = ShoppingCart._meta.db_table
+    changes = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS delta'] * len(deltas)
+    )
+    user_ids = upsert(
+        f'SELECT cart.user_id, changes.ingredient_id, changes.delta '
+        f'FROM {carts} cart CROSS JOIN ({changes}) changes '
+        f'WHERE cart.recipe_id = %s',
+        [value for item in deltas.items() for value in item] + [recipe_id],
+    )
+    if any(delta < 0 for delta in deltas.values()):
+        drop_empty(user__shoppingcart__recipe_id=recipe_id)
+    # Выгрузки списков покупок кэшируются под версией корзины.
+    transaction.on_commit(lambda: bump_carts(user_ids))
+
+
+def bump_carts(user_ids):
+    for user_id in user_ids:
+        bump_version(shopping_cart_version_key(user_id))
+
+
+def expected_totals(user_ids=None):
+    """Итоги, посчитанные заново по корзинам, как раньше при выгрузке."""
+    amounts = IngredientAmount.objects.all()
+    if user_ids is not None:
+        amounts = amounts.filter(recipe__shopping_cart__user__in=user_ids)
+    return amounts.values_list(
+        'recipe__shopping_cart__user', 'ingredient',
+    ).annotate(total=Sum('amount')).exclude(
+        recipe__shopping_cart__user=None
+    ).order_by()
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Пересобирает итоги указанных пользователей (или всех)."""
+    totals = ShoppingTotal.objects.all()
+    if user_ids is not None:
+        totals = totals.filter(user__in=user_ids)
+    totals.delete()
+    ShoppingTotal.objects.bulk_create(
+        (ShoppingTotal(user_id=user_id, ingredient_id=ingredient_id,
+                       total_amount=total)
+         for user_id, ingredient_id, total in expected_totals(user_ids)
+         .iterator()),
+        batch_size=1000,
+    )
+
+
+def cart_changing(instance, **kwargs):
+    """Смена пользователя или рецепта у существующей строки (админка)."""
+    if instance.pk is None:
+        lock_recipes([instance.recipe_id])
+        return
+    old = ShoppingCart.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'recipe_id'
+    ).first()
+    if old and old != (instance.user_id, instance.recipe_id):
+        lock_recipes({old[1], instance.recipe_id})
+        add_recipes(old[0], [old[1]], sign=-1)
+        instance._totals_moved = True
+
+
+def cart_saved(instance, created, **kwargs):
+    if created or getattr(instance, '_totals_moved', False):
+        add_recipes(instance.user_id, [instance.recipe_id])
+        instance._totals_moved = False
+
+
+def cart_deleting(instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты
+    # ещё на месте.
+    lock_recipes([instance.recipe_id])
+    add_recipes(instance.user_id, [instance.recipe_id], sign=-1)
+
+
+def carts_changing(user_id, recipe_ids, **kwargs):
+    lock_recipes(recipe_ids)
+
+
+def carts_added(user_id, recipe_ids, **kwargs):
+    add_recipes(user_id, recipe_ids)
+
+
+def carts_removed(user_id, recipe_ids, **kwargs):
+    add_recipes(user_id, recipe_ids, sign=-1)
@@ -0,0 +1,71 @@
+import string
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+CHECKSUM_LENGTH = 2
+KEY_SALT = 'recipes.shortlinks'
+
+
+def to_base62(number):
+    digits = ''
+    while True:
+        number, remainder = divmod(number, BASE)
+        digits = ALPHABET[remainder] + digits
+        if not number:
+            return digits
+
+
+def from_base62(digits):
+    number = 0
+    for digit in digits:
+        number = number * BASE + ALPHABET.index(digit)
+    return number
+
+
+def checksum(body):
+    digest = salted_hmac(KEY_SALT, body).digest()
+    value = int.from_bytes(digest[:4], 'big') % BASE ** CHECKSUM_LENGTH
+    return to_base62(value).rjust(CHECKSUM_LENGTH, ALPHABET[0])
+
+
+def make_code(recipe_id):
+    """Короткий код: id рецепта в base62 и контрольная сумма на ключе."""
+    body = to_base62(recipe_id)
+    return body + checksum(body)
+
+
+@lru_cache(maxsize=4096)
+def resolve_code(code):
+    """id рецепта по коду или None, если код не наш."""
+    body = code[:-CHECKSUM_LENGTH]
+    if not body or any(char not in ALPHABET for char in code):
+        return None
+    if checksum(body) != code[-CHECKSUM_LENGTH:]:
+        return None
+    return from_base62(body)
+
+
+def recipe_exists_key(recipe_id):
+    return f'short_link_recipe:{recipe_id}'
+
+
+def recipe_exists(recipe_id):
+    key = recipe_exists_key(recipe_id)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Recipe.objects.filter(id=recipe_id).exists()
+        # Отрицательный ответ мог прийти с отстающей реплики.
+        cache.set(key, exists, settings.SHORT_LINK_CACHE_TIMEOUT
+                  if exists else settings.REPLICA_STICKY_SECONDS)
+    return exists
+
+
+def forget_recipe(instance, **kwargs):
+    cache.delete(recipe_exists_key(instance.pk))
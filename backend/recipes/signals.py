@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from users.models import Subscribe
+
+from . import counters, feed, recipe_cache, shopping_totals, shortlinks
+from .caching import (bump_catalog_version, bump_version,
+                      shopping_cart_version_key)
+from .images import image_replaced
+from .media import ImageReferences
+from .membership import invalidate_membership, relations_changed
+from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                     ShoppingCart, Tag)
+from .relations import relations_added, relations_changing, relations_removed
+
+User = get_user_model()
+
+for model in (Tag, Ingredient):
+    post_save.connect(bump_catalog_version, sender=model)
+    post_delete.connect(bump_catalog_version, sender=model)
+
+
+def bump_shopping_cart_version(instance, **kwargs):
+    bump_user_shopping_cart_version(instance.user_id)
+
+
+def bump_user_shopping_cart_version(user_id, **kwargs):
+    # Версия меняется после коммита, иначе параллельный запрос успеет
+    # закэшировать список покупок по ещё не закоммиченной корзине.
+    transaction.on_commit(
+        lambda: bump_version(shopping_cart_version_key(user_id))
+    )
+
+
+post_save.connect(bump_shopping_cart_version, sender=ShoppingCart)
+post_delete.connect(bump_shopping_cart_version, sender=ShoppingCart)
+relations_added.connect(bump_user_shopping_cart_version, sender=ShoppingCart)
+relations_removed.connect(bump_user_shopping_cart_version, sender=ShoppingCart)
+
+
+for model in (Favorite, ShoppingCart):
+    post_save.connect(invalidate_membership, sender=model)
+    post_delete.connect(invalidate_membership, sender=model)
+    relations_added.connect(relations_changed, sender=model)
+    relations_removed.connect(relations_changed, sender=model)
+
+post_save.connect(counters.favorite_saved, sender=Favorite)
+post_delete.connect(counters.favorite_deleted, sender=Favorite)
+post_save.connect(counters.cart_saved, sender=ShoppingCart)
+post_delete.connect(counters.cart_deleted, sender=ShoppingCart)
+relations_added.connect(counters.favorites_added, sender=Favorite)
+relations_removed.connect(counters.favorites_removed, sender=Favorite)
+relations_added.connect(counters.carts_added, sender=ShoppingCart)
+relations_removed.connect(counters.carts_removed, sender=ShoppingCart)
+post_save.connect(counters.recipe_saved, sender=Recipe)
+post_delete.connect(counters.recipe_deleted, sender=Recipe)
+
+pre_save.connect(shopping_totals.cart_changing, sender=ShoppingCart)
+relations_changing.connect(shopping_totals.carts_changing,
+                           sender=ShoppingCart)
+post_save.connect(shopping_totals.cart_saved, sender=ShoppingCart)
+pre_delete.connect(shopping_totals.cart_deleting, sender=ShoppingCart)
+relations_added.connect(shopping_totals.carts_added, sender=ShoppingCart)
+relations_removed.connect(shopping_totals.carts_removed, sender=ShoppingCart)
+
+post_save.connect(feed.recipe_published, sender=Recipe)
+post_delete.connect(feed.recipe_deleted, sender=Recipe)
+post_save.connect(feed.subscription_changed, sender=Subscribe)
+post_delete.connect(feed.subscription_changed, sender=Subscribe)
+relations_added.connect(feed.subscriptions_changed, sender=Subscribe)
+relations_removed.connect(feed.subscriptions_changed, sender=Subscribe)
+
+post_save.connect(shortlinks.forget_recipe, sender=Recipe)
+post_delete.connect(shortlinks.forget_recipe, sender=Recipe)
+
+post_save.connect(recipe_cache.recipe_changed, sender=Recipe)
+post_save.connect(recipe_cache.ingredients_changed, sender=IngredientAmount)
+m2m_changed.connect(recipe_cache.recipe_tags_changed,
+                    sender=Recipe.tags.through)
+post_save.connect(recipe_cache.author_changed, sender=User)
+image_replaced.connect(recipe_cache.image_replaced)
+
+ImageReferences(Recipe, 'image').connect()
+ImageReferences(User, 'avatar').connect()
@@ -0,0 +1,566 @@
+import asyncio
+import io
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.db.utils import ConnectionHandler
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from foodgram.db import PrimaryPinningMiddleware
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .caching import (get_catalog_version, get_version,
+                      shopping_cart_version_key)
+from .checks import check_shared_cache
+from .filters import RecipeFilter
+from .management.commands._seed import SCALES, seed
+from .management.commands.benchmark_api import QUERY_BUDGETS, endpoints, run
+from .membership import SHOPPING_CART, membership_version_key
+from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                     ShoppingCart, ShoppingTotal, Tag)
+from .paginations import approximate_count
+from .serializers import RecipeSerializer
+from .shopping_totals import expected_totals
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeTestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass',
+            first_name='Читатель', last_name='Рецептов',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def create_recipes(self, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10,
+                image='images/aa/recipe.png', image_width=1, image_height=1,
+            )
+            recipe.tags.set(self.tags[:2])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in self.ingredients[:3]
+            )
+            recipes.append(recipe)
+        return recipes
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class RecipeQueryCountTests(RecipeTestCase):
+    """Число запросов списка и рецепта не зависит от числа рецептов."""
+
+    def test_list_queries_do_not_grow_with_recipes(self):
+        recipes = self.create_recipes(3)
+        Favorite.objects.create(user=self.reader, recipe=recipes[0])
+        few = self.count_queries('/api/recipes/')
+        self.create_recipes(6)
+        self.assertEqual(self.count_queries('/api/recipes/'), few)
+
+    def test_list_queries(self):
+        self.create_recipes(5)
+        self.client.get('/api/recipes/')
+        # Тела рецептов уже в кэше: число рецептов, страница и подписки
+        # на авторов; избранное и корзина — из кэша членства.
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_list_queries_anonymous(self):
+        self.create_recipes(5)
+        client = APIClient()
+        client.get('/api/recipes/')
+        with self.assertNumQueries(2):
+            client.get('/api/recipes/')
+
+    def test_detail_queries_do_not_grow_with_ingredients(self):
+        small, large = self.create_recipes(2)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=large, ingredient=ingredient, amount=5)
+            for ingredient in self.ingredients[3:]
+        )
+        large.tags.add(self.tags[2])
+        self.assertEqual(
+            self.count_queries(f'/api/recipes/{large.id}/'),
+            self.count_queries(f'/api/recipes/{small.id}/'),
+        )
+
+    def test_detail_queries(self):
+        recipe, = self.create_recipes(1)
+        url = f'/api/recipes/{recipe.id}/'
+        self.client.get(url)
+        # Рецепт, автор для проверки прав и подписка на автора.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], f'{recipe.id}')
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+
+class ApproximateCountTests(RecipeTestCase):
+    """Оценка числа строк для курсорной пагинации."""
+
+    url = '/api/recipes/?pagination=cursor&count=approximate'
+
+    @skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL.')
+    def test_count_from_plan(self):
+        self.create_recipes(3)
+        self.assertIsInstance(approximate_count(Recipe.objects.all()), int)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data['count'], int)
+
+    @skipUnless(connection.vendor != 'postgresql', 'Только без PostgreSQL.')
+    def test_count_skipped_without_postgresql(self):
+        self.create_recipes(3)
+        self.assertIsNone(approximate_count(Recipe.objects.all()))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_warns_about_process_local_cache(self):
+        with override_settings(DEBUG=False, CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)],
+                ['recipes.W001'],
+            )
+
+    def test_shared_cache_passes(self):
+        with override_settings(DEBUG=False, CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class VersionBumpTests(RecipeTestCase):
+    """Версии кэшей меняются только после коммита."""
+
+    def test_cart_versions_bumped_on_commit(self):
+        recipe, = self.create_recipes(1)
+        keys = [
+            shopping_cart_version_key(self.reader.id),
+            membership_version_key(self.reader.id, SHOPPING_CART),
+        ]
+        before = [get_version(key) for key in keys]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+            self.assertEqual([get_version(key) for key in keys], before)
+        self.assertTrue(callbacks)
+        after = [get_version(key) for key in keys]
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_catalog_version_bumped_on_commit(self):
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Tag.objects.create(name='Новый тег', slug='new-tag')
+            self.assertEqual(get_catalog_version(), before)
+        self.assertTrue(callbacks)
+        self.assertNotEqual(get_catalog_version(), before)
+
+
+class RecipeUpdateTests(RecipeTestCase):
+    """PUT пишет только то, что отличается от сохранённого рецепта."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(1)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(self.author)
+        detail = self.client.get(self.url).data
+        self.data = {
+            'name': detail['name'],
+            'text': detail['text'],
+            'cooking_time': detail['cooking_time'],
+            'image': detail['image'],
+            'tags': [tag['id'] for tag in detail['tags']],
+            'ingredients': [
+                {'id': ingredient['id'], 'amount': ingredient['amount']}
+                for ingredient in detail['ingredients']
+            ],
+        }
+
+    def put(self, data):
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def assertTotalsConsistent(self):
+        self.assertEqual(
+            sorted(expected_totals([self.reader.id])),
+            sorted(ShoppingTotal.objects.values_list(
+                'user', 'ingredient', 'total_amount'
+            )),
+        )
+        call_command('check_shopping_totals', stdout=io.StringIO())
+
+    def test_unchanged_update_writes_nothing(self):
+        self.assertEqual(self.put(self.data), [])
+        self.assertTotalsConsistent()
+
+    def test_tag_only_change(self):
+        amounts = list(self.recipe.ingredientamount_set.values_list(
+            'id', 'ingredient', 'amount'
+        ).order_by('id'))
+        tags = [self.tags[0].id, self.tags[2].id]
+        writes = self.put(dict(self.data, tags=tags))
+        tags_table = Recipe.tags.through._meta.db_table
+        self.assertTrue(writes)
+        self.assertTrue(all(tags_table in sql for sql in writes), writes)
+        self.assertEqual(
+            sorted(self.recipe.tags.values_list('id', flat=True)), tags
+        )
+        self.assertEqual(list(self.recipe.ingredientamount_set.values_list(
+            'id', 'ingredient', 'amount'
+        ).order_by('id')), amounts)
+        response = self.client.get(self.url)
+        self.assertEqual([tag['id'] for tag in response.data['tags']], tags)
+
+    def test_ingredient_only_change(self):
+        kept, changed, removed = self.ingredients[:3]
+        added = self.ingredients[3]
+        kept_row = IngredientAmount.objects.get(recipe=self.recipe,
+                                                ingredient=kept)
+        writes = self.put(dict(self.data, ingredients=[
+            {'id': kept.id, 'amount': 10},
+            {'id': changed.id, 'amount': 25},
+            {'id': added.id, 'amount': 3},
+        ]))
+        recipe_table = Recipe._meta.db_table
+        tags_table = Recipe.tags.through._meta.db_table
+        self.assertFalse([sql for sql in writes
+                          if f'UPDATE "{recipe_table}"' in sql
+                          or tags_table in sql])
+        self.assertEqual(dict(self.recipe.ingredientamount_set.values_list(
+            'ingredient', 'amount'
+        )), {kept.id: 10, changed.id: 25, added.id: 3})
+        self.assertTrue(IngredientAmount.objects.filter(
+            id=kept_row.id, amount=10
+        ).exists())
+        self.assertFalse(ShoppingTotal.objects.filter(
+            user=self.reader, ingredient=removed
+        ).exists())
+        self.assertEqual(ShoppingTotal.objects.get(
+            user=self.reader, ingredient=changed
+        ).total_amount, 25)
+        self.assertTotalsConsistent()
+        response = self.client.get(self.url)
+        self.assertEqual(
+            {item['id']: item['amount']
+             for item in response.data['ingredients']},
+            {kept.id: 10, changed.id: 25, added.id: 3},
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL.')
+    def test_update_and_cart_changes_lock_recipe(self):
+        recipe_table = Recipe._meta.db_table
+        cart_table = ShoppingCart._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            self.client.put(self.url, self.data, format='json')
+        self.assertTrue(any(
+            'FOR UPDATE' in query['sql'] and recipe_table in query['sql']
+            for query in queries
+        ))
+        self.client.force_authenticate(self.reader)
+        url = f'{self.url}shopping_cart/'
+        for method in ('delete', 'post'):
+            with CaptureQueriesContext(connection) as queries:
+                getattr(self.client, method)(url)
+            sql = [query['sql'] for query in queries]
+            lock = next(number for number, query in enumerate(sql)
+                        if 'FOR SHARE' in query)
+            write = next(number for number, query in enumerate(sql)
+                         if cart_table in query
+                         and query.startswith(('INSERT', 'DELETE')))
+            self.assertLess(lock, write)
+
+
+class CounterFieldsTests(RecipeTestCase):
+    """Полный save() устаревшего экземпляра не затирает счётчики."""
+
+    def test_recipe_save_keeps_counters(self):
+        recipe, = self.create_recipes(1)
+        stale = Recipe.objects.get(id=recipe.id)
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        stale.name = 'Новое название'
+        stale.save()
+        self.assertEqual(
+            Recipe.objects.values_list(
+                'name', 'favorites_count', 'in_carts_count'
+            ).get(id=recipe.id),
+            ('Новое название', 1, 1),
+        )
+
+    def test_user_save_keeps_recipes_count(self):
+        stale = User.objects.get(id=self.author.id)
+        self.create_recipes(2)
+        stale.first_name = 'Шеф'
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.first_name, 'Шеф')
+        self.assertEqual(self.author.recipes_count, 2)
+
+
+class RecipeImageFieldTests(RecipeTestCase):
+
+    def test_current_image_references_keep_file_unread(self):
+        recipe, = self.create_recipes(1)
+        request = Request(APIRequestFactory().put(
+            f'/api/recipes/{recipe.id}/?image_format=base64'
+        ))
+        field = RecipeSerializer(
+            recipe, context={'request': request}
+        ).fields['image']
+        # Файла картинки нет на диске: чтение для base64 упало бы.
+        for reference in (recipe.image.name, recipe.image.url,
+                          request.build_absolute_uri(recipe.image.url)):
+            self.assertIs(field.to_internal_value(reference), recipe.image)
+
+
+class RecipeFilterTests(RecipeTestCase):
+
+    def test_unknown_tag_slug_is_skipped(self):
+        tagged, = self.create_recipes(1)
+        untagged = Recipe.objects.create(
+            author=self.author, name='Без тегов', text='Описание',
+            cooking_time=5, image='images/aa/recipe.png',
+            image_width=1, image_height=1,
+        )
+        # Слаг прошёл проверку выбора, но тег удалили до фильтрации.
+        queryset = RecipeFilter(queryset=Recipe.objects.all()).filter_tags(
+            Recipe.objects.all(), 'tags', ['tag-0', 'deleted-tag']
+        )
+        self.assertEqual(list(queryset), [tagged])
+        self.assertNotIn(untagged, RecipeFilter(
+            queryset=Recipe.objects.all()
+        ).filter_tags(Recipe.objects.all(), 'tags', ['deleted-tag']))
+
+
+class CatalogCacheTests(RecipeTestCase):
+
+    def test_ingredient_search_is_conditional(self):
+        url = '/api/ingredients/?name=Ингредиент'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(self.ingredients))
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        other = self.client.get('/api/ingredients/?name=Ингредиент 1')
+        self.assertNotEqual(other['ETag'], response['ETag'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class DatabaseRoutingTests(TransactionTestCase):
+    """Маршрутизация чтения на реплику и закрепление за основной базой.
+
+    TransactionTestCase нужен, потому что внутри атомарного блока
+    TestCase роутер всегда выбирает основную базу.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def read_alias(self, request):
+        """Куда пойдёт чтение рецептов внутри запроса."""
+        aliases = []
+
+        def get_response(request):
+            aliases.append(router.db_for_read(Recipe))
+            return None
+
+        PrimaryPinningMiddleware(get_response)(request)
+        return aliases[0]
+
+    def test_safe_reads_go_to_replica(self):
+        self.assertEqual(router.db_for_read(Recipe), 'replica_1')
+        self.assertEqual(router.db_for_read(Tag), 'default')
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+        self.assertEqual(
+            self.read_alias(self.factory.get('/api/recipes/')), 'replica_1'
+        )
+
+    def test_unsafe_requests_and_atomic_reads_go_to_primary(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            with self.subTest(method=method):
+                request = getattr(self.factory, method)('/api/recipes/1/')
+                self.assertEqual(self.read_alias(request), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_reads_after_write_are_sticky(self):
+        token = {'HTTP_AUTHORIZATION': 'Token writer'}
+        self.read_alias(self.factory.post('/api/recipes/', **token))
+        self.assertEqual(
+            self.read_alias(self.factory.get('/api/recipes/', **token)),
+            'default',
+        )
+        self.assertEqual(self.read_alias(self.factory.get(
+            '/api/recipes/', HTTP_AUTHORIZATION='Token reader'
+        )), 'replica_1')
+        # Метка истекла — чтение снова уходит на реплику.
+        cache.clear()
+        self.assertEqual(
+            self.read_alias(self.factory.get('/api/recipes/', **token)),
+            'replica_1',
+        )
+
+    def test_async_requests_are_pinned(self):
+        async def get_response(request):
+            return router.db_for_read(Recipe)
+
+        middleware = PrimaryPinningMiddleware(get_response)
+        self.assertEqual(asyncio.run(
+            middleware(self.factory.post('/api/recipes/'))
+        ), 'default')
+        self.assertEqual(asyncio.run(
+            middleware(self.factory.get('/api/recipes/'))
+        ), 'replica_1')
+        self.assertEqual(router.db_for_read(Recipe), 'replica_1')
+
+
+class HealthCheckTests(TestCase):
+    """Постоянное соединение проверяется при первом курсоре запроса."""
+
+    def setUp(self):
+        # Отдельное соединение со своим файлом базы, не тестовое: базу
+        # в памяти SQLite-бэкенд никогда не закрывает.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.connections = ConnectionHandler({'default': {
+            'ENGINE': 'foodgram.backends.sqlite3',
+            'NAME': f'{directory}/health.sqlite3',
+            'CONN_MAX_AGE': None,
+        }})
+        self.db = self.connections['default']
+        self.addCleanup(self.db.close)
+
+    def query(self):
+        with self.db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_checked_lazily_once_per_request(self):
+        with mock.patch.object(self.db, 'is_usable',
+                               wraps=self.db.is_usable) as is_usable:
+            self.query()
+            self.assertEqual(is_usable.call_count, 0)
+            # Конец запроса: соединение остаётся открытым.
+            self.db.close_if_unusable_or_obsolete()
+            self.assertEqual(is_usable.call_count, 0)
+            self.query()
+            self.query()
+            self.assertEqual(is_usable.call_count, 1)
+
+    def test_dead_connection_is_replaced(self):
+        self.query()
+        self.db.close_if_unusable_or_obsolete()
+        dead = self.db.connection
+        # SQLite всегда считает соединение рабочим, обрыв имитируется.
+        with mock.patch.object(self.db, 'is_usable', return_value=False):
+            self.assertEqual(self.query(), 1)
+        self.assertIsNot(self.db.connection, dead)
+
+    @override_settings(DB_HEALTH_CHECKS=False)
+    def test_checks_can_be_disabled(self):
+        self.query()
+        self.db.close_if_unusable_or_obsolete()
+        with mock.patch.object(self.db, 'is_usable') as is_usable:
+            self.query()
+        is_usable.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTests(TransactionTestCase):
+    """Бюджеты запросов benchmark_api проверяются и в manage.py test.
+
+    TransactionTestCase нужен, чтобы версии кэшей менялись по коммиту,
+    как при работе сервера. Чтение может уйти на реплики из
+    DB_REPLICAS, поэтому разрешены все базы.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        seed(SCALES['small'])
+        self.user = User.objects.order_by('id').first()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_endpoints_fit_budgets(self):
+        for endpoint in endpoints(self.user):
+            with self.subTest(endpoint=endpoint.name):
+                result = run(endpoint, self.client, repeat=2)
+                self.assertTrue(
+                    all(code < 400 for code in result['statuses']), result
+                )
+                self.assertLessEqual(result['queries'],
+                                     QUERY_BUDGETS[endpoint.name])
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet, short_link
 
 router = routers.DefaultRouter()
 router.register(r'tags', TagViewSet)
@@ -11,5 +11,5 @@ app_name = 'recipes'
 
 urlpatterns = [
     path('api/', include(router.urls)),
-    path('r/', include('urlshortner.urls')),
+    path('r/<str:code>', short_link, name='short-link'),
 ]
@@ -1,28 +1,30 @@
-import base64
-import csv
-from collections import defaultdict
-
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from urlshortner.utils import shorten_url
 
+from . import exports, shortlinks
+from .feed import FeedPagination, feed_queryset
 from .filters import RecipeFilter
-from .mixins import ListRetrieveModelMixin
-from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                     ShoppingCart, Tag)
-from .paginations import PageLimitPagination
+from .images import check_request_size, schedule_normalize
+from .ingredient_index import get_ingredient_index
+from .mixins import CatalogCacheMixin, ListRetrieveModelMixin
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .paginations import PageOrCursorPagination
 from .permissions import IsAuthorOrReadOnlyPermission
-from .serializers import (IngredientSerializer, RecipeSerializer,
+from .relations import add_recipes, remove_recipes
+from .serializers import (CropRecipeSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeSerializer,
                           ShoppingCartSerializer, TagSerializer)
 
 
-class TagViewSet(ListRetrieveModelMixin):
+class TagViewSet(CatalogCacheMixin, ListRetrieveModelMixin):
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -30,98 +32,123 @@ class TagViewSet(ListRetrieveModelMixin):
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, )
 
 
-class IngredientViewSet(ListRetrieveModelMixin):
+class IngredientViewSet(CatalogCacheMixin, ListRetrieveModelMixin):
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, )
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-        name = self.request.query_params.get('name')
-        if name:
-            queryset = queryset.filter(name__startswith=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        # Подсказки зависят только от версии справочников, поэтому
+        # получают те же ETag, Last-Modified и 304, что и весь список.
+        return self.cached_response(
+            request, lambda: Response(get_ingredient_index().search(
+                name, limit=settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        )
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = PageLimitPagination
+    pagination_class = PageOrCursorPagination
     permission_classes = (IsAuthorOrReadOnlyPermission, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        # Связанные данные подгружаются только для рецептов,
+        # которых нет в кэше сериализованных тел.
+        return Recipe.objects.defer('search_vector')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in ('create', 'update', 'partial_update'):
+            check_request_size(request)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        schedule_normalize(serializer.instance, 'image')
+
+    def perform_update(self, serializer):
+        image = serializer.instance.image.name
+        super().perform_update(serializer)
+        if serializer.instance.image.name != image:
+            schedule_normalize(serializer.instance, 'image')
 
     @action(detail=True,
             permission_classes=(permissions.IsAuthenticatedOrReadOnly, ),
             url_path='get-link')
     def get_link(self, request, pk=None):
-        get_object_or_404(Recipe, id=pk)
-        long_url = request.build_absolute_uri(f'/api/recipes/{pk}/')
-        short_url = shorten_url(long_url, is_permanent=False)
-        return Response({'short-link': short_url})
-
+        if not pk.isdigit() or not shortlinks.recipe_exists(int(pk)):
+            raise Http404
+        code = shortlinks.make_code(int(pk))
+        return Response({'short-link': request.build_absolute_uri(
+            reverse('recipes:short-link', args=[code])
+        )})
+
+    @transaction.atomic
     def add_recipe(self, request, model, pk=None):
-        user = request.user
-        try:
-            recipe = Recipe.objects.get(
-                id=pk
-            )
-        except Recipe.DoesNotExist:
+        recipe_id = int(pk) if pk.isdigit() else None
+        if recipe_id and add_recipes(model, request.user.id, [recipe_id]):
+            recipe = Recipe.objects.defer('search_vector').get(id=recipe_id)
+            context = self.get_serializer_context()
+            if model == ShoppingCart:
+                data = ShoppingCartSerializer(
+                    ShoppingCart(user=request.user, recipe=recipe),
+                    context=context,
+                ).data
+            else:
+                data = CropRecipeSerializer(recipe, context=context).data
+            return Response(data, status=status.HTTP_201_CREATED)
+        if not recipe_id or not Recipe.objects.filter(id=recipe_id).exists():
             error_status = status.HTTP_404_NOT_FOUND if model == ShoppingCart\
                 else status.HTTP_400_BAD_REQUEST
             return Response(
                 status=error_status,
                 data={'errors': 'Указанного рецепта не существует'}
             )
-        if model.objects.filter(
-            recipe=recipe,
-            user=user
-        ).exists():
-            model_name = 'список покупок' if model == ShoppingCart\
-                else 'избранное'
-            return Response({'errors': f'Рецепт уже добавлен в {model_name}'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        obj = model.objects.create(
-            recipe=recipe,
-            user=user,
-        )
-        if model == ShoppingCart:
-            return Response(ShoppingCartSerializer(obj).data,
-                            status=status.HTTP_201_CREATED)
-
-        return Response(
-            data={
-                'id': recipe.id,
-                'name': recipe.name,
-                'cooking_time': recipe.cooking_time,
-                'image': base64.b64encode(recipe.image.read()).decode('utf-8')
-            },
-            status=status.HTTP_201_CREATED
-        )
+        model_name = 'список покупок' if model == ShoppingCart\
+            else 'избранное'
+        return Response({'errors': f'Рецепт уже добавлен в {model_name}'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def remove_recipe(self, request, model, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        instance = model.objects.filter(
-            recipe=recipe,
-            user=user
-        )
-        if instance.exists():
-            instance.delete()
+        recipe_id = int(pk) if pk.isdigit() else None
+        if recipe_id and remove_recipes(model, request.user.id, [recipe_id]):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        if not recipe_id or not Recipe.objects.filter(id=recipe_id).exists():
+            raise Http404
         model_name = 'список покупок' if model == ShoppingCart\
             else 'избранное'
         return Response(
             status=status.HTTP_400_BAD_REQUEST,
-            data={f'errors: Рецепт не был добавлен в {model_name}'}
+            data={'errors': f'Рецепт не был добавлен в {model_name}'}
         )
 
+    @transaction.atomic
+    def change_recipes(self, request, model):
+        """Добавляет или убирает пачку рецептов одним запросом к базе."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            key = 'added'
+            changed = add_recipes(model, request.user.id, recipe_ids)
+        else:
+            key = 'removed'
+            changed = remove_recipes(model, request.user.id, recipe_ids)
+        return Response({
+            key: changed,
+            'skipped': sorted(set(recipe_ids).difference(changed)),
+        })
+
     @action(
         methods=['POST'],
         detail=True,
@@ -134,32 +161,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_shopping_cart(self, request, pk=None):
         return self.remove_recipe(request, ShoppingCart, pk)
 
+    @action(methods=['POST', 'DELETE'], detail=False,
+            permission_classes=(IsAuthenticated, ),
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        return self.change_recipes(request, ShoppingCart)
+
+    @action(detail=False, permission_classes=(IsAuthenticated, ))
+    def feed(self, request):
+        """Свежие рецепты авторов из подписок, курсорная пагинация."""
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            feed_queryset(request.user), request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False,
             permission_classes=(IsAuthenticated, ),
             url_path='download_shopping_cart')
     def download_shoopping_cart(self, request):
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount'))
-
-        total_ingredients = defaultdict(int)
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            total_ingredients[f'{name} ({unit})'] += ingredient['total_amount']
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; \
-            filename="shopping_cart.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Ингредиент', 'Количество'])
-
-        for item in total_ingredients:
-            writer.writerow([item, total_ingredients[item]])
+        file_format = request.query_params.get('file_format',
+                                               exports.DEFAULT_FORMAT)
+        if file_format not in exports.FORMATS:
+            return Response(
+                {'errors': f'Неизвестный формат файла {file_format}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        content_type, render = exports.FORMATS[file_format]
+        key = exports.shopping_list_cache_key(request.user, file_format)
+        content = exports.cached_content(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                exports.stream_and_cache(
+                    key,
+                    render(exports.shopping_list_rows(request.user)),
+                    settings.SHOPPING_LIST_CACHE_TIMEOUT,
+                ),
+                content_type=content_type,
+            )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
         return response
 
     @action(methods=['POST'], detail=True,
@@ -170,3 +215,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @favorite.mapping.delete
     def del_favorite(self, request, pk=None):
         return self.remove_recipe(request, Favorite, pk)
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            permission_classes=(IsAuthenticated, ),
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        return self.change_recipes(request, Favorite)
+
+
+def short_link(request, code):
+    recipe_id = shortlinks.resolve_code(code)
+    if recipe_id is None or not shortlinks.recipe_exists(recipe_id):
+        raise Http404
+    return HttpResponseRedirect(f'/recipes/{recipe_id}')
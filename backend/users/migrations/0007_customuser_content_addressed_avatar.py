@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:44
+
+from django.db import migrations, models
+import foodgram.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_customuser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='avatar',
+            field=models.ImageField(default=None, storage=foodgram.storage.ContentAddressedStorage(), upload_to=foodgram.storage.content_path, verbose_name='Аватар'),
+        ),
+    ]
@@ -2,21 +2,31 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from foodgram.models import CounterFieldsMixin
+from foodgram.storage import content_path, image_storage
 
 
-class CustomUser(AbstractUser):
+class CustomUser(CounterFieldsMixin, AbstractUser):
     first_name = models.CharField(_('first name'), max_length=150, blank=True)
     last_name = models.CharField(_('last name'), max_length=150, blank=True)
     email = models.EmailField('Электронная почта', unique=True)
     avatar = models.ImageField(
-        upload_to='users/images/',
+        upload_to=content_path,
+        storage=image_storage,
         default=None,
         verbose_name="Аватар",
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username']
 
+    counter_fields = ('recipes_count',)
+
 
 User = get_user_model()
 
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
@@ -20,6 +21,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if not user or user.is_anonymous:
             return False
@@ -31,3 +34,11 @@ class AvatarSerializer(CustomUserSerializer):
     class Meta:
         model = User
         fields = ('avatar', )
+
+
+class AuthorIdsSerializer(serializers.Serializer):
+    authors = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATIONS_BULK_LIMIT,
+    )
@@ -1,8 +1,4 @@
-import base64
-import os
-
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
@@ -10,17 +6,21 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.paginations import PageLimitPagination
+from recipes.images import (check_request_size, receive_image,
+                            schedule_normalize)
+from recipes.models import Recipe
+from recipes.paginations import PageOrCursorPagination
+from recipes.relations import add_authors, remove_authors
 from recipes.serializers import FavoriteSerializer
 
 from .models import Subscribe
-from .serializers import AvatarSerializer
+from .serializers import AuthorIdsSerializer, AvatarSerializer
 
 User = get_user_model()
 
 
 class CustomUserViewSet(UserViewSet):
-    pagination_class = PageLimitPagination
+    pagination_class = PageOrCursorPagination
 
     def get_permissions(self):
         if self.action in ['retrieve', 'list']:
@@ -35,14 +35,12 @@ class CustomUserViewSet(UserViewSet):
     )
     def avatar(self, request):
         user = request.user
-        avatar_base64 = request.data.get('avatar')
-        if avatar_base64:
-            avatar_base64 = avatar_base64.split(",")[1]
-            avatar_data = base64.b64decode(avatar_base64)
-            avatar_file = ContentFile(avatar_data,
-                                      name=f'avatar{user.id}.png')
-            user.avatar.save(f'avatar{user.id}.png', avatar_file)
-            user.save()
+        check_request_size(request)
+        avatar = request.data.get('avatar')
+        if avatar:
+            user.avatar = receive_image(avatar)
+            user.save(update_fields=['avatar'])
+            schedule_normalize(user, 'avatar')
             return Response(
                 AvatarSerializer(user, context={'request': request}).data
             )
@@ -54,9 +52,8 @@ class CustomUserViewSet(UserViewSet):
     def del_avatar(self, request):
         user = request.user
         if user.avatar:
-            os.remove(user.avatar.path)
             user.avatar = None
-            user.save()
+            user.save(update_fields=['avatar'])
             return Response(status=204)
         else:
             return Response({"errors": "У вас нет аватара"}, status=400)
@@ -67,46 +64,41 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         follower = request.user
-        following = get_object_or_404(User, id=id)
+        following_id = int(id) if id.isdigit() else None
 
-        if follower == following:
+        if following_id == follower.id:
             return Response(
                 data={'errors': 'Вы не можете подписываться на самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if Subscribe.objects.filter(
-            follower=follower, following=following,
-        ).exists():
-            return Response(
-                data={'errors': 'Вы уже подписаны на этого пользователя'},
-                status=status.HTTP_400_BAD_REQUEST
+        if following_id and add_authors(follower.id, [following_id]):
+            subscribe = Subscribe(
+                follower=follower,
+                following=User.objects.get(id=following_id),
             )
-
-        subscribe = Subscribe.objects.create(
-            follower=follower,
-            following=following,
-        )
-        serializer = FavoriteSerializer(
-            subscribe,
-            context={'request': request},
+            serializer = FavoriteSerializer(
+                subscribe,
+                context={'request': request},
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        get_object_or_404(User, id=following_id)
+        return Response(
+            data={'errors': 'Вы уже подписаны на этого пользователя'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def del_subscribe(self, request, id=None):
         follower = request.user
-        following = get_object_or_404(User, id=id)
+        following_id = int(id) if id.isdigit() else None
 
-        subscribe = Subscribe.objects.filter(
-            follower=follower,
-            following=following,
-        )
-        if subscribe.exists:
-            subscribe.delete()
+        if following_id and remove_authors(follower.id, [following_id]):
             return Response(
                 status=status.HTTP_204_NO_CONTENT,
             )
-        error_code = 'Нельзя подписаться на себя' if follower == following \
+        get_object_or_404(User, id=following_id)
+        error_code = 'Нельзя подписаться на себя' \
+            if follower.id == following_id \
             else 'Вы не подписаны на пользователя'
         return Response(
             data={'errors': error_code},
@@ -117,11 +109,50 @@ class CustomUserViewSet(UserViewSet):
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         follower = request.user
-        queryset = Subscribe.objects.filter(follower=follower)
+        limit = request.query_params.get('recipes_limit')
+        try:
+            limit = max(int(limit), 0) if limit else None
+        except ValueError:
+            return Response(
+                data={'errors': 'recipes_limit должен быть числом'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = Subscribe.objects.filter(
+            follower=follower
+        ).select_related('following')
         pages = self.paginate_queryset(queryset)
         serializer = FavoriteSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context={
+                'request': request,
+                'recipes': Recipe.objects.previews_by_author(
+                    [subscribe.following_id for subscribe in pages], limit
+                ),
+            }
         )
         return self.get_paginated_response(serializer.data)
+
+    @subscriptions.mapping.post
+    def subscribe_many(self, request):
+        return self.change_subscriptions(request)
+
+    @subscriptions.mapping.delete
+    def unsubscribe_many(self, request):
+        return self.change_subscriptions(request)
+
+    def change_subscriptions(self, request):
+        """Подписывает на пачку авторов или отписывает от неё."""
+        serializer = AuthorIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        author_ids = serializer.validated_data['authors']
+        if request.method == 'POST':
+            key = 'added'
+            changed = add_authors(request.user.id, author_ids)
+        else:
+            key = 'removed'
+            changed = remove_authors(request.user.id, author_ids)
+        return Response({
+            key: changed,
+            'skipped': sorted(set(author_ids).difference(changed)),
+        })
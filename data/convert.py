@@ -1,27 +0,0 @@
-import json
-
-# Исходные данные
-original_data = [{"name": "абрикосовое варенье", "measurement_unit": "г"}, {"name": "абрикосовое пюре", "measurement_unit": "г"}, {"name": "абрикосовый джем", "measurement_unit": "г"}, {"name": "абрикосовый сок", "measurement_unit": "мл"}, {"name": "абрикосы", "measurement_unit": "г"}, {"name": "абрикосы консервированные", "measurement_unit": "г"}, {"name": "авокадо", "measurement_unit": "г"}, {"name": "агава сироп", "measurement_unit": "мл"}, {"name": "агар-агар", "measurement_unit": "г"}, {"name": "аграм", "measurement_unit": "г"}, {"name": "аджика", "measurement_unit": "г"}, {"name": "аджика зеленая", "measurement_unit": "г"}, {"name": "айва", "measurement_unit": "г"}, {"name": "айвовое пюре", "measurement_unit": "г"}, {"name": "айран", "measurement_unit": "г"}, {"name": "айсинг", "measurement_unit": "г"}, {"name": "акула стейки", "measurement_unit": "г"}, {"name": "алкоголь", "measurement_unit": "мл"}, {"name": "алкоголь крепкий", "measurement_unit": "мл"}, {"name": "алыча", "measurement_unit": "г"}, {"name": "альбухара", "measurement_unit": "шт."}, {"name": "альмехи", "measurement_unit": "г"}, {"name": "амарантовая мука", "measurement_unit": "г"}, {"name": "ананасовый сироп", "measurement_unit": "мл"}, {"name": "ананасовый сок", "measurement_unit": "мл"}, {"name": "ананасы", "measurement_unit": "г"}, {"name": "ананасы вяленые", "measurement_unit": "г"}, {"name": "ананасы консервированные", "measurement_unit": "г"}, {"name": "анис", "measurement_unit": "г"}, {"name": "анис звездочки", "measurement_unit": "г"}, {"name": "анисовый ликер", "measurement_unit": "мл"}, {"name": "анис семена", "measurement_unit": "г"}, {"name": "анчоусы", "measurement_unit": "г"}, {"name": "апельсиновая вода", "measurement_unit": "мл"}, {"name": "апельсиновая цедра", "measurement_unit": "г"}, {"name": "апельсиновая эссенция", "measurement_unit": "ч. л."}, {"name": "апельсиновое варенье", "measurement_unit": "г"}, {"name": "апельсиновые цукаты", "measurement_unit": "г"}, {"name": "апельсиновый джем", "measurement_unit": "г"}, {"name": "апельсиновый джем с имбирем", "measurement_unit": "г"}, {"name": "апельсиновый ликер", "measurement_unit": "мл"}, {"name": "апельсиновый сироп", "measurement_unit": "мл"}, {"name": "апельсиновый сок", "measurement_unit": "мл"}, {"name": "апельсиновый сок свежевыжатый", "measurement_unit": "мл"}, {"name": "апельсиновый уксус", "measurement_unit": "мл"}, {"name": "апельсиновый экстракт", "measurement_unit": "ч. л."}, {"name": "апельсины", "measurement_unit": "г"}, {"name": "апельсины красные", "measurement_unit": "шт."}, {"name": "апельсины крупные", "measurement_unit": "шт."}, {"name": "арахис", "measurement_unit": "г"}, {"name": "арахис жареный", "measurement_unit": "г"}, {"name": "арахисовая паста", "measurement_unit": "г"}, {"name": "арахисовое масло", "measurement_unit": "г"}, {"name": "арахис соленый", "measurement_unit": "г"}, {"name": "арбузная мякоть", "measurement_unit": "г"}, {"name": "арбузы", "measurement_unit": "г"}, {"name": "аргановое масло", "measurement_unit": "г"}, {"name": "аришта", "measurement_unit": "г"}, {"name": "ароматизатор", "measurement_unit": "г"}, {"name": "ароматизатор \"ананас\"", "measurement_unit": "капля"}, {"name": "ароматизатор \"вишня\"", "measurement_unit": "капля"}, {"name": "ароматизатор \"малина\"", "measurement_unit": "капля"}, {"name": "ароматизатор \"ром\"", "measurement_unit": "капля"}, {"name": "артишоки", "measurement_unit": "г"}, {"name": "артишоки в масле", "measurement_unit": "г"}, {"name": "артишоки маринованные", "measurement_unit": "г"}, {"name": "аспирин", "measurement_unit": "шт."}, {"name": "ассорти мясное", "measurement_unit": "г"}, {"name": "ассорти овощное", "measurement_unit": "г"}, {"name": "ассорти фруктовое", "measurement_unit": "г"}, {"name": "ассорти ягодное", "measurement_unit": "г"}, {"name": "аши", "measurement_unit": "г"}, {"name": "багет", "measurement_unit": "г"}, {"name": "багет вчерашний", "measurement_unit": "г"}, {"name": "багет мини", "measurement_unit": "г"}, {"name": "бадан", "measurement_unit": "г"}, {"name": "бадьян", "measurement_unit": "г"}, {"name": "базилик лимонный", "measurement_unit": "г"}, {"name": "базилик свежий", "measurement_unit": "г"}, {"name": "базилик сушеный", "measurement_unit": "г"}, {"name": "базилик тайский", "measurement_unit": "г"}, {"name": "базилик фиолетовый", "measurement_unit": "г"}, {"name": "баклажаны", "measurement_unit": "г"}, {"name": "баклажаны мини", "measurement_unit": "г"}, {"name": "баклажаны тайские", "measurement_unit": "г"}, {"name": "балык", "measurement_unit": "г"}, {"name": "бальзам", "measurement_unit": "г"}, {"name": "бальзамический крем", "measurement_unit": "г"}, {"name": "бальзамический соус", "measurement_unit": "мл"}, {"name": "бальзамический уксус", "measurement_unit": "мл"}, {"name": "бальзам рижский черный", "measurement_unit": "мл"}, {"name": "бамия", "measurement_unit": "г"}, {"name": "банановое пюре", "measurement_unit": "г"}, {"name": "банановые чипсы", "measurement_unit": "г"}, {"name": "банановый зеленый сироп", "measurement_unit": "мл"}, {"name": "банановый ликер", "measurement_unit": "мл"}, {"name": "бананы", "measurement_unit": "г"}, {"name": "бананы мини", "measurement_unit": "г"}, {"name": "барабулька", "measurement_unit": "г"}, {"name": "бараний ливер", "measurement_unit": "г"}, {"name": "бараний окорок на косточке", "measurement_unit": "г"}, {"name": "бараний фарш", "measurement_unit": "г"}, {"name": "баранина", "measurement_unit": "г"}, {"name": "баранки", "measurement_unit": "г"}, {"name": "бараньи антрекоты", "measurement_unit": "г"}, {"name": "бараньи голяшки", "measurement_unit": "шт."}, {"name": "бараньи потроха", "measurement_unit": "г"}, {"name": "бараньи ребрышки", "measurement_unit": "шт."}, {"name": "баранья лопатка", "measurement_unit": "г"}, {"name": "баранья нога", "measurement_unit": "г"}, {"name": "баранья печень", "measurement_unit": "г"}, {"name": "барбарис", "measurement_unit": "г"}, {"name": "барбарис вяленый", "measurement_unit": "ст. л."}, {"name": "барбарис молотый", "measurement_unit": "г"}, {"name": "бастурма", "measurement_unit": "г"}, {"name": "батат", "measurement_unit": "г"}, {"name": "батон", "measurement_unit": "г"}, {"name": "батончики шоколадные", "measurement_unit": "г"}, {"name": "безе", "measurement_unit": "г"}, {"name": "бекон", "measurement_unit": "г"}, {"name": "бекон варено-копченый", "measurement_unit": "г"}, {"name": "бекон сырокопченый", "measurement_unit": "г"}, {"name": "белорыбица", "measurement_unit": "г"}, {"name": "бирнель", "measurement_unit": "мл"}, {"name": "бисквик смесь готовая", "measurement_unit": "г"}, {"name": "бисквит", "measurement_unit": "г"}, {"name": "бисквитная крошка", "measurement_unit": "г"}, {"name": "бисквитный корж", "measurement_unit": "г"}, {"name": "бисквитный рулет", "measurement_unit": "г"}, {"name": "бисквит шоколадный", "measurement_unit": "г"}, {"name": "бифштекс", "measurement_unit": "шт."}, {"name": "блинная мука", "measurement_unit": "г"}, {"name": "блины готовые", "measurement_unit": "г"}, {"name": "блины овсяные", "measurement_unit": "шт."}, {"name": "бобовые ростки", "measurement_unit": "г"}, {"name": "бобы", "measurement_unit": "г"}, {"name": "бобы мунг пророщенные", "measurement_unit": "г"}, {"name": "бобы тонка", "measurement_unit": "шт."}, {"name": "ботарга", "measurement_unit": "г"}, {"name": "брезаола", "measurement_unit": "г"}, {"name": "бренди", "measurement_unit": "г"}, {"name": "брокколи замороженная", "measurement_unit": "г"}, {"name": "брокколи свежая", "measurement_unit": "г"}, {"name": "брусника замороженная", "measurement_unit": "г"}, {"name": "брусника свежая", "measurement_unit": "г"}, {"name": "брусника сушеная", "measurement_unit": "г"}, {"name": "брусничное варенье", "measurement_unit": "г"}, {"name": "брусничный соус", "measurement_unit": "г"}, {"name": "брынза", "measurement_unit": "г"}, {"name": "брынза сербская", "measurement_unit": "г"}, {"name": "брюква", "measurement_unit": "г"}, {"name": "буженина", "measurement_unit": "г"}, {"name": "бузина сироп", "measurement_unit": "мл"}, {"name": "букет гарни", "measurement_unit": "г"}, {"name": "булгур", "measurement_unit": "г"}, {"name": "булка", "measurement_unit": "г"}, {"name": "булка белая", "measurement_unit": "г"}, {"name": "булка сдобная", "measurement_unit": "г"}, {"name": "булочки", "measurement_unit": "г"}, {"name": "булочки белые черствые", "measurement_unit": "г"}, {"name": "булочки бриошь", "measurement_unit": "шт."}, {"name": "булочки вчерашние", "measurement_unit": "шт."}, {"name": "булочки для гамбургеров", "measurement_unit": "шт."}, {"name": "булочки зерновые", "measurement_unit": "шт."}, {"name": "булочки ржаные", "measurement_unit": "кусок"}, {"name": "булочки с кунжутом", "measurement_unit": "шт."}, {"name": "бульон", "measurement_unit": "мл"}, {"name": "бульонные кубики", "measurement_unit": "г"}, {"name": "бурбон", "measurement_unit": "мл"}, {"name": "Буррата", "measurement_unit": "г"}, {"name": "буряк", "measurement_unit": "г"}, {"name": "бусинки кондитерские", "measurement_unit": "ч. л."}, {"name": "бусинки кондитерские серебряные", "measurement_unit": "г"}, {"name": "бычий хвост", "measurement_unit": "г"}, {"name": "ванилин", "measurement_unit": "г"}, {"name": "ваниль в стручках", "measurement_unit": "г"}, {"name": "ванильная настойка", "measurement_unit": "мл"}, {"name": "ванильная эссенция", "measurement_unit": "г"}, {"name": "ванильный порошок", "measurement_unit": "г"}, {"name": "ванильный сироп", "measurement_unit": "мл"}, {"name": "ванильный экстракт", "measurement_unit": "г"}, {"name": "варенье", "measurement_unit": "г"}, {"name": "васаби", "measurement_unit": "г"}, {"name": "вафельная крошка", "measurement_unit": "г"}, {"name": "вафельные коржи", "measurement_unit": "г"}, {"name": "вафельные трубочки", "measurement_unit": "г"}, {"name": "вафли", "measurement_unit": "г"}, {"name": "вафли шоколадные", "measurement_unit": "г"}, {"name": "вермишель", "measurement_unit": "г"}, {"name": "вермишель яичная", "measurement_unit": "г"}, {"name": "вермут", "measurement_unit": "мл"}, {"name": "вермут белый", "measurement_unit": "мл"}, {"name": "вермут сухой", "measurement_unit": "мл"}, {"name": "ветчина", "measurement_unit": "г"}, {"name": "ветчина вареная", "measurement_unit": "г"}, {"name": "ветчина варено-копченая", "measurement_unit": "г"}, {"name": "ветчина копченая", "measurement_unit": "г"}, {"name": "ветчина пармская", "measurement_unit": "г"}, {"name": "ветчина сырокопченая", "measurement_unit": "г"}, {"name": "вешенки", "measurement_unit": "г"}, {"name": "винегрет", "measurement_unit": "г"}, {"name": "винный камень", "measurement_unit": "г"}, {"name": "винный уксус", "measurement_unit": "мл"}, {"name": "винный уксус белый", "measurement_unit": "мл"}, {"name": "винный уксус красный", "measurement_unit": "мл"}, {"name": "винный уксус на чесноке", "measurement_unit": "мл"}, {"name": "винный уксус на эстрагоне", "measurement_unit": "мл"}, {"name": "вино белое", "measurement_unit": "мл"}, {"name": "вино белое полусладкое", "measurement_unit": "мл"}, {"name": "вино белое полусухое", "measurement_unit": "мл"}, {"name": "вино белое сладкое", "measurement_unit": "мл"}, {"name": "вино белое столовое", "measurement_unit": "мл"}, {"name": "вино белое сухое", "measurement_unit": "мл"}, {"name": "виноград", "measurement_unit": "г"}, {"name": "виноград без косточек", "measurement_unit": "г"}, {"name": "виноград белый", "measurement_unit": "г"}, {"name": "виноград изабелла", "measurement_unit": "г"}, {"name": "виноградное желе", "measurement_unit": "г"}, {"name": "виноградные листья", "measurement_unit": "г"}, {"name": "виноградные листья маринованные", "measurement_unit": "г"}, {"name": "виноградные листья молодые", "measurement_unit": "шт."}, {"name": "виноградный сок", "measurement_unit": "мл"}, {"name": "виноградный сок осветленный", "measurement_unit": "мл"}, {"name": "виноград синий", "measurement_unit": "г"}, {"name": "виноград черный", "measurement_unit": "г"}, {"name": "вино десертное", "measurement_unit": "мл"}, {"name": "вино игристое сухое", "measurement_unit": "мл"}, {"name": "вино красное", "measurement_unit": "мл"}, {"name": "вино красное полусладкое", "measurement_unit": "мл"}, {"name": "вино красное полусухое", "measurement_unit": "мл"}, {"name": "вино красное сладкое", "measurement_unit": "мл"}, {"name": "вино красное сухое", "measurement_unit": "мл"}, {"name": "вино крепленое", "measurement_unit": "мл"}, {"name": "вино розовое полусладкое", "measurement_unit": "мл"}, {"name": "вино розовое полусухое", "measurement_unit": "мл"}, {"name": "виски", "measurement_unit": "мл"}, {"name": "витамин C в порошке", "measurement_unit": "г"}, {"name": "вишневая настойка", "measurement_unit": "мл"}, {"name": "вишневое варенье", "measurement_unit": "г"}, {"name": "вишневые листья", "measurement_unit": "г"}, {"name": "вишневый джем", "measurement_unit": "г"}, {"name": "вишневый ликер", "measurement_unit": "мл"}, {"name": "вишневый сироп", "measurement_unit": "мл"}, {"name": "вишневый сок", "measurement_unit": "мл"}, {"name": "вишня", "measurement_unit": "г"}, {"name": "вишня вяленая", "measurement_unit": "г"}, {"name": "вишня замороженная", "measurement_unit": "г"}, {"name": "вишня засахаренная кондитерская", "measurement_unit": "шт."}, {"name": "вишня коктейльная", "measurement_unit": "г"}, {"name": "вишня мараскино", "measurement_unit": "г"}, {"name": "вишня, протертая с сахаром", "measurement_unit": "г"}, {"name": "вода", "measurement_unit": "мл"}, {"name": "вода минеральная без газа", "measurement_unit": "мл"}, {"name": "вода минеральная газированная", "measurement_unit": "мл"}, {"name": "водка", "measurement_unit": "мл"}, {"name": "водка анисовая", "measurement_unit": "мл"}, {"name": "водоросли", "measurement_unit": "г"}, {"name": "вустерширский соус", "measurement_unit": "мл"}, {"name": "галангал корень", "measurement_unit": "г"}, {"name": "галеты", "measurement_unit": "г"}, {"name": "гамбургер", "measurement_unit": "г"}, {"name": "ганаш", "measurement_unit": "г"}, {"name": "гарам масала", "measurement_unit": "г"}, {"name": "гарнир", "measurement_unit": "г"}, {"name": "гаспачо", "measurement_unit": "г"}, {"name": "гвоздика", "measurement_unit": "г"}, {"name": "гвоздика молотая", "measurement_unit": "г"}, {"name": "герань листья", "measurement_unit": "г"}, {"name": "геркулес", "measurement_unit": "г"}, {"name": "глазурь", "measurement_unit": "г"}, {"name": "глазурь белая", "measurement_unit": "г"}, {"name": "глазурь готовая", "measurement_unit": "г"}, {"name": "глазурь черная", "measurement_unit": "г"}, {"name": "глазурь шоколадная белая", "measurement_unit": "г"}, {"name": "глутамат натрия", "measurement_unit": "г"}, {"name": "глюкоза", "measurement_unit": "г"}, {"name": "глюкоза сироп", "measurement_unit": "мл"}, {"name": "говядина", "measurement_unit": "г"}, {"name": "говядина на кости", "measurement_unit": "г"}, {"name": "говяжий фарш", "measurement_unit": "г"}, {"name": "говяжий язык", "measurement_unit": "г"}, {"name": "говяжье сердце", "measurement_unit": "г"}, {"name": "говяжьи бифштексы", "measurement_unit": "г"}, {"name": "говяжьи голяшки", "measurement_unit": "г"}, {"name": "говяжьи легкие", "measurement_unit": "г"}, {"name": "говяжьи ребра", "measurement_unit": "г"}, {"name": "говяжьи стейки рибай", "measurement_unit": "г"}, {"name": "говяжья вырезка", "measurement_unit": "шт."}, {"name": "говяжья грудинка", "measurement_unit": "г"}, {"name": "говяжья лопатка", "measurement_unit": "г"}, {"name": "говяжья мозговая кость", "measurement_unit": "шт."}, {"name": "говяжья мякоть", "measurement_unit": "г"}, {"name": "говяжья печень", "measurement_unit": "г"}, {"name": "говяжья черева", "measurement_unit": "г"}, {"name": "говяжья шейка", "measurement_unit": "г"}, {"name": "годжи", "measurement_unit": "г"}, {"name": "голец филе", "measurement_unit": "г"}, {"name": "голубика", "measurement_unit": "г"}, {"name": "голубика замороженная", "measurement_unit": "г"}, {"name": "голубь", "measurement_unit": "г"}, {"name": "горбуша", "measurement_unit": "г"}, {"name": "горбуша в собственном соку", "measurement_unit": "банка"}, {"name": "горбуша филе", "measurement_unit": "г"}, {"name": "горгонзола", "measurement_unit": "г"}, {"name": "горгонзола пиканте", "measurement_unit": "г"}, {"name": "горох", "measurement_unit": "г"}, {"name": "горох колотый", "measurement_unit": "г"}, {"name": "гороховые ростки", "measurement_unit": "г"}, {"name": "гороховый суп", "measurement_unit": "мл"}, {"name": "горошек зеленый", "measurement_unit": "г"}, {"name": "горошек зеленый замороженный", "measurement_unit": "г"}, {"name": "горошек зеленый консервированный", "measurement_unit": "г"}, {"name": "горошек стручковый свежий", "measurement_unit": "г"}, {"name": "горчица", "measurement_unit": "г"}, {"name": "горчица дижонская", "measurement_unit": "г"}, {"name": "горчица дижонская с медом", "measurement_unit": "г"}, {"name": "горчица желтая семена", "measurement_unit": "г"}, {"name": "горчица острая", "measurement_unit": "г"}, {"name": "горчица русская", "measurement_unit": "г"}, {"name": "горчица семена", "measurement_unit": "г"}, {"name": "горчица с зернами", "measurement_unit": "г"}, {"name": "горчица сухая", "measurement_unit": "г"}, {"name": "горчица французская", "measurement_unit": "г"}, {"name": "горчица цитрусовая", "measurement_unit": "г"}, {"name": "горчичное масло", "measurement_unit": "мл"}, {"name": "горчичный порошок", "measurement_unit": "г"}, {"name": "грана падано", "measurement_unit": "г"}, {"name": "гранатные зерна", "measurement_unit": "г"}, {"name": "гранатовая паста", "measurement_unit": "г"}, {"name": "гранатовый сироп", "measurement_unit": "мл"}, {"name": "гранатовый сок", "measurement_unit": "мл"}, {"name": "гранатовый сок свежевыжатый", "measurement_unit": "мл"}, {"name": "гранатовый соус", "measurement_unit": "мл"}, {"name": "гранаты", "measurement_unit": "г"}, {"name": "гранита", "measurement_unit": "г"}, {"name": "гранола с орехами", "measurement_unit": "г"}, {"name": "граппа", "measurement_unit": "г"}, {"name": "гратен", "measurement_unit": "г"}, {"name": "грейпфрутовая цедра", "measurement_unit": "г"}, {"name": "грейпфрутовый сок", "measurement_unit": "г"}, {"name": "грейпфруты", "measurement_unit": "г"}, {"name": "грейпфруты розовые", "measurement_unit": "г"}, {"name": "гренадин", "measurement_unit": "г"}, {"name": "гренки", "measurement_unit": "г"}, {"name": "грецкие орехи", "measurement_unit": "г"}, {"name": "грецкие орехи рубленые", "measurement_unit": "г"}, {"name": "гречневая крупа", "measurement_unit": "г"}, {"name": "гречневая крупа зеленая", "measurement_unit": "г"}, {"name": "гречневая лапша соба", "measurement_unit": "г"}, {"name": "гречневая мука", "measurement_unit": "г"}, {"name": "гречневое молоко", "measurement_unit": "мл"}, {"name": "гречневые хлопья", "measurement_unit": "г"}, {"name": "грибы", "measurement_unit": "г"}, {"name": "грибы белые", "measurement_unit": "г"}, {"name": "грибы белые замороженные", "measurement_unit": "г"}, {"name": "грибы белые маринованные", "measurement_unit": "г"}, {"name": "грибы белые сухие", "measurement_unit": "г"}, {"name": "грибы замороженные", "measurement_unit": "г"}, {"name": "грибы замороженные (опята и маслята)", "measurement_unit": "г"}, {"name": "грибы лесные", "measurement_unit": "г"}, {"name": "грибы маринованные", "measurement_unit": "г"}, {"name": "грибы свежие", "measurement_unit": "г"}, {"name": "грибы соленые", "measurement_unit": "г"}, {"name": "грибы соломенные консервированные", "measurement_unit": "г"}, {"name": "грибы сухие", "measurement_unit": "г"}, {"name": "грибы шиитаке", "measurement_unit": "г"}, {"name": "грибы шиитаке сухие", "measurement_unit": "г"}, {"name": "гриль", "measurement_unit": "г"}, {"name": "гриссини", "measurement_unit": "г"}, {"name": "грудинка", "measurement_unit": "г"}, {"name": "грудинка варено-копченая", "measurement_unit": "г"}, {"name": "грудинка копченая", "measurement_unit": "г"}, {"name": "грушевое пюре", "measurement_unit": "г"}, {"name": "грушевый ликер", "measurement_unit": "мл"}, {"name": "грушевый сироп", "measurement_unit": "мл"}, {"name": "грушевый сок", "measurement_unit": "мл"}, {"name": "грушевый уксус", "measurement_unit": "мл"}, {"name": "груши", "measurement_unit": "г"}, {"name": "груши вяленые", "measurement_unit": "г"}, {"name": "грюйер", "measurement_unit": "г"}, {"name": "гуава", "measurement_unit": "г"}, {"name": "гуанчиале", "measurement_unit": "г"}, {"name": "гурьевская каша", "measurement_unit": "г"}, {"name": "гусиная грудка копченая", "measurement_unit": "г"}, {"name": "гусиная печень", "measurement_unit": "г"}, {"name": "гусиный жир", "measurement_unit": "ст. л."}, {"name": "гусь", "measurement_unit": "г"}, {"name": "гусь тушка", "measurement_unit": "г"}, {"name": "дайкон", "measurement_unit": "г"}, {"name": "детское питание", "measurement_unit": "г"}, {"name": "джем", "measurement_unit": "г"}, {"name": "джин", "measurement_unit": "мл"}, {"name": "джусай", "measurement_unit": "г"}, {"name": "диоксид титана", "measurement_unit": "г"}, {"name": "долма", "measurement_unit": "г"}, {"name": "дорада", "measurement_unit": "г"}, {"name": "дорада потрошеная с головой", "measurement_unit": "г"}, {"name": "дорада с головой", "measurement_unit": "г"}, {"name": "дорада тушка", "measurement_unit": "г"}, {"name": "драже", "measurement_unit": "г"}, {"name": "дрожжи домашние", "measurement_unit": "г"}, {"name": "дрожжи свежие", "measurement_unit": "г"}, {"name": "дрожжи сухие", "measurement_unit": "г"}, {"name": "дубовая кора", "measurement_unit": "г"}, {"name": "душица", "measurement_unit": "г"}, {"name": "дыня", "measurement_unit": "г"}, {"name": "ежевика", "measurement_unit": "г"}, {"name": "ежевика замороженная", "measurement_unit": "г"}, {"name": "ёрш", "measurement_unit": "г"}, {"name": "ёрш-носарь", "measurement_unit": "г"}, {"name": "желатин", "measurement_unit": "г"}, {"name": "желатин листовой", "measurement_unit": "г"}, {"name": "желе", "measurement_unit": "г"}, {"name": "желе для торта", "measurement_unit": "г"}, {"name": "желирующее вещество", "measurement_unit": "г"}, {"name": "желирующий сахар", "measurement_unit": "г"}, {"name": "женьшень", "measurement_unit": "г"}, {"name": "жидкий дым", "measurement_unit": "мл"}, {"name": "жимолость", "measurement_unit": "г"}, {"name": "жир", "measurement_unit": "г"}, {"name": "жир вытопленный", "measurement_unit": "г"}, {"name": "жир кулинарный", "measurement_unit": "г"}, {"name": "жир растительный", "measurement_unit": "г"}, {"name": "заатар", "measurement_unit": "г"}, {"name": "завтрак сухой", "measurement_unit": "г"}, {"name": "завтрак сухой подушечки", "measurement_unit": "г"}, {"name": "загуститель для сливок", "measurement_unit": "г"}, {"name": "зайчатина", "measurement_unit": "г"}, {"name": "закваска", "measurement_unit": "г"}, {"name": "закваска вечная", "measurement_unit": "г"}, {"name": "заменитель сахара", "measurement_unit": "г"}, {"name": "заменитель сахара стевия", "measurement_unit": "г"}, {"name": "заправка для салатов готовая", "measurement_unit": "г"}, {"name": "зверобой", "measurement_unit": "г"}, {"name": "зелень", "measurement_unit": "г"}, {"name": "зелень рубленая", "measurement_unit": "г"}, {"name": "земляника", "measurement_unit": "г"}, {"name": "земляника замороженная", "measurement_unit": "г"}, {"name": "зефир", "measurement_unit": "г"}, {"name": "зира", "measurement_unit": "г"}, {"name": "злаковые хлопья", "measurement_unit": "г"}, {"name": "зубатка", "measurement_unit": "г"}, {"name": "зубатка филе", "measurement_unit": "г"}, {"name": "изолят соевого протеина", "measurement_unit": "г"}, {"name": "изюм", "measurement_unit": "г"}, {"name": "изюм без косточек", "measurement_unit": "г"}, {"name": "изюм белый", "measurement_unit": "г"}, {"name": "изюм черный", "measurement_unit": "г"}, {"name": "икра", "measurement_unit": "г"}, {"name": "икра вяленой рыбы", "measurement_unit": "г"}, {"name": "икра горбуши зернистая", "measurement_unit": "г"}, {"name": "икра красная", "measurement_unit": "г"}, {"name": "икра красной рыбы мелкая", "measurement_unit": "г"}, {"name": "икра летучей рыбы", "measurement_unit": "г"}, {"name": "икра лосося", "measurement_unit": "г"}, {"name": "икра мойвы", "measurement_unit": "г"}, {"name": "икра палтуса", "measurement_unit": "г"}, {"name": "икра судака", "measurement_unit": "г"}, {"name": "икра черная", "measurement_unit": "г"}, {"name": "имбирное варенье", "measurement_unit": "г"}, {"name": "имбирное печенье", "measurement_unit": "г"}, {"name": "имбирные цукаты", "measurement_unit": "г"}, {"name": "имбирь", "measurement_unit": "г"}, {"name": "имбирь засахаренный", "measurement_unit": "г"}, {"name": "имбирь корень", "measurement_unit": "г"}, {"name": "имбирь маринованный", "measurement_unit": "г"}, {"name": "имбирь молотый", "measurement_unit": "г"}, {"name": "индейка", "measurement_unit": "г"}, {"name": "индейка голень", "measurement_unit": "г"}, {"name": "индейка грудка", "measurement_unit": "г"}, {"name": "индейка копченая", "measurement_unit": "г"}, {"name": "индейка тушка", "measurement_unit": "шт."}, {"name": "индейка фарш", "measurement_unit": "г"}, {"name": "индейка филе", "measurement_unit": "г"}, {"name": "индоутка", "measurement_unit": "шт."}, {"name": "индюшачья печень", "measurement_unit": "г"}, {"name": "инжир", "measurement_unit": "г"}, {"name": "инжир свежий", "measurement_unit": "г"}, {"name": "инжир сушеный", "measurement_unit": "г"}, {"name": "ирга", "measurement_unit": "г"}, {"name": "ириски", "measurement_unit": "г"}, {"name": "итальянские травы", "measurement_unit": "г"}, {"name": "йогурт", "measurement_unit": "г"}, {"name": "йогурт греческий", "measurement_unit": "г"}, {"name": "йогурт жирный", "measurement_unit": "г"}, {"name": "йогурт козий", "measurement_unit": "г"}, {"name": "йогурт натуральный", "measurement_unit": "г"}, {"name": "йогурт нежирный", "measurement_unit": "г"}, {"name": "йогурт обезжиренный", "measurement_unit": "г"}, {"name": "йогурт фруктовый", "measurement_unit": "г"}, {"name": "кабачки", "measurement_unit": "г"}, {"name": "кабачки замороженные", "measurement_unit": "г"}, {"name": "кабачки молодые", "measurement_unit": "г"}, {"name": "каджунская смесь специй", "measurement_unit": "г"}, {"name": "какао", "measurement_unit": "г"}, {"name": "какао-бобы", "measurement_unit": "г"}, {"name": "какао-масло", "measurement_unit": "г"}, {"name": "какао-порошок", "measurement_unit": "г"}, {"name": "какао-порошок обезжиренный", "measurement_unit": "г"}, {"name": "какао сгущенное", "measurement_unit": "г"}, {"name": "калина", "measurement_unit": "г"}, {"name": "калина протертая", "measurement_unit": "г"}, {"name": "калинджи семена", "measurement_unit": "ч. л."}, {"name": "кальвадос", "measurement_unit": "г"}, {"name": "кальмары", "measurement_unit": "г"}, {"name": "кальмары вареные", "measurement_unit": "г"}, {"name": "кальмары замороженные", "measurement_unit": "г"}, {"name": "кальмары консервированные", "measurement_unit": "г"}, {"name": "кальмары филе", "measurement_unit": "г"}, {"name": "камамбер", "measurement_unit": "г"}, {"name": "камбала", "measurement_unit": "г"}, {"name": "камбала филе", "measurement_unit": "г"}, {"name": "кампари", "measurement_unit": "мл"}, {"name": "кандурин золотой", "measurement_unit": "ч. л."}, {"name": "каннеллони", "measurement_unit": "г"}, {"name": "капеллини", "measurement_unit": "г"}, {"name": "каперсы", "measurement_unit": "г"}, {"name": "каперсы в винном уксусе", "measurement_unit": "г"}, {"name": "каперсы маринованные", "measurement_unit": "г"}, {"name": "капуста белокочанная", "measurement_unit": "г"}, {"name": "капуста брюссельская", "measurement_unit": "г"}, {"name": "капуста брюссельская замороженная", "measurement_unit": "г"}, {"name": "капуста кале", "measurement_unit": "г"}, {"name": "капуста квашеная", "measurement_unit": "г"}, {"name": "капуста кольраби", "measurement_unit": "г"}, {"name": "капуста краснокочанная", "measurement_unit": "г"}, {"name": "капуста морская", "measurement_unit": "г"}, {"name": "капуста морская замороженная", "measurement_unit": "г"}, {"name": "капуста морская сушеная", "measurement_unit": "г"}, {"name": "капуста пекинская", "measurement_unit": "г"}, {"name": "капуста савойская", "measurement_unit": "г"}, {"name": "капуста цветная", "measurement_unit": "г"}, {"name": "капуста цветная замороженная", "measurement_unit": "г"}, {"name": "капустный рассол", "measurement_unit": "г"}, {"name": "капучино", "measurement_unit": "г"}, {"name": "каракатица", "measurement_unit": "г"}, {"name": "каракатица очищенная", "measurement_unit": "г"}, {"name": "карамбола", "measurement_unit": "г"}, {"name": "карамель", "measurement_unit": "г"}, {"name": "карамельный соус", "measurement_unit": "г"}, {"name": "карамель с начинкой", "measurement_unit": "г"}, {"name": "карамель соленая", "measurement_unit": "г"}, {"name": "карась", "measurement_unit": "г"}, {"name": "карбонад", "measurement_unit": "г"}, {"name": "кардамон", "measurement_unit": "г"}, {"name": "кардамон зерна", "measurement_unit": "г"}, {"name": "кардамон молотый", "measurement_unit": "г"}, {"name": "кардамон стручки", "measurement_unit": "г"}, {"name": "каркаде", "measurement_unit": "г"}, {"name": "карп", "measurement_unit": "г"}, {"name": "карп зеркальный", "measurement_unit": "г"}, {"name": "карп филе", "measurement_unit": "г"}, {"name": "карри", "measurement_unit": "г"}, {"name": "карри листья", "measurement_unit": "г"}, {"name": "карри паста", "measurement_unit": "г"}, {"name": "картофель", "measurement_unit": "г"}, {"name": "картофель вареный", "measurement_unit": "г"}, {"name": "картофель вареный в мундире", "measurement_unit": "г"}, {"name": "картофель молодой", "measurement_unit": "г"}, {"name": "картофельное пюре", "measurement_unit": "г"}, {"name": "картофельные ньокки", "measurement_unit": "г"}, {"name": "картофельные хлопья", "measurement_unit": "г"}, {"name": "картофельные чипсы", "measurement_unit": "г"}, {"name": "картофельный крахмал", "measurement_unit": "г"}, {"name": "картофельный отвар", "measurement_unit": "г"}, {"name": "картофельный хэш замороженный", "measurement_unit": "г"}, {"name": "картофель печеный", "measurement_unit": "г"}, {"name": "катык", "measurement_unit": "г"}, {"name": "каффир-лайм листья", "measurement_unit": "г"}, {"name": "каша", "measurement_unit": "г"}, {"name": "каша для детского питания", "measurement_unit": "г"}, {"name": "каштановая мука", "measurement_unit": "г"}, {"name": "каштановый крем", "measurement_unit": "г"}, {"name": "каштаны", "measurement_unit": "г"}, {"name": "каштаны вареные", "measurement_unit": "г"}, {"name": "каштаны консервированные", "measurement_unit": "г"}, {"name": "каштаны очищенные", "measurement_unit": "г"}, {"name": "квас", "measurement_unit": "г"}, {"name": "квасное сусло", "measurement_unit": "г"}, {"name": "квасной концентрат сухой", "measurement_unit": "г"}, {"name": "квас хлебный", "measurement_unit": "г"}, {"name": "кедровая мука", "measurement_unit": "г"}, {"name": "кедровые орехи", "measurement_unit": "г"}, {"name": "кедровые орехи жареные", "measurement_unit": "г"}, {"name": "кета", "measurement_unit": "г"}, {"name": "кетчуп острый", "measurement_unit": "г"}, {"name": "кетчуп томатный", "measurement_unit": "г"}, {"name": "кетчуп тосканский", "measurement_unit": "г"}, {"name": "кетчуп шашлычный", "measurement_unit": "г"}, {"name": "кефаль", "measurement_unit": "г"}, {"name": "кефир", "measurement_unit": "мл"}, {"name": "кефир 1%", "measurement_unit": "мл"}, {"name": "кефир 2,5%", "measurement_unit": "мл"}, {"name": "кефир 3,2%", "measurement_unit": "мл"}, {"name": "кефир обезжиренный", "measurement_unit": "мл"}, {"name": "кешью", "measurement_unit": "г"}, {"name": "кивано", "measurement_unit": "г"}, {"name": "киви", "measurement_unit": "г"}, {"name": "киви желе", "measurement_unit": "г"}, {"name": "кижуч", "measurement_unit": "г"}, {"name": "кижуч горячего копчения филе", "measurement_unit": "г"}, {"name": "кизил", "measurement_unit": "г"}, {"name": "килька", "measurement_unit": "г"}, {"name": "кимчи", "measurement_unit": "г"}, {"name": "кинза свежая", "measurement_unit": "г"}, {"name": "кинза сушеная", "measurement_unit": "г"}, {"name": "киноа", "measurement_unit": "г"}, {"name": "киноа молотая", "measurement_unit": "г"}, {"name": "кипяток", "measurement_unit": "мл"}, {"name": "кирш", "measurement_unit": "г"}, {"name": "кисель", "measurement_unit": "г"}, {"name": "кисель сухой", "measurement_unit": "г"}, {"name": "кисломолочный напиток Тан", "measurement_unit": "мл"}, {"name": "кишки", "measurement_unit": "г"}, {"name": "клейковина", "measurement_unit": "г"}, {"name": "клементины", "measurement_unit": "г"}, {"name": "кленовый сироп", "measurement_unit": "мл"}, {"name": "клубника", "measurement_unit": "г"}, {"name": "клубника в сиропе", "measurement_unit": "г"}, {"name": "клубника замороженная", "measurement_unit": "г"}, {"name": "клубника, протертая с сахаром", "measurement_unit": "г"}, {"name": "клубника сушеная", "measurement_unit": "г"}, {"name": "клубничное варенье", "measurement_unit": "г"}, {"name": "клубничное желе", "measurement_unit": "г"}, {"name": "клубничное пюре", "measurement_unit": "г"}, {"name": "клубничный джем", "measurement_unit": "г"}, {"name": "клубничный джем густой", "measurement_unit": "г"}, {"name": "клубничный компот", "measurement_unit": "мл"}, {"name": "клубничный ликер", "measurement_unit": "мл"}, {"name": "клубничный сироп", "measurement_unit": "мл"}, {"name": "клюква", "measurement_unit": "г"}, {"name": "клюква вяленая", "measurement_unit": "г"}, {"name": "клюква замороженная", "measurement_unit": "г"}, {"name": "клюква, протертая с сахаром", "measurement_unit": "г"}, {"name": "клюквенное варенье", "measurement_unit": "г"}, {"name": "клюквенный джем", "measurement_unit": "г"}, {"name": "клюквенный морс", "measurement_unit": "мл"}, {"name": "клюквенный сироп", "measurement_unit": "мл"}, {"name": "клюквенный соус", "measurement_unit": "г"}, {"name": "козлиная печень", "measurement_unit": "г"}, {"name": "козлятина молодая", "measurement_unit": "г"}, {"name": "кока-кола", "measurement_unit": "мл"}, {"name": "кокосовая вода", "measurement_unit": "мл"}, {"name": "кокосовая мука", "measurement_unit": "г"}, {"name": "кокосовая стружка", "measurement_unit": "г"}, {"name": "кокосовая стружка цветная", "measurement_unit": "г"}, {"name": "кокосовое масло", "measurement_unit": "мл"}, {"name": "кокосовое молоко", "measurement_unit": "мл"}, {"name": "кокосовые сливки", "measurement_unit": "мл"}, {"name": "кокосовый ликер", "measurement_unit": "мл"}, {"name": "кокосовый экстракт", "measurement_unit": "мл"}, {"name": "кокосы", "measurement_unit": "г"}, {"name": "кола", "measurement_unit": "мл"}, {"name": "колбаса", "measurement_unit": "г"}, {"name": "колбаса вареная", "measurement_unit": "г"}, {"name": "колбаса варено-копченая", "measurement_unit": "г"}, {"name": "колбаса копченая", "measurement_unit": "г"}, {"name": "колбаса кровяная", "measurement_unit": "г"}, {"name": "колбаса полукопченая", "measurement_unit": "г"}, {"name": "колбаса сырокопченая", "measurement_unit": "г"}, {"name": "колбаска свиная свежая (salsiccia)", "measurement_unit": "г"}, {"name": "колбаски", "measurement_unit": "г"}, {"name": "колбаски для жарки", "measurement_unit": "г"}, {"name": "колбаски домашние", "measurement_unit": "г"}, {"name": "колбаски охотничьи", "measurement_unit": "г"}, {"name": "колбаски сырокопченые", "measurement_unit": "г"}, {"name": "компот", "measurement_unit": "г"}, {"name": "конопляное масло", "measurement_unit": "мл"}, {"name": "конопля семена", "measurement_unit": "г"}, {"name": "конфеты", "measurement_unit": "г"}, {"name": "конфеты M&M’s", "measurement_unit": "г"}, {"name": "конфеты жевательные лакричные", "measurement_unit": "г"}, {"name": "конфеты Коровка", "measurement_unit": "г"}, {"name": "конфеты Трюфель", "measurement_unit": "г"}, {"name": "конфитюр", "measurement_unit": "г"}, {"name": "конфитюрка", "measurement_unit": "г"}, {"name": "коньяк", "measurement_unit": "мл"}, {"name": "копчености", "measurement_unit": "г"}, {"name": "коренья", "measurement_unit": "г"}, {"name": "кориандр", "measurement_unit": "г"}, {"name": "кориандр зелень", "measurement_unit": "г"}, {"name": "кориандр молотый", "measurement_unit": "г"}, {"name": "кориандр семена", "measurement_unit": "г"}, {"name": "коринка", "measurement_unit": "г"}, {"name": "корица", "measurement_unit": "г"}, {"name": "корица молотая", "measurement_unit": "г"}, {"name": "корнишоны", "measurement_unit": "г"}, {"name": "корнишоны маринованые", "measurement_unit": "г"}, {"name": "корюшка", "measurement_unit": "г"}, {"name": "корюшка горячего копчения", "measurement_unit": "г"}, {"name": "кости", "measurement_unit": "г"}, {"name": "кости мозговые", "measurement_unit": "г"}, {"name": "кость сахарная", "measurement_unit": "г"}, {"name": "кофе в зернах", "measurement_unit": "г"}, {"name": "кофе зеленый", "measurement_unit": "г"}, {"name": "кофейные зерна в шоколаде", "measurement_unit": "г"}, {"name": "кофейный ликер", "measurement_unit": "мл"}, {"name": "кофейный ликер Kahlua", "measurement_unit": "мл"}, {"name": "кофейный напиток", "measurement_unit": "мл"}, {"name": "кофейный сироп", "measurement_unit": "мл"}, {"name": "кофейный экстракт", "measurement_unit": "мл"}, {"name": "кофе молотый", "measurement_unit": "г"}, {"name": "кофе растворимый", "measurement_unit": "г"}, {"name": "кофе свежесваренный", "measurement_unit": "мл"}, {"name": "кофе черный", "measurement_unit": "мл"}, {"name": "кофе эспрессо", "measurement_unit": "мл"}, {"name": "крабовое мясо", "measurement_unit": "г"}, {"name": "крабовые палочки", "measurement_unit": "г"}, {"name": "краб снежный", "measurement_unit": "г"}, {"name": "крабы", "measurement_unit": "г"}, {"name": "крапива", "measurement_unit": "г"}, {"name": "краситель-гель пищевой", "measurement_unit": "г"}, {"name": "краситель пищевой", "measurement_unit": "г"}, {"name": "краситель пищевой вишневый", "measurement_unit": "г"}, {"name": "краситель пищевой желтый", "measurement_unit": "г"}, {"name": "краситель пищевой зеленый", "measurement_unit": "г"}, {"name": "краситель пищевой красный", "measurement_unit": "г"}, {"name": "краситель пищевой оранжевый", "measurement_unit": "г"}, {"name": "краситель пищевой фиолетовый", "measurement_unit": "г"}, {"name": "краситель пищевой черный", "measurement_unit": "г"}, {"name": "красная смородина", "measurement_unit": "г"}, {"name": "красная смородина, протертая с сахаром", "measurement_unit": "г"}, {"name": "красноперка", "measurement_unit": "г"}, {"name": "красносмородиновое варенье", "measurement_unit": "г"}, {"name": "красный винный соус", "measurement_unit": "г"}, {"name": "крахмал", "measurement_unit": "г"}, {"name": "креветки", "measurement_unit": "г"}, {"name": "креветки замороженные", "measurement_unit": "г"}, {"name": "креветки королевские", "measurement_unit": "г"}, {"name": "креветки очищенные", "measurement_unit": "г"}, {"name": "креветки очищенные в рассоле", "measurement_unit": "г"}, {"name": "креветки салатные", "measurement_unit": "г"}, {"name": "креветки сушеные", "measurement_unit": "г"}, {"name": "креветки тигровые", "measurement_unit": "г"}, {"name": "крекер", "measurement_unit": "г"}, {"name": "крекер соленый", "measurement_unit": "г"}, {"name": "крем заварной", "measurement_unit": "г"}, {"name": "крем заварной порошковый", "measurement_unit": "г"}, {"name": "крем-фреш", "measurement_unit": "г"}, {"name": "кресс-салат", "measurement_unit": "г"}, {"name": "кровь", "measurement_unit": "мл"}, {"name": "кролик", "measurement_unit": "г"}, {"name": "кролик тушка", "measurement_unit": "г"}, {"name": "кролик филе", "measurement_unit": "г"}, {"name": "кроличья печень", "measurement_unit": "г"}, {"name": "круассаны", "measurement_unit": "шт."}, {"name": "крутоны мелкие", "measurement_unit": "г"}, {"name": "крыжовник", "measurement_unit": "г"}, {"name": "крыжовниковое варенье", "measurement_unit": "г"}, {"name": "кукуруза", "measurement_unit": "г"}, {"name": "кукуруза замороженная", "measurement_unit": "г"}, {"name": "кукуруза консервированная", "measurement_unit": "г"}, {"name": "кукуруза обжаренная кикос", "measurement_unit": "г"}, {"name": "кукурузная крупа", "measurement_unit": "г"}, {"name": "кукурузная мука", "measurement_unit": "г"}, {"name": "кукурузное масло", "measurement_unit": "г"}, {"name": "кукурузные лепешки", "measurement_unit": "шт."}, {"name": "кукурузные палочки", "measurement_unit": "г"}, {"name": "кукурузные хлопья", "measurement_unit": "г"}, {"name": "кукурузные хлопья глазированные", "measurement_unit": "г"}, {"name": "кукурузные чипсы", "measurement_unit": "г"}, {"name": "кукурузный (золотой) сироп", "measurement_unit": "мл"}, {"name": "кукурузный крахмал", "measurement_unit": "г"}, {"name": "кумин", "measurement_unit": "г"}, {"name": "кумкваты", "measurement_unit": "г"}, {"name": "кунжут", "measurement_unit": "г"}, {"name": "кунжутная мука", "measurement_unit": "г"}, {"name": "кунжутная паста", "measurement_unit": "г"}, {"name": "кунжутное масло", "measurement_unit": "г"}, {"name": "кунжутные семечки", "measurement_unit": "г"}, {"name": "кунжут черный", "measurement_unit": "г"}, {"name": "купаты", "measurement_unit": "шт."}, {"name": "курага", "measurement_unit": "г"}, {"name": "курдючное сало", "measurement_unit": "г"}, {"name": "курдючный жир", "measurement_unit": "г"}, {"name": "куриная ветчина", "measurement_unit": "г"}, {"name": "куриная кожа", "measurement_unit": "г"}, {"name": "куриная печень", "measurement_unit": "г"}, {"name": "куриное карпаччо", "measurement_unit": "г"}, {"name": "куриное филе", "measurement_unit": "г"}, {"name": "куриные бедра", "measurement_unit": "г"}, {"name": "куриные голени", "measurement_unit": "г"}, {"name": "куриные голени копченые", "measurement_unit": "шт."}, {"name": "куриные грудки", "measurement_unit": "г"}, {"name": "куриные грудки вареные", "measurement_unit": "г"}, {"name": "куриные грудки копченые", "measurement_unit": "г"}, {"name": "куриные желудочки", "measurement_unit": "г"}, {"name": "куриные кости", "measurement_unit": "г"}, {"name": "куриные крылья", "measurement_unit": "г"}, {"name": "куриные окорочка", "measurement_unit": "г"}, {"name": "куриные окорочка копченые", "measurement_unit": "г"}, {"name": "куриные потрошки", "measurement_unit": "г"}, {"name": "куриные сердечки", "measurement_unit": "г"}, {"name": "куриный бульон", "measurement_unit": "мл"}, {"name": "куриный паштет", "measurement_unit": "г"}, {"name": "куриный суповой набор", "measurement_unit": "г"}, {"name": "куриный фарш", "measurement_unit": "г"}, {"name": "курица", "measurement_unit": "г"}, {"name": "курица вареная", "measurement_unit": "г"}, {"name": "курица для жарки", "measurement_unit": "г"}, {"name": "курица копченая", "measurement_unit": "г"}, {"name": "курица тушка", "measurement_unit": "г"}, {"name": "куркума", "measurement_unit": "г"}, {"name": "куропатки", "measurement_unit": "г"}, {"name": "кускус", "measurement_unit": "г"}, {"name": "кускус жемчужный", "measurement_unit": "стакан"}, {"name": "кэроб", "measurement_unit": "г"}, {"name": "лаванда", "measurement_unit": "г"}, {"name": "лаванда сушеная", "measurement_unit": "щепотка"}, {"name": "лавандовый краситель", "measurement_unit": "ч. л."}, {"name": "лаваш", "measurement_unit": "г"}, {"name": "лаваш армянский", "measurement_unit": "г"}, {"name": "лаваш персидский круглый", "measurement_unit": "г"}, {"name": "лаваш тонкий", "measurement_unit": "г"}, {"name": "лавровые листья свежие", "measurement_unit": "шт."}, {"name": "лавровый лист", "measurement_unit": "г"}, {"name": "лайм", "measurement_unit": "г"}, {"name": "лайм листья", "measurement_unit": "шт."}, {"name": "лаймовая цедра", "measurement_unit": "г"}, {"name": "лаймовый сок", "measurement_unit": "мл"}, {"name": "лангустины", "measurement_unit": "шт."}, {"name": "лапша", "measurement_unit": "г"}, {"name": "лапша для лагмана", "measurement_unit": "г"}, {"name": "лапша ширатаки", "measurement_unit": "г"}, {"name": "лапша яичная в гнездах", "measurement_unit": "г"}, {"name": "латук", "measurement_unit": "г"}, {"name": "легкие", "measurement_unit": "г"}, {"name": "лед", "measurement_unit": "г"}, {"name": "леди-фиш тушка", "measurement_unit": "г"}, {"name": "лемонграсс (лимонное сорго)", "measurement_unit": "г"}, {"name": "лен семена", "measurement_unit": "г"}, {"name": "лепешки", "measurement_unit": "г"}, {"name": "лепешки арабские", "measurement_unit": "шт."}, {"name": "лесные орехи", "measurement_unit": "г"}, {"name": "лечо", "measurement_unit": "г"}, {"name": "ливер", "measurement_unit": "г"}, {"name": "ликер", "measurement_unit": "мл"}, {"name": "ликер Alchermes", "measurement_unit": "мл"}, {"name": "ликер Amaretto", "measurement_unit": "мл"}, {"name": "ликер Baileys", "measurement_unit": "мл"}, {"name": "ликер Cointreau", "measurement_unit": "мл"}, {"name": "ликер кремовый", "measurement_unit": "мл"}, {"name": "ликер сливочный", "measurement_unit": "мл"}, {"name": "лимонад", "measurement_unit": "мл"}, {"name": "лимонная кислота", "measurement_unit": "мл"}, {"name": "лимонная цедра", "measurement_unit": "г"}, {"name": "лимонник стебель", "measurement_unit": "г"}, {"name": "лимонник ягоды", "measurement_unit": "г"}, {"name": "лимонные корочки засахаренные", "measurement_unit": "г"}, {"name": "лимонные цукаты", "measurement_unit": "г"}, {"name": "лимонный сок", "measurement_unit": "мл"}, {"name": "лимонный уксус", "measurement_unit": "мл"}, {"name": "лимонный экстракт", "measurement_unit": "мл"}, {"name": "лимончелло", "measurement_unit": "г"}, {"name": "лимоны", "measurement_unit": "г"}, {"name": "лингвине", "measurement_unit": "шт."}, {"name": "лисички", "measurement_unit": "г"}, {"name": "лисички сушеные", "measurement_unit": "г"}, {"name": "личи", "measurement_unit": "шт."}, {"name": "личи компот", "measurement_unit": "мл"}, {"name": "лобстер", "measurement_unit": "г"}, {"name": "лонган", "measurement_unit": "г"}, {"name": "лонгконг", "measurement_unit": "шт."}, {"name": "лососевые молоки", "measurement_unit": "г"}, {"name": "лососевый фарш", "measurement_unit": "г"}, {"name": "лосось", "measurement_unit": "г"}, {"name": "лосось горячего копчения", "measurement_unit": "г"}, {"name": "лосось копченый", "measurement_unit": "г"}, {"name": "лосось свежесоленый", "measurement_unit": "г"}, {"name": "лосось свежий", "measurement_unit": "г"}, {"name": "лосось свежий филе", "measurement_unit": "г"}, {"name": "лосось слабосоленый", "measurement_unit": "г"}, {"name": "лосось стейки", "measurement_unit": "г"}, {"name": "лосось филе", "measurement_unit": "г"}, {"name": "лосось филе на коже", "measurement_unit": "г"}, {"name": "лосось холодного копчения", "measurement_unit": "г"}, {"name": "лосятина", "measurement_unit": "г"}, {"name": "лук белый", "measurement_unit": "г"}, {"name": "лук зеленый", "measurement_unit": "г"}, {"name": "лук красный", "measurement_unit": "г"}, {"name": "лук маринованный", "measurement_unit": "г"}, {"name": "луковая шелуха", "measurement_unit": "г"}, {"name": "луковый порошок", "measurement_unit": "г"}, {"name": "лук-порей", "measurement_unit": "горсть"}, {"name": "лук-резанец", "measurement_unit": "г"}, {"name": "лук репчатый", "measurement_unit": "г"}, {"name": "лук репчатый мелкий", "measurement_unit": "г"}, {"name": "лук салатный", "measurement_unit": "г"}, {"name": "лук сушеный", "measurement_unit": "г"}, {"name": "лук-шалот", "measurement_unit": "г"}, {"name": "лук-шалот красный", "measurement_unit": "г"}, {"name": "льняная мука", "measurement_unit": "г"}, {"name": "льняное масло", "measurement_unit": "мл"}, {"name": "льняное семя", "measurement_unit": "г"}, {"name": "льняное семя молотое", "measurement_unit": "г"}, {"name": "любисток", "measurement_unit": "г"}, {"name": "маасдам", "measurement_unit": "г"}, {"name": "мадера", "measurement_unit": "г"}, {"name": "майонез", "measurement_unit": "г"}, {"name": "майонез домашний", "measurement_unit": "г"}, {"name": "майонез легкий", "measurement_unit": "г"}, {"name": "майонезный соус «Слобода» Постный", "measurement_unit": "г"}, {"name": "майонез оливковый", "measurement_unit": "г"}, {"name": "майонез «Слобода» Легкий", "measurement_unit": "г"}, {"name": "майонез «Слобода» На перепелиных яйцах", "measurement_unit": "г"}, {"name": "майонез «Слобода» Оливковый", "measurement_unit": "г"}, {"name": "майонез «Слобода» Провансаль", "measurement_unit": "г"}, {"name": "майонез «Слобода» С лимонным соком", "measurement_unit": "г"}, {"name": "майонез «Слобода» Сметанный", "measurement_unit": "г"}, {"name": "майоран", "measurement_unit": "г"}, {"name": "майоран свежий", "measurement_unit": "г"}, {"name": "майоран сушеный", "measurement_unit": "г"}, {"name": "мак", "measurement_unit": "г"}, {"name": "макаронные изделия", "measurement_unit": "г"}, {"name": "макаронные изделия мелкие", "measurement_unit": "г"}, {"name": "макароны", "measurement_unit": "г"}, {"name": "макароны-бабочки (farfalle)", "measurement_unit": "г"}, {"name": "макароны-бабочки (farfalle) мини", "measurement_unit": "г"}, {"name": "макароны баветте", "measurement_unit": "г"}, {"name": "макароны-бантики", "measurement_unit": "г"}, {"name": "макароны букатини", "measurement_unit": "г"}, {"name": "макароны джильи", "measurement_unit": "г"}, {"name": "макароны диталони", "measurement_unit": "г"}, {"name": "макароны-звездочки", "measurement_unit": "г"}, {"name": "макароны орзо", "measurement_unit": "г"}, {"name": "макароны-ракушки (conchiglie)", "measurement_unit": "г"}, {"name": "макароны-ракушки (conchiglie rigate)", "measurement_unit": "г"}, {"name": "макароны-ракушки крупные", "measurement_unit": "г"}, {"name": "макароны рисони", "measurement_unit": "г"}, {"name": "макароны-рожки (pipe rigate)", "measurement_unit": "г"}, {"name": "макароны-спиральки (fusilli)", "measurement_unit": "г"}, {"name": "макароны-ушки (orecchiette)", "measurement_unit": "г"}, {"name": "маккерончини", "measurement_unit": "г"}, {"name": "мак молотый", "measurement_unit": "г"}, {"name": "маковая масса", "measurement_unit": "г"}, {"name": "малина", "measurement_unit": "г"}, {"name": "малина замороженная", "measurement_unit": "г"}, {"name": "малина, протертая с сахаром", "measurement_unit": "г"}, {"name": "малина сушеная", "measurement_unit": "г"}, {"name": "малиновое варенье", "measurement_unit": "г"}, {"name": "малиновое желе", "measurement_unit": "г"}, {"name": "малиновое пюре", "measurement_unit": "г"}, {"name": "малиновый джем", "measurement_unit": "г"}, {"name": "малиновый крем", "measurement_unit": "г"}, {"name": "малиновый сироп", "measurement_unit": "мл"}, {"name": "малиновый соус", "measurement_unit": "г"}, {"name": "малиновый уксус", "measurement_unit": "мл"}, {"name": "малиновый чай", "measurement_unit": "г"}, {"name": "манго", "measurement_unit": "г"}, {"name": "манговый сироп", "measurement_unit": "мл"}, {"name": "манго консервированное", "measurement_unit": "г"}, {"name": "мангольд", "measurement_unit": "г"}, {"name": "мангустин", "measurement_unit": "г"}, {"name": "мандариновое пюре", "measurement_unit": "г"}, {"name": "мандариновые цукаты", "measurement_unit": "г"}, {"name": "мандариновый сок", "measurement_unit": "мл"}, {"name": "мандарины", "measurement_unit": "г"}, {"name": "мандарины в собственном соку", "measurement_unit": "г"}, {"name": "манная крупа", "measurement_unit": "г"}, {"name": "маракуйя", "measurement_unit": "г"}, {"name": "маргарин", "measurement_unit": "г"}, {"name": "маргарин сливочный", "measurement_unit": "г"}, {"name": "мармелад", "measurement_unit": "г"}, {"name": "мармелад бутербродный", "measurement_unit": "г"}, {"name": "марсала", "measurement_unit": "г"}, {"name": "мартини", "measurement_unit": "мл"}, {"name": "мартини красный", "measurement_unit": "мл"}, {"name": "марципан", "measurement_unit": "г"}, {"name": "марципан зеленый", "measurement_unit": "г"}, {"name": "марципан розовый", "measurement_unit": "г"}, {"name": "маршмеллоу", "measurement_unit": "г"}, {"name": "маршмеллоу крем", "measurement_unit": "г"}, {"name": "маршмеллоу мини", "measurement_unit": "г"}, {"name": "маскарпоне", "measurement_unit": "г"}, {"name": "маслины", "measurement_unit": "г"}, {"name": "маслины без косточек", "measurement_unit": "г"}, {"name": "масло авокадо", "measurement_unit": "мл"}, {"name": "масло виноградных косточек", "measurement_unit": "мл"}, {"name": "масло грецкого ореха", "measurement_unit": "мл"}, {"name": "масло для фритюра", "measurement_unit": "мл"}, {"name": "масло кедрового ореха", "measurement_unit": "мл"}, {"name": "маслята", "measurement_unit": "г"}, {"name": "мастика", "measurement_unit": "г"}, {"name": "мастика желатиновая", "measurement_unit": "г"}, {"name": "мастика шоколадная", "measurement_unit": "г"}, {"name": "матча", "measurement_unit": "г"}, {"name": "мафальдине", "measurement_unit": "г"}, {"name": "маца", "measurement_unit": "г"}, {"name": "мацони", "measurement_unit": "г"}, {"name": "маш", "measurement_unit": "г"}, {"name": "мед", "measurement_unit": "г"}, {"name": "мед акации", "measurement_unit": "г"}, {"name": "мед гречишный", "measurement_unit": "г"}, {"name": "мед жидкий", "measurement_unit": "г"}, {"name": "мед лавандовый", "measurement_unit": "г"}, {"name": "мелисса", "measurement_unit": "г"}, {"name": "меренги", "measurement_unit": "г"}, {"name": "мидии", "measurement_unit": "г"}, {"name": "мидии в раковинах", "measurement_unit": "г"}, {"name": "мидии в раковинах крупные черные", "measurement_unit": "г"}, {"name": "мидии в раковинах мелкие зеленые", "measurement_unit": "г"}, {"name": "мидии замороженные", "measurement_unit": "г"}, {"name": "мидии копченые в масле", "measurement_unit": "г"}, {"name": "микрозелень", "measurement_unit": "г"}, {"name": "миндаль", "measurement_unit": "г"}, {"name": "миндаль жареный", "measurement_unit": "г"}, {"name": "миндаль измельченный", "measurement_unit": "г"}, {"name": "миндальная масса", "measurement_unit": "г"}, {"name": "миндальная мука", "measurement_unit": "г"}, {"name": "миндальная паста", "measurement_unit": "г"}, {"name": "миндальная эссенция", "measurement_unit": "г"}, {"name": "миндальное масло", "measurement_unit": "г"}, {"name": "миндальное молоко", "measurement_unit": "мл"}, {"name": "миндальное печенье", "measurement_unit": "г"}, {"name": "миндальное пралине", "measurement_unit": "г"}, {"name": "миндальные лепестки", "measurement_unit": "г"}, {"name": "миндальный ликер", "measurement_unit": "мл"}, {"name": "миндальный сироп", "measurement_unit": "мл"}, {"name": "миндальный экстракт", "measurement_unit": "мл"}, {"name": "миндаль очищенный", "measurement_unit": "г"}, {"name": "миндаль рубленый", "measurement_unit": "г"}, {"name": "мини-кукуруза", "measurement_unit": "г"}, {"name": "минога", "measurement_unit": "г"}, {"name": "минтай", "measurement_unit": "г"}, {"name": "минтай печень", "measurement_unit": "г"}, {"name": "минтай филе", "measurement_unit": "г"}, {"name": "мисо-паста", "measurement_unit": "г"}, {"name": "мисо-суп", "measurement_unit": "мл"}, {"name": "можжевельник ягоды", "measurement_unit": "г"}, {"name": "мойва", "measurement_unit": "г"}, {"name": "моллюски", "measurement_unit": "г"}, {"name": "молоко", "measurement_unit": "мл"}, {"name": "молоко 0,5%", "measurement_unit": "мл"}, {"name": "молоко 1,5%", "measurement_unit": "мл"}, {"name": "молоко 2,5%", "measurement_unit": "мл"}, {"name": "молоко 3,2%", "measurement_unit": "мл"}, {"name": "молоко 3,6%", "measurement_unit": "мл"}, {"name": "молоко 4%", "measurement_unit": "мл"}, {"name": "молоко 6%", "measurement_unit": "мл"}, {"name": "молоко козье", "measurement_unit": "мл"}, {"name": "молоко концентрированное", "measurement_unit": "мл"}, {"name": "молоко рисовое", "measurement_unit": "мл"}, {"name": "молоко сгущенное", "measurement_unit": "г"}, {"name": "молоко сгущенное вареное", "measurement_unit": "г"}, {"name": "молоко сгущенное с какао", "measurement_unit": "г"}, {"name": "молоко сухое", "measurement_unit": "г"}, {"name": "молоко сухое обезжиренное", "measurement_unit": "г"}, {"name": "молоко топленое", "measurement_unit": "мл"}, {"name": "молочная смесь", "measurement_unit": "г"}, {"name": "молочные продукты", "measurement_unit": "г"}, {"name": "морепродукты", "measurement_unit": "г"}, {"name": "морковное пюре", "measurement_unit": "г"}, {"name": "морковь", "measurement_unit": "г"}, {"name": "морковь вареная", "measurement_unit": "г"}, {"name": "морковь крупная", "measurement_unit": "г"}, {"name": "морковь молодая", "measurement_unit": "г"}, {"name": "морковь по-корейски", "measurement_unit": "г"}, {"name": "морковь тертая", "measurement_unit": "г"}, {"name": "мороженое", "measurement_unit": "г"}, {"name": "мороженое ванильное", "measurement_unit": "г"}, {"name": "мороженое клубничное", "measurement_unit": "г"}, {"name": "мороженое лимонное", "measurement_unit": "г"}, {"name": "мороженое малиновое", "measurement_unit": "г"}, {"name": "мороженое пломбир", "measurement_unit": "г"}, {"name": "мороженое шоколадное", "measurement_unit": "г"}, {"name": "морошка", "measurement_unit": "г"}, {"name": "морские гребешки", "measurement_unit": "г"}, {"name": "морской коктейль", "measurement_unit": "г"}, {"name": "морской коктейль в масле", "measurement_unit": "г"}, {"name": "морской коктейль замороженный", "measurement_unit": "г"}, {"name": "морской черт", "measurement_unit": "г"}, {"name": "морской язык", "measurement_unit": "г"}, {"name": "морской язык филе", "measurement_unit": "г"}, {"name": "мортаделла", "measurement_unit": "г"}, {"name": "моцарелла", "measurement_unit": "г"}, {"name": "моцарелла для запекания", "measurement_unit": "г"}, {"name": "моцарелла для пиццы", "measurement_unit": "г"}, {"name": "моцарелла мини", "measurement_unit": "г"}, {"name": "моцарелла с травами", "measurement_unit": "г"}, {"name": "моцарелла шарик большой", "measurement_unit": "г"}, {"name": "мука", "measurement_unit": "г"}, {"name": "мука 1 сорт", "measurement_unit": "г"}, {"name": "мука 2 сорт", "measurement_unit": "г"}, {"name": "мука «Аладушкин»", "measurement_unit": "г"}, {"name": "мука грубого помола", "measurement_unit": "г"}, {"name": "мука для темпуры", "measurement_unit": "г"}, {"name": "мука из пророщенной пшеницы", "measurement_unit": "г"}, {"name": "мука манитоба", "measurement_unit": "г"}, {"name": "мука самоподнимающаяся", "measurement_unit": "г"}, {"name": "мука с отрубями", "measurement_unit": "г"}, {"name": "мука с семечками", "measurement_unit": "г"}, {"name": "мука хлебопекарная", "measurement_unit": "г"}, {"name": "мука цельнозерновая", "measurement_unit": "г"}, {"name": "мускат белый", "measurement_unit": "мл"}, {"name": "мускатное вино", "measurement_unit": "мл"}, {"name": "мускатный орех", "measurement_unit": "г"}, {"name": "мускатный орех молотый", "measurement_unit": "г"}, {"name": "мюсли", "measurement_unit": "г"}, {"name": "мягкий творог", "measurement_unit": "г"}, {"name": "мясной бульон", "measurement_unit": "мл"}, {"name": "мясной фарш", "measurement_unit": "г"}, {"name": "мясо", "measurement_unit": "г"}, {"name": "мясо дикого кабана", "measurement_unit": "г"}, {"name": "мясо криля", "measurement_unit": "г"}, {"name": "мясо на косточке", "measurement_unit": "г"}, {"name": "мята", "measurement_unit": "г"}, {"name": "мята сушеная", "measurement_unit": "г"}, {"name": "мятный сироп", "measurement_unit": "мл"}, {"name": "мятный шнапс", "measurement_unit": "мл"}, {"name": "нардек", "measurement_unit": "г"}, {"name": "нектарины", "measurement_unit": "г"}, {"name": "нога ягненка без кости", "measurement_unit": "г"}, {"name": "нори", "measurement_unit": "г"}, {"name": "нуга", "measurement_unit": "г"}, {"name": "нуга с орехами", "measurement_unit": "г"}, {"name": "нут", "measurement_unit": "г"}, {"name": "нутелла", "measurement_unit": "г"}, {"name": "нут консервированный", "measurement_unit": "г"}, {"name": "нутовая мука", "measurement_unit": "г"}, {"name": "облепиха", "measurement_unit": "г"}, {"name": "облепиха замороженная", "measurement_unit": "г"}, {"name": "облепиховый сироп", "measurement_unit": "мл"}, {"name": "овощи", "measurement_unit": "г"}, {"name": "овощная смесь", "measurement_unit": "г"}, {"name": "овощная смесь замороженная", "measurement_unit": "г"}, {"name": "овощная смесь замороженная для wok", "measurement_unit": "г"}, {"name": "овощная смесь по-китайски", "measurement_unit": "г"}, {"name": "овощной бульон", "measurement_unit": "мл"}, {"name": "овсяная мука", "measurement_unit": "г"}, {"name": "овсяное молоко", "measurement_unit": "мл"}, {"name": "овсяное печенье", "measurement_unit": "г"}, {"name": "овсяное толокно", "measurement_unit": "г"}, {"name": "овсяные зерна", "measurement_unit": "г"}, {"name": "овсяные отруби", "measurement_unit": "г"}, {"name": "овсяные хлопья", "measurement_unit": "г"}, {"name": "овсяные хлопья быстрого приготовления", "measurement_unit": "г"}, {"name": "огуречный рассол", "measurement_unit": "мл"}, {"name": "огурцы", "measurement_unit": "г"}, {"name": "огурцы консервированные", "measurement_unit": "г"}, {"name": "огурцы малосольные", "measurement_unit": "г"}, {"name": "огурцы маринованные", "measurement_unit": "г"}, {"name": "огурцы свежие", "measurement_unit": "г"}, {"name": "огурцы соленые", "measurement_unit": "г"}, {"name": "одуванчики", "measurement_unit": "г"}, {"name": "окорок", "measurement_unit": "г"}, {"name": "окорок варено-копченый", "measurement_unit": "г"}, {"name": "окунь", "measurement_unit": "г"}, {"name": "окунь красный филе", "measurement_unit": "г"}, {"name": "окунь морской", "measurement_unit": "г"}, {"name": "окунь морской филе", "measurement_unit": "г"}, {"name": "окунь филе", "measurement_unit": "г"}, {"name": "оленина", "measurement_unit": "г"}, {"name": "оливки", "measurement_unit": "г"}, {"name": "оливки без косточек", "measurement_unit": "г"}, {"name": "оливки зеленые", "measurement_unit": "г"}, {"name": "оливки зеленые консервированные", "measurement_unit": "банка"}, {"name": "оливки каламата", "measurement_unit": "г"}, {"name": "оливки консервированные", "measurement_unit": "г"}, {"name": "оливки, фаршированные анчоусами", "measurement_unit": "г"}, {"name": "оливки черные", "measurement_unit": "г"}, {"name": "оливковая паста", "measurement_unit": "г"}, {"name": "оливковое масло", "measurement_unit": "г"}, {"name": "оливковое масло Extra Virgin", "measurement_unit": "г"}, {"name": "опунция плоды", "measurement_unit": "г"}, {"name": "опята", "measurement_unit": "г"}, {"name": "опята замороженные", "measurement_unit": "г"}, {"name": "опята маринованные", "measurement_unit": "г"}, {"name": "орегано", "measurement_unit": "г"}, {"name": "орегано свежий", "measurement_unit": "г"}, {"name": "орегано сушеный", "measurement_unit": "г"}, {"name": "орехи", "measurement_unit": "г"}, {"name": "орехи бразильские", "measurement_unit": "г"}, {"name": "орехи макадамия", "measurement_unit": "г"}, {"name": "орехи пекан", "measurement_unit": "г"}, {"name": "орехи пинии", "measurement_unit": "г"}, {"name": "ореховая крошка", "measurement_unit": "г"}, {"name": "ореховая паста", "measurement_unit": "г"}, {"name": "ореховое масло", "measurement_unit": "мл"}, {"name": "ореховый ликер", "measurement_unit": "мл"}, {"name": "ореховый соус", "measurement_unit": "г"}, {"name": "осетр", "measurement_unit": "г"}, {"name": "осетрина холодного копчения", "measurement_unit": "г"}, {"name": "осьминог", "measurement_unit": "г"}, {"name": "осьминоги консервированные", "measurement_unit": "г"}, {"name": "осьминоги мини", "measurement_unit": "г"}, {"name": "отруби", "measurement_unit": "г"}, {"name": "ошеек", "measurement_unit": "г"}, {"name": "пагр", "measurement_unit": "г"}, {"name": "пажитник", "measurement_unit": "г"}, {"name": "пажитник семена", "measurement_unit": "г"}, {"name": "палтус", "measurement_unit": "г"}, {"name": "пальмовое масло", "measurement_unit": "мл"}, {"name": "пангасиус", "measurement_unit": "г"}, {"name": "панеттоне", "measurement_unit": "г"}, {"name": "Панифарин", "measurement_unit": "г"}, {"name": "панчетта", "measurement_unit": "г"}, {"name": "папайя", "measurement_unit": "г"}, {"name": "папайя консервированная в собственном соку", "measurement_unit": "г"}, {"name": "папоротник", "measurement_unit": "г"}, {"name": "папоротник соленый", "measurement_unit": "г"}, {"name": "паппарделле", "measurement_unit": "г"}, {"name": "паприка", "measurement_unit": "г"}, {"name": "паприка копченая", "measurement_unit": "г"}, {"name": "паприка красная", "measurement_unit": "г"}, {"name": "паприка красная молотая", "measurement_unit": "г"}, {"name": "паприка острая копченая", "measurement_unit": "г"}, {"name": "паприка сладкая", "measurement_unit": "г"}, {"name": "паприка сладкая копченая", "measurement_unit": "г"}, {"name": "паприка сладкая хлопьями", "measurement_unit": "г"}, {"name": "пармезан", "measurement_unit": "г"}, {"name": "паста", "measurement_unit": "г"}, {"name": "паста веджимайт", "measurement_unit": "г"}, {"name": "паста тахини", "measurement_unit": "г"}, {"name": "паста хариса", "measurement_unit": "г"}, {"name": "пастернак", "measurement_unit": "г"}, {"name": "пастила", "measurement_unit": "г"}, {"name": "пастила виноградная", "measurement_unit": "г"}, {"name": "патиссоны", "measurement_unit": "г"}, {"name": "патока", "measurement_unit": "г"}, {"name": "патока крахмальная", "measurement_unit": "г"}, {"name": "патока черная (меласса)", "measurement_unit": "г"}, {"name": "пахта", "measurement_unit": "г"}, {"name": "паштет", "measurement_unit": "г"}, {"name": "пекарский порошок", "measurement_unit": "г"}, {"name": "пекорино", "measurement_unit": "г"}, {"name": "пектин", "measurement_unit": "г"}, {"name": "пеленгас", "measurement_unit": "г"}, {"name": "пельмени", "measurement_unit": "г"}, {"name": "пенне", "measurement_unit": "г"}, {"name": "пенне ригате", "measurement_unit": "г"}, {"name": "пеперончино", "measurement_unit": "г"}, {"name": "пеперончино молотый", "measurement_unit": "г"}, {"name": "переводной лист для шоколада", "measurement_unit": "шт."}, {"name": "перепелки", "measurement_unit": "г"}, {"name": "перец", "measurement_unit": "г"}, {"name": "перец белый", "measurement_unit": "г"}, {"name": "перец белый горошком", "measurement_unit": "г"}, {"name": "перец белый молотый", "measurement_unit": "г"}, {"name": "перец белый свежемолотый", "measurement_unit": "ч. л."}, {"name": "перец болгарский", "measurement_unit": "г"}, {"name": "перец болгарский желтый", "measurement_unit": "г"}, {"name": "перец болгарский зеленый", "measurement_unit": "г"}, {"name": "перец болгарский красный", "measurement_unit": "г"}, {"name": "перец горошком", "measurement_unit": "г"}, {"name": "перец горошком смесь", "measurement_unit": "г"}, {"name": "перец душистый", "measurement_unit": "г"}, {"name": "перец душистый горошком", "measurement_unit": "г"}, {"name": "перец душистый молотый", "measurement_unit": "г"}, {"name": "перец испанский острый", "measurement_unit": "г"}, {"name": "перец кайенский", "measurement_unit": "г"}, {"name": "перец кайенский красный", "measurement_unit": "г"}, {"name": "перец кайенский молотый", "measurement_unit": "г"}, {"name": "перец красный", "measurement_unit": "г"}, {"name": "перец красный горошком", "measurement_unit": "г"}, {"name": "перец красный жгучий", "measurement_unit": "г"}, {"name": "перец красный молотый", "measurement_unit": "г"}, {"name": "перец красный острый", "measurement_unit": "г"}, {"name": "перец красный острый молотый", "measurement_unit": "г"}, {"name": "перец красный хлопьями", "measurement_unit": "г"}, {"name": "перец лимонный", "measurement_unit": "г"}, {"name": "перец маринованный", "measurement_unit": "г"}, {"name": "перец острый", "measurement_unit": "г"}, {"name": "перец острый зеленый", "measurement_unit": "г"}, {"name": "перец острый молотый", "measurement_unit": "г"}, {"name": "перец падрон", "measurement_unit": "г"}, {"name": "перец пеперони", "measurement_unit": "г"}, {"name": "перец пеперони красный", "measurement_unit": "г"}, {"name": "перец розовый горошком", "measurement_unit": "г"}, {"name": "перец свежемолотый смесь", "measurement_unit": "г"}, {"name": "перец сенегальский", "measurement_unit": "г"}, {"name": "перец сладкий", "measurement_unit": "г"}, {"name": "перец сладкий желтый", "measurement_unit": "г"}, {"name": "перец сладкий зеленый", "measurement_unit": "г"}, {"name": "перец сладкий красный", "measurement_unit": "г"}, {"name": "перец сладкий красный маринованный", "measurement_unit": "г"}, {"name": "перец сладкий красный молотый", "measurement_unit": "г"}, {"name": "перец сладкий оранжевый", "measurement_unit": "г"}, {"name": "перец сладкий сушеный", "measurement_unit": "г"}, {"name": "перец сычуаньский", "measurement_unit": "г"}, {"name": "перец халапеньо", "measurement_unit": "г"}, {"name": "перец халапеньо маринованный", "measurement_unit": "г"}, {"name": "перец черный", "measurement_unit": "г"}, {"name": "перец черный горошком", "measurement_unit": "г"}, {"name": "перец черный молотый", "measurement_unit": "г"}, {"name": "перец черный свежемолотый", "measurement_unit": "г"}, {"name": "перец чили", "measurement_unit": "г"}, {"name": "перец чили зеленый", "measurement_unit": "г"}, {"name": "перец чили красный", "measurement_unit": "г"}, {"name": "перец чили маринованный", "measurement_unit": "г"}, {"name": "перец чили молотый", "measurement_unit": "г"}, {"name": "перец чили сухой", "measurement_unit": "г"}, {"name": "перец чили хлопьями", "measurement_unit": "г"}, {"name": "перец ямайский", "measurement_unit": "г"}, {"name": "перловая крупа", "measurement_unit": "г"}, {"name": "перловая мука", "measurement_unit": "г"}, {"name": "персики", "measurement_unit": "г"}, {"name": "персики консервированные", "measurement_unit": "г"}, {"name": "персики сушеные", "measurement_unit": "горсть"}, {"name": "персиковое пюре", "measurement_unit": "г"}, {"name": "персиковый джем", "measurement_unit": "г"}, {"name": "персиковый мармелад", "measurement_unit": "г"}, {"name": "персиковый сироп", "measurement_unit": "мл"}, {"name": "персиковый сок", "measurement_unit": "мл"}, {"name": "перцовая паста", "measurement_unit": "г"}, {"name": "петрушка", "measurement_unit": "г"}, {"name": "петрушка зелень", "measurement_unit": "г"}, {"name": "петрушка итальянская", "measurement_unit": "г"}, {"name": "петрушка корень", "measurement_unit": "г"}, {"name": "петрушка рубленая", "measurement_unit": "г"}, {"name": "петрушка сушеная", "measurement_unit": "г"}, {"name": "печень", "measurement_unit": "г"}, {"name": "печенье", "measurement_unit": "г"}, {"name": "печенье Oreo", "measurement_unit": "г"}, {"name": "печенье Амаретти", "measurement_unit": "г"}, {"name": "печенье бисквитное", "measurement_unit": "г"}, {"name": "печенье галетное", "measurement_unit": "шт."}, {"name": "печенье «Дамские пальчики»", "measurement_unit": "г"}, {"name": "печенье песочное", "measurement_unit": "г"}, {"name": "печенье рассыпчатое", "measurement_unit": "г"}, {"name": "печенье Савоярди", "measurement_unit": "г"}, {"name": "печенье сахарное", "measurement_unit": "г"}, {"name": "печенье сладкое", "measurement_unit": "г"}, {"name": "печенье сухое", "measurement_unit": "г"}, {"name": "печенье шоколадное", "measurement_unit": "г"}, {"name": "печенье Юбилейное молочное", "measurement_unit": "г"}, {"name": "пиво", "measurement_unit": "мл"}, {"name": "пиво имбирное", "measurement_unit": "мл"}, {"name": "пиво нефильтрованное", "measurement_unit": "мл"}, {"name": "пиво светлое", "measurement_unit": "мл"}, {"name": "пиво темное", "measurement_unit": "мл"}, {"name": "пикша", "measurement_unit": "шт."}, {"name": "питы", "measurement_unit": "г"}, {"name": "повидло", "measurement_unit": "г"}, {"name": "подсолнечное масло", "measurement_unit": "мл"}, {"name": "подсолнечные семечки", "measurement_unit": "г"}, {"name": "полба", "measurement_unit": "г"}, {"name": "полба недозрелая", "measurement_unit": "г"}, {"name": "полента", "measurement_unit": "г"}, {"name": "полента быстрого приготовления", "measurement_unit": "г"}, {"name": "помело", "measurement_unit": "г"}, {"name": "помидоры", "measurement_unit": "г"}, {"name": "помидоры бурые", "measurement_unit": "г"}, {"name": "помидоры вяленые", "measurement_unit": "мл"}, {"name": "помидоры вяленые в масле", "measurement_unit": "г"}, {"name": "помидоры желтые", "measurement_unit": "г"}, {"name": "помидоры зеленые", "measurement_unit": "г"}, {"name": "помидоры консервированные", "measurement_unit": "г"}, {"name": "помидоры консервированные в собственном соку", "measurement_unit": "г"}, {"name": "помидоры консервированные в собственном соку с базиликом", "measurement_unit": "г"}, {"name": "помидоры протертые пассата", "measurement_unit": "г"}, {"name": "помидоры соленые", "measurement_unit": "г"}, {"name": "помидоры сушеные хлопьями", "measurement_unit": "г"}, {"name": "помидоры черри", "measurement_unit": "г"}, {"name": "помидоры черри желтые", "measurement_unit": "г"}, {"name": "попкорн", "measurement_unit": "г"}, {"name": "поросенок", "measurement_unit": "г"}, {"name": "портвейн", "measurement_unit": "мл"}, {"name": "портобелло", "measurement_unit": "г"}, {"name": "портулак", "measurement_unit": "г"}, {"name": "посыпка кондитерская", "measurement_unit": "г"}, {"name": "почки", "measurement_unit": "г"}, {"name": "приправа 4 перца", "measurement_unit": "г"}, {"name": "приправа 5 специй (five spice)", "measurement_unit": "ч. л."}, {"name": "приправа для баранины", "measurement_unit": "ст. л."}, {"name": "приправа для картофеля", "measurement_unit": "г"}, {"name": "приправа для курицы", "measurement_unit": "г"}, {"name": "приправа для макарон", "measurement_unit": "г"}, {"name": "приправа для маринования свинины", "measurement_unit": "г"}, {"name": "приправа для морепродуктов", "measurement_unit": "г"}, {"name": "приправа для мяса", "measurement_unit": "г"}, {"name": "приправа для паэльи", "measurement_unit": "г"}, {"name": "приправа для пиццы", "measurement_unit": "г"}, {"name": "приправа для плова", "measurement_unit": "г"}, {"name": "приправа для птицы", "measurement_unit": "г"}, {"name": "приправа для рыбы", "measurement_unit": "г"}, {"name": "приправа для салатов", "measurement_unit": "г"}, {"name": "приправа заатар", "measurement_unit": "г"}, {"name": "приправа креольская", "measurement_unit": "г"}, {"name": "приправа с сушеными грибами", "measurement_unit": "г"}, {"name": "приправы", "measurement_unit": "г"}, {"name": "прованские травы", "measurement_unit": "г"}, {"name": "проволоне", "measurement_unit": "г"}, {"name": "просекко", "measurement_unit": "мл"}, {"name": "простокваша", "measurement_unit": "мл"}, {"name": "протеин сывороточный", "measurement_unit": "г"}, {"name": "прошутто", "measurement_unit": "г"}, {"name": "пряники", "measurement_unit": "г"}, {"name": "пряничные специи", "measurement_unit": "г"}, {"name": "пряности", "measurement_unit": "г"}, {"name": "псиллиум", "measurement_unit": "г"}, {"name": "птитим", "measurement_unit": "г"}, {"name": "пудинг", "measurement_unit": "г"}, {"name": "пудинг ванильный", "measurement_unit": "г"}, {"name": "пудинг ванильный инстант", "measurement_unit": "г"}, {"name": "пудинг карамельный", "measurement_unit": "г"}, {"name": "пшеница", "measurement_unit": "г"}, {"name": "пшеничная крупа", "measurement_unit": "г"}, {"name": "пшеничная мука", "measurement_unit": "г"}, {"name": "пшеничная мука цельнозерновая", "measurement_unit": "г"}, {"name": "пшеничные зародыши", "measurement_unit": "г"}, {"name": "пшеничные отруби", "measurement_unit": "г"}, {"name": "пшеничные ростки", "measurement_unit": "г"}, {"name": "пшеничные хлопья", "measurement_unit": "г"}, {"name": "пшенные хлопья", "measurement_unit": "г"}, {"name": "пшено", "measurement_unit": "г"}, {"name": "пыльца цветочная", "measurement_unit": "г"}, {"name": "пюре", "measurement_unit": "г"}, {"name": "радиккио", "measurement_unit": "шт."}, {"name": "разрыхлитель", "measurement_unit": "г"}, {"name": "раки", "measurement_unit": "г"}, {"name": "раковые шейки", "measurement_unit": "г"}, {"name": "раковые шейки в рассоле", "measurement_unit": "г"}, {"name": "рамбутан", "measurement_unit": "г"}, {"name": "рапаны", "measurement_unit": "г"}, {"name": "рапсовое масло", "measurement_unit": "мл"}, {"name": "рассол", "measurement_unit": "мл"}, {"name": "рассол от каперсов", "measurement_unit": "мл"}, {"name": "рассол от оливок", "measurement_unit": "мл"}, {"name": "растительное масло", "measurement_unit": "мл"}, {"name": "растительное масло для жарки", "measurement_unit": "мл"}, {"name": "растительное масло нерафинированное", "measurement_unit": "мл"}, {"name": "растительное масло рафинированное", "measurement_unit": "мл"}, {"name": "растительное молоко", "measurement_unit": "мл"}, {"name": "ревень", "measurement_unit": "г"}, {"name": "реган", "measurement_unit": "веточка"}, {"name": "редис", "measurement_unit": "г"}, {"name": "редька", "measurement_unit": "г"}, {"name": "редька белая", "measurement_unit": "г"}, {"name": "редька зеленая", "measurement_unit": "г"}, {"name": "редька черная", "measurement_unit": "г"}, {"name": "репа", "measurement_unit": "г"}, {"name": "репа белая", "measurement_unit": "г"}, {"name": "ржаная закваска", "measurement_unit": "г"}, {"name": "ржаная закваска густая", "measurement_unit": "г"}, {"name": "ржаная мука", "measurement_unit": "г"}, {"name": "ржаные отруби", "measurement_unit": "г"}, {"name": "ригатони", "measurement_unit": "г"}, {"name": "рикотта", "measurement_unit": "г"}, {"name": "рикотта твердая", "measurement_unit": "г"}, {"name": "рис", "measurement_unit": "г"}, {"name": "рис арборио", "measurement_unit": "г"}, {"name": "рис басмати", "measurement_unit": "г"}, {"name": "рис бурый", "measurement_unit": "г"}, {"name": "рис бурый и дикий смесь", "measurement_unit": "г"}, {"name": "рис вареный", "measurement_unit": "г"}, {"name": "рис виола", "measurement_unit": "г"}, {"name": "рис девзира", "measurement_unit": "г"}, {"name": "рис дикий", "measurement_unit": "г"}, {"name": "рис дикий и золотистый смесь", "measurement_unit": "г"}, {"name": "рис длиннозерный", "measurement_unit": "г"}, {"name": "рис длиннозерный золотистый", "measurement_unit": "г"}, {"name": "рис для плова", "measurement_unit": "г"}, {"name": "рис для пудинга", "measurement_unit": "г"}, {"name": "рис для ризотто", "measurement_unit": "г"}, {"name": "рис для суши", "measurement_unit": "г"}, {"name": "рис жасминовый", "measurement_unit": "г"}, {"name": "рис золотистый", "measurement_unit": "г"}, {"name": "рис индика", "measurement_unit": "г"}, {"name": "рис италика", "measurement_unit": "г"}, {"name": "рис карнароли", "measurement_unit": "г"}, {"name": "рис красный", "measurement_unit": "г"}, {"name": "рис круглозерный", "measurement_unit": "г"}, {"name": "рис кубанский", "measurement_unit": "г"}, {"name": "рисовая бумага", "measurement_unit": "г"}, {"name": "рисовая лапша", "measurement_unit": "г"}, {"name": "рисовая мука", "measurement_unit": "г"}, {"name": "рисовое вино", "measurement_unit": "мл"}, {"name": "рисовые хлопья", "measurement_unit": "г"}, {"name": "рисовые шарики воздушные", "measurement_unit": "г"}, {"name": "рисовый крахмал", "measurement_unit": "г"}, {"name": "рисовый уксус", "measurement_unit": "мл"}, {"name": "рис пропаренный", "measurement_unit": "г"}, {"name": "рис пропаренный и дикий смесь", "measurement_unit": "г"}, {"name": "рис японика", "measurement_unit": "г"}, {"name": "рожь", "measurement_unit": "г"}, {"name": "розмарин", "measurement_unit": "г"}, {"name": "розмарин сушеный", "measurement_unit": "г"}, {"name": "розовая вода", "measurement_unit": "мл"}, {"name": "розовые бутоны сушеные", "measurement_unit": "г"}, {"name": "розовые лепестки", "measurement_unit": "г"}, {"name": "розы", "measurement_unit": "г"}, {"name": "рокфор", "measurement_unit": "г"}, {"name": "ром", "measurement_unit": "мл"}, {"name": "ромашка сушеная", "measurement_unit": "г"}, {"name": "ромовый экстракт", "measurement_unit": "ч. л."}, {"name": "ром темный", "measurement_unit": "мл"}, {"name": "ростбиф", "measurement_unit": "г"}, {"name": "рукола", "measurement_unit": "г"}, {"name": "рулька", "measurement_unit": "г"}, {"name": "рыба", "measurement_unit": "г"}, {"name": "рыба белая", "measurement_unit": "г"}, {"name": "рыба белая филе", "measurement_unit": "г"}, {"name": "рыба консервированная", "measurement_unit": "г"}, {"name": "рыба копченая", "measurement_unit": "г"}, {"name": "рыба копченая филе", "measurement_unit": "г"}, {"name": "рыба красная", "measurement_unit": "г"}, {"name": "рыба красная соленая", "measurement_unit": "г"}, {"name": "рыба красная филе", "measurement_unit": "г"}, {"name": "рыба-меч", "measurement_unit": "г"}, {"name": "рыба морская", "measurement_unit": "г"}, {"name": "рыба солнечник филе", "measurement_unit": "г"}, {"name": "рыба-соль", "measurement_unit": "г"}, {"name": "рыбное филе", "measurement_unit": "г"}, {"name": "рыбные консервы", "measurement_unit": "г"}, {"name": "рыбные кости", "measurement_unit": "г"}, {"name": "рыбные обрезки, головы, плавники", "measurement_unit": "г"}, {"name": "рыбный бульон", "measurement_unit": "г"}, {"name": "рыбный соус", "measurement_unit": "г"}, {"name": "рыбный соус Nam Pla", "measurement_unit": "г"}, {"name": "рыбный соус тайский", "measurement_unit": "г"}, {"name": "рыбный фарш", "measurement_unit": "г"}, {"name": "рябина черноплодная", "measurement_unit": "г"}, {"name": "рябчик", "measurement_unit": "г"}, {"name": "ряженка", "measurement_unit": "мл"}, {"name": "ряженка 4%", "measurement_unit": "мл"}, {"name": "сайда", "measurement_unit": "г"}, {"name": "сайда филе", "measurement_unit": "г"}, {"name": "сайра", "measurement_unit": "г"}, {"name": "сайра консервированная", "measurement_unit": "г"}, {"name": "саке", "measurement_unit": "мл"}, {"name": "салака", "measurement_unit": "г"}, {"name": "салат", "measurement_unit": "г"}, {"name": "салат айсберг", "measurement_unit": "г"}, {"name": "салат китайский", "measurement_unit": "г"}, {"name": "салат корн", "measurement_unit": "г"}, {"name": "салат кочанный", "measurement_unit": "г"}, {"name": "салат кучерявый", "measurement_unit": "г"}, {"name": "салат листовой", "measurement_unit": "г"}, {"name": "салатный микс", "measurement_unit": "г"}, {"name": "салат романо", "measurement_unit": "г"}, {"name": "салат фриссе", "measurement_unit": "г"}, {"name": "сало", "measurement_unit": "г"}, {"name": "сало копченое в перце", "measurement_unit": "г"}, {"name": "сало копченое с мясными прослойками", "measurement_unit": "г"}, {"name": "сало с мясными прослойками", "measurement_unit": "г"}, {"name": "сальник", "measurement_unit": "г"}, {"name": "сальса", "measurement_unit": "г"}, {"name": "сальса верде", "measurement_unit": "ч. л."}, {"name": "салями", "measurement_unit": "г"}, {"name": "салями итальянская", "measurement_unit": "г"}, {"name": "сардельки", "measurement_unit": "г"}, {"name": "сардельки копченые", "measurement_unit": "г"}, {"name": "сардинки маленькие", "measurement_unit": "г"}, {"name": "сардины", "measurement_unit": "г"}, {"name": "сардины в масле", "measurement_unit": "г"}, {"name": "сахар", "measurement_unit": "г"}, {"name": "сахар ванильный", "measurement_unit": "г"}, {"name": "сахар демерара", "measurement_unit": "г"}, {"name": "сахар жемчужный", "measurement_unit": "г"}, {"name": "сахар коричневый", "measurement_unit": "г"}, {"name": "сахар коричневый крупнокристаллический", "measurement_unit": "г"}, {"name": "сахар мусковадо", "measurement_unit": "г"}, {"name": "сахарная пудра", "measurement_unit": "г"}, {"name": "сахарная пудра апельсиновая", "measurement_unit": "г"}, {"name": "сахарная пудра ванильная", "measurement_unit": "г"}, {"name": "сахарные жемчужинки", "measurement_unit": "г"}, {"name": "сахарные кондитерские украшения", "measurement_unit": "г"}, {"name": "сахарный песок", "measurement_unit": "г"}, {"name": "сахарный песок крупный", "measurement_unit": "г"}, {"name": "сахарный песок мелкий", "measurement_unit": "г"}, {"name": "сахарный сироп", "measurement_unit": "г"}, {"name": "сахар пальмовый", "measurement_unit": "г"}, {"name": "сахар-рафинад", "measurement_unit": "г"}, {"name": "сахар-рафинад с корицей", "measurement_unit": "г"}, {"name": "сахар тростниковый", "measurement_unit": "г"}, {"name": "сванская соль", "measurement_unit": "г"}, {"name": "свекла", "measurement_unit": "г"}, {"name": "свекла вареная", "measurement_unit": "г"}, {"name": "свекольная ботва", "measurement_unit": "г"}, {"name": "свекольные листья", "measurement_unit": "г"}, {"name": "свиная вырезка", "measurement_unit": "г"}, {"name": "свиная голова", "measurement_unit": "г"}, {"name": "свиная грудинка", "measurement_unit": "г"}, {"name": "свиная корейка", "measurement_unit": "г"}, {"name": "свиная корейка копченая", "measurement_unit": "г"}, {"name": "свиная корейка на кости", "measurement_unit": "г"}, {"name": "свиная лопатка варено-копченая", "measurement_unit": "г"}, {"name": "свиная мякоть", "measurement_unit": "г"}, {"name": "свиная пашина", "measurement_unit": "г"}, {"name": "свиная печень", "measurement_unit": "г"}, {"name": "свиная рулька", "measurement_unit": "г"}, {"name": "свиная рулька варено-копченая", "measurement_unit": "г"}, {"name": "свиная рулька копченая", "measurement_unit": "г"}, {"name": "свиная шейка", "measurement_unit": "кусок"}, {"name": "свинина", "measurement_unit": "г"}, {"name": "свинина вареная", "measurement_unit": "г"}, {"name": "свинина нежирная", "measurement_unit": "г"}, {"name": "свинина с жирком", "measurement_unit": "г"}, {"name": "свиное сердце", "measurement_unit": "г"}, {"name": "свиное филе", "measurement_unit": "г"}, {"name": "свиной подчеревок", "measurement_unit": "г"}, {"name": "свиной фарш", "measurement_unit": "г"}, {"name": "свиной язык", "measurement_unit": "г"}, {"name": "свиные котлеты на косточке", "measurement_unit": "шт."}, {"name": "свиные легкие", "measurement_unit": "г"}, {"name": "свиные ножки", "measurement_unit": "г"}, {"name": "свиные отбивные", "measurement_unit": "г"}, {"name": "свиные отбивные на косточке", "measurement_unit": "г"}, {"name": "свиные ребра", "measurement_unit": "г"}, {"name": "свиные уши", "measurement_unit": "шт."}, {"name": "свиные щечки", "measurement_unit": "шт."}, {"name": "свити", "measurement_unit": "г"}, {"name": "сельдерей", "measurement_unit": "г"}, {"name": "сельдерей зелень", "measurement_unit": "г"}, {"name": "сельдерей корень", "measurement_unit": "г"}, {"name": "сельдерей корень сушеный", "measurement_unit": "г"}, {"name": "сельдерейная соль", "measurement_unit": "г"}, {"name": "сельдерей семена", "measurement_unit": "г"}, {"name": "сельдерей стебли", "measurement_unit": "г"}, {"name": "сельдь", "measurement_unit": "г"}, {"name": "сельдь слабосоленая", "measurement_unit": "г"}, {"name": "сельдь соленая", "measurement_unit": "шт."}, {"name": "сельдь филе", "measurement_unit": "г"}, {"name": "семга", "measurement_unit": "г"}, {"name": "семга копченая", "measurement_unit": "г"}, {"name": "семга свежая", "measurement_unit": "г"}, {"name": "семга соленая", "measurement_unit": "г"}, {"name": "семга филе на коже", "measurement_unit": "г"}, {"name": "семечки", "measurement_unit": "г"}, {"name": "семечки смесь", "measurement_unit": "г"}, {"name": "семолина", "measurement_unit": "г"}, {"name": "сервелат варено-копченый", "measurement_unit": "г"}, {"name": "сибас", "measurement_unit": "г"}, {"name": "сидр", "measurement_unit": "мл"}, {"name": "сироп", "measurement_unit": "мл"}, {"name": "сироп от консервированных груш", "measurement_unit": "мл"}, {"name": "сироп от консервированных персиков", "measurement_unit": "мл"}, {"name": "сироп топинамбура", "measurement_unit": "мл"}, {"name": "скумбрия", "measurement_unit": "г"}, {"name": "скумбрия свежая", "measurement_unit": "г"}, {"name": "скумбрия филе", "measurement_unit": "г"}, {"name": "скумбрия холодного копчения", "measurement_unit": "г"}, {"name": "сливки", "measurement_unit": "мл"}, {"name": "сливки 10-20%", "measurement_unit": "мл"}, {"name": "сливки 15%", "measurement_unit": "мл"}, {"name": "сливки 20%", "measurement_unit": "мл"}, {"name": "сливки 33-35%", "measurement_unit": "мл"}, {"name": "сливки жирные", "measurement_unit": "мл"}, {"name": "сливки кондитерские", "measurement_unit": "мл"}, {"name": "сливовая паста", "measurement_unit": "г"}, {"name": "сливовое варенье", "measurement_unit": "г"}, {"name": "сливовое вино", "measurement_unit": "мл"}, {"name": "сливовый джем", "measurement_unit": "г"}, {"name": "сливовый ликер", "measurement_unit": "мл"}, {"name": "сливовый соус", "measurement_unit": "г"}, {"name": "сливочное масло", "measurement_unit": "г"}, {"name": "сливы", "measurement_unit": "г"}, {"name": "сливы замороженные", "measurement_unit": "г"}, {"name": "смалец", "measurement_unit": "г"}, {"name": "смесь для кекса", "measurement_unit": "г"}, {"name": "смесь для оладий", "measurement_unit": "г"}, {"name": "смесь для хлеба 8 злаков", "measurement_unit": "г"}, {"name": "сметана", "measurement_unit": "г"}, {"name": "сметана 10%", "measurement_unit": "г"}, {"name": "сметана 15%", "measurement_unit": "г"}, {"name": "сметана 18%", "measurement_unit": "г"}, {"name": "сметана 20%", "measurement_unit": "г"}, {"name": "сметана 25%", "measurement_unit": "г"}, {"name": "сметана 30%", "measurement_unit": "г"}, {"name": "сметана 35%", "measurement_unit": "г"}, {"name": "сметана жирная", "measurement_unit": "г"}, {"name": "сметана нежирная", "measurement_unit": "г"}, {"name": "сметана некислая", "measurement_unit": "г"}, {"name": "смородина сушеная", "measurement_unit": "г"}, {"name": "смородиновые листья", "measurement_unit": "г"}, {"name": "сморчки сухие", "measurement_unit": "г"}, {"name": "снежок", "measurement_unit": "мл"}, {"name": "сныть", "measurement_unit": "г"}, {"name": "сода", "measurement_unit": "г"}, {"name": "соевая мука", "measurement_unit": "г"}, {"name": "соевое масло", "measurement_unit": "г"}, {"name": "соевое молоко", "measurement_unit": "мл"}, {"name": "соевые ростки", "measurement_unit": "г"}, {"name": "соевый соус", "measurement_unit": "г"}, {"name": "сок", "measurement_unit": "мл"}, {"name": "сок из красных апельсинов", "measurement_unit": "мл"}, {"name": "сок мультивитаминный", "measurement_unit": "мл"}, {"name": "сок юзу", "measurement_unit": "мл"}, {"name": "солод", "measurement_unit": "г"}, {"name": "солод жидкий", "measurement_unit": "мл"}, {"name": "солодовый экстракт", "measurement_unit": "г"}, {"name": "солод темный", "measurement_unit": "г"}, {"name": "соломка", "measurement_unit": "г"}, {"name": "соль", "measurement_unit": "г"}, {"name": "соль гималайская", "measurement_unit": "г"}, {"name": "соль крупного помола", "measurement_unit": "г"}, {"name": "соль морская", "measurement_unit": "г"}, {"name": "сом филе", "measurement_unit": "г"}, {"name": "сосиски", "measurement_unit": "г"}, {"name": "сосиски из куриного фарша", "measurement_unit": "г"}, {"name": "сосиски копченые", "measurement_unit": "г"}, {"name": "соус", "measurement_unit": "г"}, {"name": "соус black bean", "measurement_unit": "г"}, {"name": "соус sambal oelek", "measurement_unit": "г"}, {"name": "соус барбекю", "measurement_unit": "г"}, {"name": "соус краснодарский", "measurement_unit": "г"}, {"name": "соус красный острый", "measurement_unit": "г"}, {"name": "соус мирин", "measurement_unit": "г"}, {"name": "соус наршараб", "measurement_unit": "г"}, {"name": "соус острый", "measurement_unit": "г"}, {"name": "соус песто", "measurement_unit": "г"}, {"name": "соус сацебели", "measurement_unit": "г"}, {"name": "соус табаско", "measurement_unit": "капля"}, {"name": "соус терияки", "measurement_unit": "г"}, {"name": "соус ткемали", "measurement_unit": "г"}, {"name": "соус ткемали благородный", "measurement_unit": "г"}, {"name": "соус ткемали ранний", "measurement_unit": "г"}, {"name": "соус устричный", "measurement_unit": "г"}, {"name": "соус чили", "measurement_unit": "г"}, {"name": "соус чили сладкий", "measurement_unit": "г"}, {"name": "соус экзотический", "measurement_unit": "г"}, {"name": "соя", "measurement_unit": "г"}, {"name": "спагетти", "measurement_unit": "г"}, {"name": "спагетти № 3", "measurement_unit": "г"}, {"name": "спагетти № 5", "measurement_unit": "г"}, {"name": "спагетти лунги", "measurement_unit": "г"}, {"name": "спаржа", "measurement_unit": "г"}, {"name": "спаржа белая", "measurement_unit": "г"}, {"name": "спаржа зеленая", "measurement_unit": "г"}, {"name": "спаржа молодая", "measurement_unit": "г"}, {"name": "спек", "measurement_unit": "г"}, {"name": "спельта", "measurement_unit": "г"}, {"name": "спельтовая (полбяная) мука", "measurement_unit": "г"}, {"name": "специи", "measurement_unit": "г"}, {"name": "спирт", "measurement_unit": "мл"}, {"name": "спирулина порошок", "measurement_unit": "г"}, {"name": "спред", "measurement_unit": "г"}, {"name": "ставрида", "measurement_unit": "г"}, {"name": "стейк семги", "measurement_unit": "г"}, {"name": "стеклянная лапша", "measurement_unit": "г"}, {"name": "страчателла", "measurement_unit": "г"}, {"name": "судак", "measurement_unit": "г"}, {"name": "судак филе", "measurement_unit": "г"}, {"name": "судак филе на коже", "measurement_unit": "г"}, {"name": "сулугуни", "measurement_unit": "г"}, {"name": "сулугуни копченый", "measurement_unit": "г"}, {"name": "сумах", "measurement_unit": "г"}, {"name": "суповой набор", "measurement_unit": "г"}, {"name": "сухари", "measurement_unit": "г"}, {"name": "сухари белые", "measurement_unit": "г"}, {"name": "сухари молотые", "measurement_unit": "г"}, {"name": "сухари панировочные", "measurement_unit": "г"}, {"name": "сухари ржаные", "measurement_unit": "г"}, {"name": "сухарная крошка", "measurement_unit": "г"}, {"name": "сухофрукты", "measurement_unit": "г"}, {"name": "сухофрукты тропические", "measurement_unit": "г"}, {"name": "сушки", "measurement_unit": "г"}, {"name": "сыворотка", "measurement_unit": "г"}, {"name": "сыр", "measurement_unit": "г"}, {"name": "сыр tete de moine", "measurement_unit": "г"}, {"name": "сыр Австрия блю", "measurement_unit": "г"}, {"name": "сыр адыгейский", "measurement_unit": "г"}, {"name": "сыр бри", "measurement_unit": "г"}, {"name": "сыр буко", "measurement_unit": "г"}, {"name": "сыр гауда", "measurement_unit": "г"}, {"name": "сыр гойя", "measurement_unit": "г"}, {"name": "сыр голландский", "measurement_unit": "г"}, {"name": "сыр голубой", "measurement_unit": "г"}, {"name": "сыр гравьера", "measurement_unit": "г"}, {"name": "сыр джугас", "measurement_unit": "г"}, {"name": "сыр домашний", "measurement_unit": "г"}, {"name": "сыр дорблю", "measurement_unit": "г"}, {"name": "сыр имеретинский", "measurement_unit": "г"}, {"name": "сыр кефалотири", "measurement_unit": "г"}, {"name": "сырки творожные", "measurement_unit": "г"}, {"name": "сыр козий мягкий", "measurement_unit": "г"}, {"name": "сыр козий твердый", "measurement_unit": "г"}, {"name": "сыр колбасный", "measurement_unit": "г"}, {"name": "сыр копченый", "measurement_unit": "г"}, {"name": "сыр коттедж", "measurement_unit": "г"}, {"name": "сыр Маскарпоне", "measurement_unit": "г"}, {"name": "сыр мраморный", "measurement_unit": "г"}, {"name": "сыр мягкий", "measurement_unit": "г"}, {"name": "сыр овечий", "measurement_unit": "г"}, {"name": "сыр панир", "measurement_unit": "г"}, {"name": "сыр пеше миньон", "measurement_unit": "г"}, {"name": "сыр плавленый", "measurement_unit": "г"}, {"name": "сыр плавленый шоколадный", "measurement_unit": "г"}, {"name": "сыр пластинками", "measurement_unit": "г"}, {"name": "сыр полутвердый", "measurement_unit": "г"}, {"name": "сыр провола", "measurement_unit": "г"}, {"name": "сыр российский", "measurement_unit": "г"}, {"name": "сыр скаморца", "measurement_unit": "г"}, {"name": "сыр скаморца копченый", "measurement_unit": "г"}, {"name": "сыр сливочный", "measurement_unit": "г"}, {"name": "сыр с плесенью", "measurement_unit": "г"}, {"name": "сыр с плесенью мягкий", "measurement_unit": "г"}, {"name": "сыр твердый", "measurement_unit": "г"}, {"name": "сыр филадельфия", "measurement_unit": "г"}, {"name": "сыр фонтина", "measurement_unit": "г"}, {"name": "сыр хаварти", "measurement_unit": "г"}, {"name": "сыр швейцарский", "measurement_unit": "г"}, {"name": "сычужный фермент", "measurement_unit": "ч. л."}, {"name": "таледжо", "measurement_unit": "г"}, {"name": "тальолини", "measurement_unit": "г"}, {"name": "тальятелле", "measurement_unit": "г"}, {"name": "тальятелле-гнезда", "measurement_unit": "г"}, {"name": "тамаринд", "measurement_unit": "г"}, {"name": "тамариндовая паста", "measurement_unit": "г"}, {"name": "тапиока", "measurement_unit": "г"}, {"name": "тарталетки", "measurement_unit": "г"}, {"name": "тартар", "measurement_unit": "г"}, {"name": "тархун", "measurement_unit": "г"}, {"name": "творог", "measurement_unit": "г"}, {"name": "творог 18%", "measurement_unit": "г"}, {"name": "творог 2%", "measurement_unit": "г"}, {"name": "творог 5%", "measurement_unit": "г"}, {"name": "творог 9%", "measurement_unit": "г"}, {"name": "творог жирный", "measurement_unit": "г"}, {"name": "творог зерненый", "measurement_unit": "г"}, {"name": "творог обезжиренный", "measurement_unit": "г"}, {"name": "творожная масса", "measurement_unit": "г"}, {"name": "творожная паста", "measurement_unit": "г"}, {"name": "творожный сыр", "measurement_unit": "г"}, {"name": "творожный сыр соленый", "measurement_unit": "г"}, {"name": "творожок клубничный", "measurement_unit": "г"}, {"name": "текила", "measurement_unit": "мл"}, {"name": "телятина", "measurement_unit": "г"}, {"name": "телятина вареная", "measurement_unit": "г"}, {"name": "телячий фарш", "measurement_unit": "г"}, {"name": "телячьи отбивные на косточке", "measurement_unit": "шт."}, {"name": "телячьи шницели", "measurement_unit": "г"}, {"name": "телячьи эскалопы", "measurement_unit": "г"}, {"name": "телячья вырезка", "measurement_unit": "г"}, {"name": "телячья печень", "measurement_unit": "г"}, {"name": "телячья щека", "measurement_unit": "г"}, {"name": "тесто бездрожжевое", "measurement_unit": "г"}, {"name": "тесто готовое", "measurement_unit": "г"}, {"name": "тесто для вонтонов", "measurement_unit": "г"}, {"name": "тесто для пиццы", "measurement_unit": "г"}, {"name": "тесто дрожжевое", "measurement_unit": "г"}, {"name": "тесто катаифи", "measurement_unit": "г"}, {"name": "тесто макаронное", "measurement_unit": "г"}, {"name": "тесто макаронное для лазаньи", "measurement_unit": "г"}, {"name": "тесто пельменное", "measurement_unit": "г"}, {"name": "тесто песочное", "measurement_unit": "г"}, {"name": "тесто пресное", "measurement_unit": "г"}, {"name": "тесто пряничное", "measurement_unit": "г"}, {"name": "тесто слоеное", "measurement_unit": "г"}, {"name": "тесто слоеное бездрожжевое", "measurement_unit": "г"}, {"name": "тесто слоеное дрожжевое", "measurement_unit": "г"}, {"name": "тесто фило", "measurement_unit": "г"}, {"name": "тилапия", "measurement_unit": "г"}, {"name": "тилапия филе", "measurement_unit": "г"}, {"name": "тильзитер", "measurement_unit": "г"}, {"name": "тимьян", "measurement_unit": "г"}, {"name": "тимьян лимонный", "measurement_unit": "г"}, {"name": "тимьян свежий", "measurement_unit": "г"}, {"name": "тимьян сушеный", "measurement_unit": "г"}, {"name": "ткемали", "measurement_unit": "г"}, {"name": "тмин", "measurement_unit": "г"}, {"name": "тмин молотый", "measurement_unit": "г"}, {"name": "томатная паста", "measurement_unit": "г"}, {"name": "томатное пюре", "measurement_unit": "г"}, {"name": "томатный концентрат", "measurement_unit": "г"}, {"name": "томатный порошок", "measurement_unit": "г"}, {"name": "томатный сок", "measurement_unit": "мл"}, {"name": "томатный соус", "measurement_unit": "г"}, {"name": "томатный соус итальянский", "measurement_unit": "г"}, {"name": "томатный соус острый", "measurement_unit": "г"}, {"name": "томатный соус с базиликом", "measurement_unit": "г"}, {"name": "тоник", "measurement_unit": "мл"}, {"name": "топинамбур", "measurement_unit": "г"}, {"name": "топленое масло", "measurement_unit": "г"}, {"name": "тортильи", "measurement_unit": "шт."}, {"name": "тортильони", "measurement_unit": "г"}, {"name": "тофу", "measurement_unit": "г"}, {"name": "травы ароматные", "measurement_unit": "г"}, {"name": "травы пряные с перцем", "measurement_unit": "г"}, {"name": "травы сухие", "measurement_unit": "г"}, {"name": "треска", "measurement_unit": "г"}, {"name": "треска печень", "measurement_unit": "г"}, {"name": "треска филе", "measurement_unit": "г"}, {"name": "трюфель", "measurement_unit": "г"}, {"name": "трюфельная крошка", "measurement_unit": "г"}, {"name": "трюфельное масло", "measurement_unit": "г"}, {"name": "трюфель черный", "measurement_unit": "г"}, {"name": "тунец", "measurement_unit": "г"}, {"name": "тунец консервированный", "measurement_unit": "г"}, {"name": "тунец филе", "measurement_unit": "г"}, {"name": "тушенка", "measurement_unit": "г"}, {"name": "тыква", "measurement_unit": "г"}, {"name": "тыквенное масло", "measurement_unit": "г"}, {"name": "тыквенное пюре", "measurement_unit": "г"}, {"name": "тыквенные семечки", "measurement_unit": "г"}, {"name": "тюлька свежая", "measurement_unit": "г"}, {"name": "угорь", "measurement_unit": "г"}, {"name": "угорь копченый", "measurement_unit": "г"}, {"name": "угурт", "measurement_unit": "г"}, {"name": "укроп", "measurement_unit": "г"}, {"name": "укропное семя", "measurement_unit": "г"}, {"name": "укроп свежий", "measurement_unit": "г"}, {"name": "укроп сушеный", "measurement_unit": "г"}, {"name": "уксус", "measurement_unit": "мл"}, {"name": "уксус 9%", "measurement_unit": "мл"}, {"name": "уксус из сидра", "measurement_unit": "мл"}, {"name": "уксусная эссенция", "measurement_unit": "мл"}, {"name": "уксус столовый", "measurement_unit": "мл"}, {"name": "улитки", "measurement_unit": "г"}, {"name": "улитки виноградные", "measurement_unit": "г"}, {"name": "урюк", "measurement_unit": "г"}, {"name": "устрицы", "measurement_unit": "г"}, {"name": "утиная грудка", "measurement_unit": "г"}, {"name": "утиная печень", "measurement_unit": "г"}, {"name": "утиное филе", "measurement_unit": "г"}, {"name": "утиные бедрышки", "measurement_unit": "г"}, {"name": "утиные ножки", "measurement_unit": "г"}, {"name": "утка", "measurement_unit": "г"}, {"name": "утка печеная", "measurement_unit": "г"}, {"name": "утка тушка", "measurement_unit": "г"}, {"name": "уцхо-сунели", "measurement_unit": "г"}, {"name": "фазан", "measurement_unit": "г"}, {"name": "фарш (баранина и говядина)", "measurement_unit": "г"}, {"name": "фарш (свинина и курица)", "measurement_unit": "г"}, {"name": "фасоль", "measurement_unit": "г"}, {"name": "фасоль белая", "measurement_unit": "г"}, {"name": "фасоль белая консервированная", "measurement_unit": "г"}, {"name": "фасоль белая лима", "measurement_unit": "г"}, {"name": "фасоль зеленая стручковая", "measurement_unit": "г"}, {"name": "фасоль кенийская", "measurement_unit": "г"}, {"name": "фасоль кидни красная", "measurement_unit": "г"}, {"name": "фасоль консервированная", "measurement_unit": "г"}, {"name": "фасоль красная", "measurement_unit": "г"}, {"name": "фасоль красная вареная", "measurement_unit": "г"}, {"name": "фасоль красная консервированная", "measurement_unit": "г"}, {"name": "фасоль молодая замороженная", "measurement_unit": "г"}, {"name": "фасоль пинто", "measurement_unit": "г"}, {"name": "фасоль спаржевая вареная", "measurement_unit": "г"}, {"name": "фасоль стручковая", "measurement_unit": "г"}, {"name": "фасоль стручковая замороженная", "measurement_unit": "г"}, {"name": "фасоль стручковая консервированная", "measurement_unit": "г"}, {"name": "фасоль черный глаз", "measurement_unit": "г"}, {"name": "фейхоа", "measurement_unit": "г"}, {"name": "фенхель", "measurement_unit": "г"}, {"name": "фенхель семена", "measurement_unit": "г"}, {"name": "фенхель семена молотые", "measurement_unit": "г"}, {"name": "фестонате", "measurement_unit": "г"}, {"name": "фета", "measurement_unit": "г"}, {"name": "фетаки", "measurement_unit": "г"}, {"name": "фетакса", "measurement_unit": "г"}, {"name": "феттучине", "measurement_unit": "г"}, {"name": "фиалки засахаренные", "measurement_unit": "г"}, {"name": "фиалковый сироп", "measurement_unit": "мл"}, {"name": "физалис", "measurement_unit": "г"}, {"name": "филе красного окуня", "measurement_unit": "г"}, {"name": "филе лосося", "measurement_unit": "г"}, {"name": "филе палтуса", "measurement_unit": "г"}, {"name": "финики", "measurement_unit": "г"}, {"name": "финики без косточек", "measurement_unit": "г"}, {"name": "финики иранские", "measurement_unit": "г"}, {"name": "финики иранские без косточек", "measurement_unit": "г"}, {"name": "фисташки", "measurement_unit": "г"}, {"name": "фисташки очищенные", "measurement_unit": "г"}, {"name": "фисташки очищенные несоленые", "measurement_unit": "г"}, {"name": "фисташки рубленые", "measurement_unit": "г"}, {"name": "фисташковая мука", "measurement_unit": "г"}, {"name": "фисташковая паста", "measurement_unit": "г"}, {"name": "фисташковое масло", "measurement_unit": "г"}, {"name": "фокачча", "measurement_unit": "г"}, {"name": "форель", "measurement_unit": "г"}, {"name": "форель вареная", "measurement_unit": "г"}, {"name": "форель горячего копчения", "measurement_unit": "г"}, {"name": "форель озерная свежая", "measurement_unit": "г"}, {"name": "форель слабосоленая", "measurement_unit": "г"}, {"name": "форель стейки", "measurement_unit": "г"}, {"name": "форель филе", "measurement_unit": "г"}, {"name": "форель холодного копчения", "measurement_unit": "г"}, {"name": "фрикадельки", "measurement_unit": "г"}, {"name": "фрукт дракона", "measurement_unit": "г"}, {"name": "фруктовый сироп", "measurement_unit": "мл"}, {"name": "фруктовый сок", "measurement_unit": "мл"}, {"name": "фруктовый сок без сахара", "measurement_unit": "мл"}, {"name": "фруктоза", "measurement_unit": "г"}, {"name": "фрукты", "measurement_unit": "г"}, {"name": "фрукты консервированные", "measurement_unit": "г"}, {"name": "фундук", "measurement_unit": "г"}, {"name": "фундучная мука", "measurement_unit": "г"}, {"name": "фунчоза", "measurement_unit": "г"}, {"name": "халва", "measurement_unit": "г"}, {"name": "халва ванильная", "measurement_unit": "г"}, {"name": "халва подсолнечная", "measurement_unit": "г"}, {"name": "халуми", "measurement_unit": "г"}, {"name": "хамон", "measurement_unit": "г"}, {"name": "хек", "measurement_unit": "г"}, {"name": "хек филе", "measurement_unit": "г"}, {"name": "херес", "measurement_unit": "мл"}, {"name": "хересный уксус", "measurement_unit": "мл"}, {"name": "хлеб", "measurement_unit": "г"}, {"name": "хлеб 7 злаков", "measurement_unit": "батон"}, {"name": "хлеб белый", "measurement_unit": "г"}, {"name": "хлеб белый сухой", "measurement_unit": "г"}, {"name": "хлеб бородинский", "measurement_unit": "г"}, {"name": "хлеб датский ржаной", "measurement_unit": "г"}, {"name": "хлеб для сэндвичей", "measurement_unit": "г"}, {"name": "хлебная крошка", "measurement_unit": "г"}, {"name": "хлеб ржаной", "measurement_unit": "г"}, {"name": "хлеб серый", "measurement_unit": "г"}, {"name": "хлеб с кунжутом", "measurement_unit": "г"}, {"name": "хлеб цельнозерновой", "measurement_unit": "г"}, {"name": "хлебцы пшенично-ржаные цельнозерновые", "measurement_unit": "г"}, {"name": "хлопья 4 злака", "measurement_unit": "г"}, {"name": "хлопья 5 злаков", "measurement_unit": "г"}, {"name": "хлопья 7 злаков", "measurement_unit": "ст. л."}, {"name": "хлопья быстрого приготовления", "measurement_unit": "г"}, {"name": "хлорид кальция", "measurement_unit": "г"}, {"name": "хмели-сунели", "measurement_unit": "г"}, {"name": "хмель", "measurement_unit": "г"}, {"name": "хрен", "measurement_unit": "г"}, {"name": "хрен протертый", "measurement_unit": "г"}, {"name": "хрен со сливками", "measurement_unit": "г"}, {"name": "хурма", "measurement_unit": "г"}, {"name": "хурма спелая", "measurement_unit": "г"}, {"name": "цесарка тушка", "measurement_unit": "г"}, {"name": "цикорий", "measurement_unit": "г"}, {"name": "цитроновые цукаты", "measurement_unit": "г"}, {"name": "цитрусовые цукаты", "measurement_unit": "г"}, {"name": "цитрусовый свежевыжатый сок", "measurement_unit": "мл"}, {"name": "цукаты", "measurement_unit": "г"}, {"name": "цукини", "measurement_unit": "г"}, {"name": "цукини цветы", "measurement_unit": "г"}, {"name": "цыплята", "measurement_unit": "г"}, {"name": "цыплята-корнишоны", "measurement_unit": "шт."}, {"name": "чабер", "measurement_unit": "г"}, {"name": "чабрец", "measurement_unit": "г"}, {"name": "чабрец сушеный", "measurement_unit": "г"}, {"name": "чай дарджилинг", "measurement_unit": "г"}, {"name": "чай жасминовый", "measurement_unit": "г"}, {"name": "чай зеленый", "measurement_unit": "г"}, {"name": "чай копченый лапсанг сушонг", "measurement_unit": "г"}, {"name": "чай красный", "measurement_unit": "г"}, {"name": "чай ройбуш", "measurement_unit": "г"}, {"name": "чай черный", "measurement_unit": "г"}, {"name": "чай черный крупнолистовой", "measurement_unit": "г"}, {"name": "чай черный со специями", "measurement_unit": "г"}, {"name": "чай эрл грей", "measurement_unit": "г"}, {"name": "чатни манго", "measurement_unit": "г"}, {"name": "чеддер", "measurement_unit": "г"}, {"name": "черемуха", "measurement_unit": "г"}, {"name": "черемуховая мука", "measurement_unit": "г"}, {"name": "черемша", "measurement_unit": "г"}, {"name": "черешневый джем", "measurement_unit": "г"}, {"name": "черешня", "measurement_unit": "г"}, {"name": "черешня консервированная без косточек", "measurement_unit": "г"}, {"name": "черная смородина", "measurement_unit": "г"}, {"name": "черника", "measurement_unit": "г"}, {"name": "черника замороженная", "measurement_unit": "г"}, {"name": "чернила каракатицы", "measurement_unit": "г"}, {"name": "черничный джем", "measurement_unit": "г"}, {"name": "чернослив", "measurement_unit": "г"}, {"name": "чернослив без косточек", "measurement_unit": "г"}, {"name": "чернослив вяленый", "measurement_unit": "г"}, {"name": "чернослив копченый без косточек", "measurement_unit": "г"}, {"name": "черносмородиновое варенье", "measurement_unit": "г"}, {"name": "черносмородиновый джем", "measurement_unit": "г"}, {"name": "чеснок", "measurement_unit": "г"}, {"name": "чеснок молодой", "measurement_unit": "г"}, {"name": "чеснок сушеный", "measurement_unit": "г"}, {"name": "чесночная соль", "measurement_unit": "г"}, {"name": "чесночное масло", "measurement_unit": "мл"}, {"name": "чесночный порошок", "measurement_unit": "г"}, {"name": "чечевица", "measurement_unit": "г"}, {"name": "чечевица вареная", "measurement_unit": "г"}, {"name": "чечевица зеленая", "measurement_unit": "г"}, {"name": "чечевица красная", "measurement_unit": "г"}, {"name": "чечил спагетти", "measurement_unit": "г"}, {"name": "чиабатта", "measurement_unit": "г"}, {"name": "чиа семена", "measurement_unit": "г"}, {"name": "чипотле молотый", "measurement_unit": "г"}, {"name": "чипсы", "measurement_unit": "г"}, {"name": "чоризо", "measurement_unit": "г"}, {"name": "шалфей", "measurement_unit": "г"}, {"name": "шалфей свежий", "measurement_unit": "г"}, {"name": "шалфей сушеный", "measurement_unit": "г"}, {"name": "шампанское", "measurement_unit": "г"}, {"name": "шампанское советское", "measurement_unit": "мл"}, {"name": "шампанское сухое", "measurement_unit": "мл"}, {"name": "шампиньоны", "measurement_unit": "г"}, {"name": "шампиньоны замороженные", "measurement_unit": "г"}, {"name": "шампиньоны консервированные", "measurement_unit": "г"}, {"name": "шампиньоны маринованные", "measurement_unit": "г"}, {"name": "шампиньоны свежие", "measurement_unit": "г"}, {"name": "шафран", "measurement_unit": "г"}, {"name": "шафран имеретинский", "measurement_unit": "г"}, {"name": "шафран молотый", "measurement_unit": "ч. л."}, {"name": "шафран нити", "measurement_unit": "шт."}, {"name": "шелковица", "measurement_unit": "г"}, {"name": "шелковица сушеная", "measurement_unit": "г"}, {"name": "шиповник", "measurement_unit": "г"}, {"name": "шиповниковый сироп", "measurement_unit": "мл"}, {"name": "шнапс", "measurement_unit": "мл"}, {"name": "шнитт-лук", "measurement_unit": "г"}, {"name": "шоколад", "measurement_unit": "г"}, {"name": "шоколад белый", "measurement_unit": "г"}, {"name": "шоколад горький с апельсиновой цедрой", "measurement_unit": "г"}, {"name": "шоколад молочный", "measurement_unit": "г"}, {"name": "шоколад мятный", "measurement_unit": "г"}, {"name": "шоколадная паста", "measurement_unit": "г"}, {"name": "шоколадная стружка", "measurement_unit": "г"}, {"name": "шоколадное масло", "measurement_unit": "г"}, {"name": "шоколадно-ореховая паста", "measurement_unit": "г"}, {"name": "шоколадные горошины", "measurement_unit": "г"}, {"name": "шоколадные капли", "measurement_unit": "г"}, {"name": "шоколадные капли белые", "measurement_unit": "г"}, {"name": "шоколадные конфеты", "measurement_unit": "г"}, {"name": "шоколадные хлопья", "measurement_unit": "г"}, {"name": "шоколадные шарики из готовых завтраков", "measurement_unit": "г"}, {"name": "шоколадный ликер", "measurement_unit": "мл"}, {"name": "шоколадный сироп", "measurement_unit": "мл"}, {"name": "шоколадный соус", "measurement_unit": "г"}, {"name": "шоколад полусладкий", "measurement_unit": "г"}, {"name": "шоколад с орехами", "measurement_unit": "г"}, {"name": "шоколад черный горький", "measurement_unit": "г"}, {"name": "шоколад черный горький 70%", "measurement_unit": "г"}, {"name": "шоколад черный горький 75%", "measurement_unit": "ч. л."}, {"name": "шоколад черный горький 85%", "measurement_unit": "г"}, {"name": "шортенинг", "measurement_unit": "г"}, {"name": "шпик", "measurement_unit": "г"}, {"name": "шпик копченый", "measurement_unit": "г"}, {"name": "шпинат", "measurement_unit": "г"}, {"name": "шпинат замороженный", "measurement_unit": "г"}, {"name": "шпинат молодой", "measurement_unit": "г"}, {"name": "шпинат свежий", "measurement_unit": "г"}, {"name": "шпроты", "measurement_unit": "г"}, {"name": "шпроты в масле", "measurement_unit": "г"}, {"name": "шрот", "measurement_unit": "г"}, {"name": "щавель замороженный", "measurement_unit": "г"}, {"name": "щавель свежий", "measurement_unit": "г"}, {"name": "щука", "measurement_unit": "г"}, {"name": "щука филе", "measurement_unit": "г"}, {"name": "эгг-ног", "measurement_unit": "г"}, {"name": "эдам", "measurement_unit": "г"}, {"name": "эль", "measurement_unit": "мл"}, {"name": "эмменталь", "measurement_unit": "г"}, {"name": "эскалоп", "measurement_unit": "г"}, {"name": "эстрагон", "measurement_unit": "г"}, {"name": "эстрагон сушеный", "measurement_unit": "г"}, {"name": "яблоки", "measurement_unit": "г"}, {"name": "яблоки антоновка", "measurement_unit": "г"}, {"name": "яблоки гала", "measurement_unit": "г"}, {"name": "яблоки голден", "measurement_unit": "г"}, {"name": "яблоки гренни смит", "measurement_unit": "г"}, {"name": "яблоки зеленые", "measurement_unit": "г"}, {"name": "яблоки красные", "measurement_unit": "г"}, {"name": "яблоки моченые", "measurement_unit": "г"}, {"name": "яблоки нетвердых сортов", "measurement_unit": "г"}, {"name": "яблоки сладкие", "measurement_unit": "г"}, {"name": "яблоки сушеные", "measurement_unit": "г"}, {"name": "яблочная эссенция", "measurement_unit": "г"}, {"name": "яблочное варенье", "measurement_unit": "г"}, {"name": "яблочное повидло", "measurement_unit": "г"}, {"name": "яблочное пюре", "measurement_unit": "г"}, {"name": "яблочные чипсы", "measurement_unit": "г"}, {"name": "яблочный джем", "measurement_unit": "г"}, {"name": "яблочный сироп", "measurement_unit": "мл"}, {"name": "яблочный сок", "measurement_unit": "мл"}, {"name": "яблочный соус", "measurement_unit": "г"}, {"name": "яблочный уксус", "measurement_unit": "мл"}, {"name": "ягнятина", "measurement_unit": "г"}, {"name": "ягнятина кострец", "measurement_unit": "г"}, {"name": "ягнятина фарш", "measurement_unit": "г"}, {"name": "ягнячьи отбивные на косточке", "measurement_unit": "г"}, {"name": "ягнячья голень нарубленная", "measurement_unit": "г"}, {"name": "ягнячья корейка", "measurement_unit": "г"}, {"name": "ягодное варенье", "measurement_unit": "г"}, {"name": "ягодное желе", "measurement_unit": "г"}, {"name": "ягодный сироп", "measurement_unit": "мл"}, {"name": "ягодный сок", "measurement_unit": "мл"}, {"name": "ягодный соус кислый", "measurement_unit": "г"}, {"name": "ягоды", "measurement_unit": "г"}, {"name": "ягоды вяленые", "measurement_unit": "г"}, {"name": "ягоды замороженные", "measurement_unit": "г"}, {"name": "ягоды лесные", "measurement_unit": "г"}, {"name": "ягоды лесные замороженные", "measurement_unit": "г"}, {"name": "яичные белки", "measurement_unit": "г"}, {"name": "яичные желтки", "measurement_unit": "г"}, {"name": "яичные желтки вареные", "measurement_unit": "шт."}, {"name": "яичные желтки крупные", "measurement_unit": "г"}, {"name": "яичный меланж", "measurement_unit": "г"}, {"name": "яичный порошок", "measurement_unit": "г"}, {"name": "яйца куриные", "measurement_unit": "г"}, {"name": "яйца куриные крупные", "measurement_unit": "г"}, {"name": "яйца перепелиные", "measurement_unit": "г"}, {"name": "японская крошка панко", "measurement_unit": "г"}, {"name": "ячменные хлопья", "measurement_unit": "г"}, {"name": "ячмень", "measurement_unit": "г"}, {"name": "ячневая крупа", "measurement_unit": "г"}]
-
-# Функция для преобразования данных
-def convert_to_django_format(data):
-    return [
-        {
-            "model": "recipes.Ingredient",  # Замените на актуальное имя вашей модели
-            "pk": i + 1,  # Предполагается, что pk начинается с 1
-            "fields": {
-                "name": item["name"],
-                "measurement_unit": item["measurement_unit"]
-            }
-        }
-        for i, item in enumerate(data)
-    ]
-
-# Преобразование исходных данных
-django_formatted_data = convert_to_django_format(original_data)
-
-# Сохранение результата в новый JSON-файл с использованием UTF-8 кодировки
-with open("formatted_data.json", "w", encoding="utf-8") as file:
-    json.dump(django_formatted_data, file, ensure_ascii=False, indent=4)
-
-print("Данные успешно преобразованы и сохранены в formatted_data.json с использованием UTF-8 кодировки.")
\ No newline at end of file